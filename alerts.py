@@ -0,0 +1,219 @@
+# alerts.py - Streaming alert rules evaluated on every sample
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+import storage
+
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "900"))  # Seconds before a resolved alert may fire again
+LEVELS = ('warning', 'critical')
+LEVEL_ICONS = {'warning': "⚠️", 'critical': "🔴"}
+
+
+class Window:
+    """Running mean of the samples from the last `seconds`; each sample costs O(1) amortized."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()
+        self.total = 0.0
+
+    def add(self, now, value):
+        self.samples.append((now, value))
+        self.total += value
+        cutoff = now - self.seconds
+        while self.samples[0][0] <= cutoff:
+            self.total -= self.samples.popleft()[1]
+        return self.total / len(self.samples)
+
+
+class Rule:
+    """
+    Levels for one metric, e.g. thresholds={'warning': 70, 'critical': 80}. The value compared
+    is the mean over the last `window` seconds (0 = the sample itself); a level is entered once
+    the value has been at or above its threshold for `cycles` samples in a row and is left only
+    when the value drops `hysteresis` below the threshold.
+    """
+
+    def __init__(self, metric, thresholds, label=None, unit="%", window=0, cycles=1, hysteresis=0.0,
+                 cooldown=ALERT_COOLDOWN):
+        self.metric = metric
+        self.thresholds = dict(thresholds)
+        self.label = label or metric
+        self.unit = unit
+        self.window = window
+        self.cycles = cycles
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+
+    def level_for(self, value, current=0):
+        """Highest level the value holds, letting the current one go only past the hysteresis band."""
+        level = 0
+        for i, name in enumerate(LEVELS, 1):
+            threshold = self.thresholds.get(name)
+            if threshold is None:
+                continue
+            if value >= threshold or (i <= current and value > threshold - self.hysteresis):
+                level = i
+        return level
+
+    def describe(self):
+        if self.window >= 60:
+            return f"{self.label} ({self.window / 60:g} min avg)"
+        if self.cycles > 1:
+            return f"{self.label} ({self.cycles} cycles)"
+        return self.label
+
+
+class AlertEvent:
+    """A level change of one rule for one subject (a host, or None for the Pi itself)."""
+
+    def __init__(self, rule, subject, kind, level, value):
+        self.metric = rule.metric
+        self.subject = subject
+        self.kind = kind  # fire (level went up) | ease (critical -> warning) | resolve
+        self.level = level  # 'warning', 'critical' or None once resolved
+        self.value = value
+        self.threshold = rule.thresholds.get(level) if level else None
+        self.at = time.time()
+        name = rule.describe() + (f" {subject}" if subject else "")
+        if kind == 'resolve':
+            self.message = f"✅ RESOLVED: {name} {value:.1f}{rule.unit}"
+        else:
+            self.message = (f"{LEVEL_ICONS[level]} {level.upper()}: {name} {value:.1f}{rule.unit} "
+                            f"(Threshold: {self.threshold:g}{rule.unit})")
+
+
+class RuleState:
+    def __init__(self, rule):
+        self.window = Window(rule.window) if rule.window else None
+        self.level = 0
+        self.streak = 0
+        self.value = None
+        self.fired_at = None
+
+
+class AlertEngine:
+    """
+    Evaluates rules as samples arrive and pushes each transition to the subscribers on a
+    dispatcher thread, so a slow notifier never holds up the sampler. An alert fires once
+    per episode and is not repeated while active.
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self._states = {}  # (metric, subject) -> RuleState
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+        self.fired = 0
+        self.resolved = 0
+        self.suppressed = 0
+
+    def add(self, rule):
+        with self._lock:
+            self.rules[rule.metric] = rule
+            for key in [key for key in self._states if key[0] == rule.metric]:
+                del self._states[key]
+        return self
+
+    def set_threshold(self, metric, level, value):
+        """Moves one level of a rule; active alerts are re-evaluated on their next sample."""
+        with self._lock:
+            rule = self.rules.get(metric)
+            if rule is None or level not in LEVELS:
+                return False
+            rule.thresholds[level] = value
+        return True
+
+    def subscribe(self, notify):
+        """Calls notify(event) for every transition from now on."""
+        with self._lock:
+            if notify in self._subscribers:
+                return
+            self._subscribers.append(notify)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="alert-dispatch", daemon=True)
+                self._dispatcher.start()
+
+    def observe(self, metric, value, subject=None, now=None):
+        """Feeds one sample. Returns the AlertEvent it caused, or None."""
+        rule = self.rules.get(metric)
+        if rule is None or value is None:
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get((metric, subject))
+            if state is None:
+                state = self._states[(metric, subject)] = RuleState(rule)
+            value = state.window.add(now, value) if state.window else value
+            state.value = value
+            level = rule.level_for(value, state.level)
+            if level > state.level:
+                state.streak += 1
+                if state.streak < rule.cycles:
+                    return None
+                if state.level == 0 and state.fired_at is not None and now - state.fired_at < rule.cooldown:
+                    self.suppressed += 1
+                    return None
+                state.fired_at = now
+                self.fired += 1
+                kind = 'fire'
+            else:
+                state.streak = 0
+                if level == state.level:
+                    return None
+                kind = 'ease' if level else 'resolve'
+                if not level:
+                    self.resolved += 1
+            state.level = level
+            event = AlertEvent(rule, subject, kind, LEVELS[level - 1] if level else None, value)
+        if kind == 'fire':
+            (logging.critical if event.level == 'critical' else logging.warning)(event.message)
+        else:
+            logging.info(event.message)
+        if self._subscribers:
+            self._events.put(event)
+        return event
+
+    def observe_many(self, values, subject=None, now=None):
+        """Feeds every metric in values that has a rule. Returns the events caused."""
+        events = (self.observe(metric, values.get(metric), subject, now) for metric in list(self.rules))
+        return [event for event in events if event]
+
+    def active(self):
+        """(metric, subject, level, current value) of every alert that is firing."""
+        with self._lock:
+            return [(metric, subject, LEVELS[state.level - 1], state.value)
+                    for (metric, subject), state in self._states.items() if state.level]
+
+    def stats(self):
+        return {'rules': len(self.rules), 'active': len(self.active()), 'fired': self.fired,
+                'resolved': self.resolved, 'suppressed': self.suppressed, 'pending': self._events.qsize()}
+
+    def _dispatch(self):
+        while True:
+            event = self._events.get()
+            for notify in list(self._subscribers):
+                try:
+                    notify(event)
+                except Exception as e:
+                    logging.error(f"Alert notification failed: {e}")
+
+
+#   Process-wide engine; system_monitor and module1 add their rules to it
+engine = AlertEngine()
+
+
+def keep_history():
+    """Records every transition of the shared engine in the alerts table. Called once by the bot at startup."""
+    if storage.record_alert in engine._subscribers:
+        return
+    #   Alerts left open by a previous run end here; any still breaching fire again on the next samples
+    storage.get_writer().execute(lambda conn: conn.execute(
+        "UPDATE alerts SET resolved_at = ? WHERE resolved_at IS NULL", (int(time.time()),)))
+    engine.subscribe(storage.record_alert)
@@ -0,0 +1,297 @@
+# benchmarks.py - Performance checks for the monitoring stack
+# Usage: python benchmarks.py [name ...]   (runs every benchmark when no name is given)
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import threading
+import subprocess
+
+
+def _udp_echo_server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            data, addr = sock.recvfrom(1024)
+            sock.sendto(data, addr)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock.getsockname()[1]
+
+
+def _probe_rate(probe_engine, hosts, per_host, rounds, **kwargs):
+    """
+    Median probes/s over the rounds where every reply came back. A round that lost a reply
+    spent most of its time waiting out the timeout, so it is counted apart instead of timed.
+    """
+    rates, lossy, lost = [], 0, 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        results = probe_engine.run_probes(hosts, count=per_host, interval=0, timeout=1.0, **kwargs)
+        elapsed = time.perf_counter() - started
+        sent = per_host * len(hosts)
+        missing = sent - sum(r.received for r in results.values())
+        if missing:
+            lossy += 1
+            lost += missing
+        else:
+            rates.append(sent / elapsed)
+    rates.sort()
+    median = f"{rates[len(rates) // 2]:,.0f} probes/s" if rates else "no lossless round"
+    return f"{median} (median of {len(rates)} rounds); {lossy} round(s) with {lost} lost replies excluded"
+
+
+def bench_probes(total=400, rounds=7):
+    """Probes per second: in-process engine vs forking ping per probe."""
+    import probe_engine
+
+    port = _udp_echo_server()
+    hosts = {f"target{i}": "127.0.0.1" for i in range(8)}
+    per_host = total // len(hosts)
+    print(f"native udp: {_probe_rate(probe_engine, hosts, per_host, rounds, method='udp', port=port)}")
+    if probe_engine.icmp_available():
+        print(f"native icmp: {_probe_rate(probe_engine, hosts, per_host, rounds, method='icmp')}")
+
+    # The old path forks one process per ping run; time single-probe runs
+    ping = shutil.which("ping")
+    command = [ping, "-c", "1", "127.0.0.1"] if ping else ["true"]
+    runs = 50
+    started = time.perf_counter()
+    for _ in range(runs):
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - started
+    label = "subprocess ping" if ping else "subprocess spawn only (ping not installed)"
+    print(f"{label}: {runs / elapsed:,.0f} probes/s")
+
+
+def bench_collectors(rounds=200):
+    """Average cost per sample of each procfs/sysfs collector, next to the psutil calls they replace."""
+    import psutil
+    import system_monitor
+
+    collectors = system_monitor.default_collectors()
+    for collector in collectors:
+        for i in range(rounds):
+            collector.sample(now=float(i))
+    for collector in collectors:
+        print(f"{collector.name:>8}: {collector.cost()['avg_us']:8.1f} us/sample")
+
+    for label, call in [("psutil cpu_percent", lambda: psutil.cpu_percent(interval=None)),
+                        ("psutil virtual_memory", psutil.virtual_memory),
+                        ("psutil disk_usage", lambda: psutil.disk_usage('/'))]:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            call()
+        print(f"{label:>22}: {(time.perf_counter() - started) / rounds * 1e6:8.1f} us/call")
+    if shutil.which("vcgencmd"):
+        started = time.perf_counter()
+        for _ in range(20):
+            subprocess.run(["vcgencmd", "measure_temp"], stdout=subprocess.DEVNULL)
+        print(f"{'vcgencmd measure_temp':>22}: {(time.perf_counter() - started) / 20 * 1e6:8.1f} us/call")
+
+
+def synthetic_network_frame(days=30, step=180, seed=1):
+    """Three hosts every `step` seconds, logged a few seconds apart like the old serial pings."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2024-01-01").value // 10**9
+    cycles = np.arange(base, base + days * 86400, step)
+    frames = []
+    for offset, host in enumerate(['Google DNS', 'Cloudflare DNS', 'Local Gateway']):
+        up = rng.random(len(cycles)) > 0.05
+        frames.append(pd.DataFrame({
+            'timestamp': pd.to_datetime(cycles + offset * 10, unit='s'),
+            'host': host,
+            'latency': np.where(up, rng.uniform(5, 50, len(cycles)), np.nan),
+            'jitter': np.where(up, rng.uniform(0, 5, len(cycles)), np.nan),
+            'packet_loss': np.where(up, 0.0, np.nan),
+            'status': np.where(up, 'UP', 'DOWN'),
+        }))
+    return pd.concat(frames).sort_values('timestamp', ignore_index=True)
+
+
+def _legacy_classify_downtime(df):
+    df_pivot = df.pivot(index='timestamp', columns='host', values='status').fillna('DOWN')
+    no_electricity = df_pivot.apply(lambda row: all(row[h] == 'DOWN' for h in ['Google DNS', 'Cloudflare DNS', 'Local Gateway']), axis=1)
+    no_internet = df_pivot.apply(lambda row: (row['Google DNS'] == 'DOWN' and row['Cloudflare DNS'] == 'DOWN') and row['Local Gateway'] == 'UP', axis=1)
+    return no_electricity.sum(), no_internet.sum(), df_pivot.shape[0]
+
+
+def bench_downtime(days=30):
+    """classify_downtime and per-host splitting on a synthetic 30-day dataset, old vs new."""
+    import report_generator
+
+    df = synthetic_network_frame(days)
+    print(f"{len(df):,} rows over {days} days")
+
+    started = time.perf_counter()
+    legacy = _legacy_classify_downtime(df)
+    legacy_time = time.perf_counter() - started
+    started = time.perf_counter()
+    current = report_generator.classify_downtime(df)
+    current_time = time.perf_counter() - started
+    print(f"row-wise pivot/apply: {legacy_time * 1000:8.1f} ms  -> no electricity {legacy[0]}/{legacy[2]} rows")
+    print(f"bucketed vectorized:  {current_time * 1000:8.1f} ms  -> no electricity {current[0]}/{current[2]} buckets")
+
+    started = time.perf_counter()
+    for _ in range(5):  # summary page + 3 metric pages + availability each re-filtered
+        for host in df['host'].unique():
+            df[df['host'] == host]
+    masks = time.perf_counter() - started
+    started = time.perf_counter()
+    report_generator.split_by_host(df)
+    grouped = time.perf_counter() - started
+    print(f"per-page host masks:  {masks * 1000:8.1f} ms, one groupby: {grouped * 1000:8.1f} ms")
+
+
+def bench_render(days=7):
+    """Report rendering time per page, serial in-process vs split across worker processes."""
+    import os
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    import report_generator
+
+    df_net = synthetic_network_frame(days, step=600)
+    times = pd.date_range(df_net['timestamp'].iloc[0], df_net['timestamp'].iloc[-1], freq="600s")
+    df_sys = pd.DataFrame({'timestamp': times, 'cpu_usage': np.random.default_rng(1).uniform(5, 95, len(times)),
+                           'ram_usage': 40.0, 'storage_usage': 30.0, 'temperature': 55.0})
+    start, end = times[0].to_pydatetime(), times[-1].to_pydatetime()
+    workers = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, count in [("serial", 1)] + ([(f"{workers} workers", workers)] if workers > 1 else []):
+            if count > 1 and report_generator.PdfWriter is None:
+                print("parallel: skipped, pypdf not installed")
+                continue
+            started = time.perf_counter()
+            timings = report_generator.render_report(df_net, df_sys, start, end, os.path.join(tmp, f"{count}.pdf"), workers=count)
+            total = time.perf_counter() - started
+            print(f"{label:>10}: {total:6.2f} s  " + " ".join(f"{name}={seconds:.2f}" for name, seconds in timings))
+
+
+def bench_alert_history(sizes=(10_000, 100_000, 500_000), rounds=50):
+    """Alert history page latency (first page, a page deep in the history, one metric) as the table grows."""
+    import os
+    import random
+    import sqlite3
+    import tempfile
+    import storage
+    import system_monitor
+
+    metrics = ['cpu_temp', 'ram_usage', 'storage_usage', 'packet_loss']
+    rng = random.Random(1)
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "alerts.db")
+        conn = sqlite3.connect(path)
+        storage.create_schema(conn)
+        storage.set_db_path(path)
+        written = 0
+        for size in sizes:
+            # Spread over the past year, so "last_30_days" still covers a tenth of it
+            rows = [(now - rng.randrange(365 * 86400), rng.choice(metrics), None, 'warning', 75.0, 70.0, now)
+                    for _ in range(size - written)]
+            conn.executemany("INSERT INTO alerts (ts, metric, subject, severity, value, threshold, resolved_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+            written = size
+            deep = system_monitor.get_alert_history("last_30_days", limit=1, before=(now - 20 * 86400, 2 ** 62))[1]
+            for label, kwargs in [("first page", {}), ("20 days back", {'before': deep}),
+                                  ("one metric", {'metric': 'ram_usage'})]:
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    system_monitor.get_alert_history("last_30_days", **kwargs)
+                elapsed = (time.perf_counter() - started) / rounds
+                print(f"{size:>9,} rows, {label:>12}: {elapsed * 1000:6.2f} ms/page")
+        conn.close()
+        storage.close()
+
+
+def _forks():
+    """Processes forked system-wide since boot, from /proc/stat."""
+    with open("/proc/stat") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("processes "))
+
+
+def bench_commands(rounds=20):
+    """Expert Mode latency and forks per command: in-process fast path vs running the binary."""
+    import expert_mode
+
+    commands = ["uptime", "free -h", "df -h", "whoami", "uname -a", "date", "hostname", "ps aux", "lsblk"]
+    for command in commands:
+        argv = command.split()
+        if shutil.which(argv[0]) is None:
+            print(f"{command:>9}: not installed, skipped")
+            continue
+        timings = []
+        for fast_paths in (False, True):
+            forks = _forks()
+            started = time.perf_counter()
+            for _ in range(rounds):
+                result = expert_mode.run_command(argv, fast_paths=fast_paths)
+            elapsed = (time.perf_counter() - started) / rounds
+            timings.append((elapsed, (_forks() - forks) / rounds, result.fast_path))
+        (before, before_forks, _), (after, after_forks, fast) = timings
+        note = "" if fast else "  (no fast path, ran the binary)"
+        print(f"{command:>9}: subprocess {before * 1000:6.2f} ms, {before_forks:.1f} forks | "
+              f"in-process {after * 1000:6.2f} ms, {after_forks:.1f} forks{note}")
+
+
+def bench_metrics(rounds=2000):
+    """Exporter scrape latency: rendering from memory, and a full HTTP scrape over loopback."""
+    import urllib.request
+    import metrics_exporter
+    import system_monitor
+
+    registry = metrics_exporter.Registry()
+    snapshot = {key: 42.0 for key in system_monitor.EXPORTED_METRICS}
+    hosts = {f"host{i}": (12.0, 1.5, 0.0) for i in range(10)}
+    jobs = {name: {'runs': 100, 'failures': 0, 'missed': 1, 'last_lag': 0.01, 'max_lag': 0.2, 'running': False}
+            for name in ('system', 'network', 'public_ip', 'retention', 'daily_report')}
+    registry.add_stats('job', lambda: jobs, label='job')
+    registry.set_many(snapshot, system_monitor.EXPORTED_METRICS)
+    for name, (latency, jitter, loss) in hosts.items():
+        registry.set('host_latency_milliseconds', latency, host=name)
+        registry.set('host_jitter_milliseconds', jitter, host=name)
+        registry.set('host_packet_loss_percent', loss, host=name)
+    started = time.perf_counter()
+    for i in range(rounds):
+        #   The sampler pushes every second, so a scrape usually rebuilds the changed families
+        registry.set('cpu_usage_percent', float(i % 100))
+        body = registry.render()
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f"render: {elapsed * 1e6:.1f} us/scrape, {len(body)} bytes, {len(body.splitlines())} lines")
+
+    server = metrics_exporter.MetricsServer(registry, host="127.0.0.1", port=0).start()
+    url = f"http://127.0.0.1:{server.server_port}/metrics"
+    timings = []
+    for _ in range(200):
+        started = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            response.read()
+        timings.append(time.perf_counter() - started)
+    server.shutdown()
+    server.server_close()
+    timings.sort()
+    print(f"http scrape: median {timings[len(timings) // 2] * 1000:.2f} ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms")
+
+
+BENCHMARKS = {
+    'probes': bench_probes,
+    'collectors': bench_collectors,
+    'downtime': bench_downtime,
+    'render': bench_render,
+    'alert_history': bench_alert_history,
+    'commands': bench_commands,
+    'metrics': bench_metrics,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
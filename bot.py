@@ -12,10 +12,17 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from system_monitor import get_system_status, get_stored_alerts, get_private_ip, get_public_ip
+from system_monitor import get_system_status, get_active_alerts, get_alert_history, get_private_ip, get_public_ip
 from module1 import get_network_status
-from command_filter import is_safe_command, SAFE_COMMANDS
-from report_generator import generate_report, purge_old_reports
+from command_filter import parse_command, SAFE_COMMANDS
+from scheduler import collector_scheduler
+from report_queue import ReportQueue
+from delivery import Delivery
+from alerts import engine as alert_engine, keep_history
+import public_ip
+import netlink_watcher
+import expert_mode
+import metrics_exporter
 
 # --- Load and Setup ---
 load_dotenv()
@@ -23,13 +30,46 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN is missing in the .env file!")
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
+bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML", threaded=False)  # setup() adds the worker pool
 ALLOWED_CHAT_ID = {123456789,123456789,123456789} # Enter telegram chat id here
 UPTIME_ALERT_THRESHOLD = 95
-
-logging.basicConfig(level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("bot_debug.log"), logging.StreamHandler(sys.stdout)])
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "webhook" receives updates through webhook.py
+DAILY_REPORT_CHECK = 900  # seconds between checks for a new day
+
+# --- Report stack ---
+# report_generator pulls in pandas and matplotlib; load it on the first report
+# so a restarted bot answers /start without paying for it
+def generate_report(*args, **kwargs):
+    from report_generator import generate_report
+    return generate_report(*args, **kwargs)
+
+def purge_old_reports():
+    from report_generator import purge_old_reports
+    return purge_old_reports()
+
+# Pages of recent Expert Mode output, for the next/previous buttons
+command_pages = expert_mode.PageStore()
+
+# Built by setup(), not at import: report render workers start from a forkserver, which
+# re-imports this script as __mp_main__ and must not get a second log, scheduler or queue
+delivery = None
+scheduler = None
+report_queue = None
+
+def setup():
+    """Logging, delivery, the collector scheduler and the report queue for this process."""
+    global delivery, scheduler, report_queue
+    logging.basicConfig(level=logging.DEBUG,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler("bot_debug.log"), logging.StreamHandler(sys.stdout)])
+    if BOT_MODE != "webhook":
+        # Polling hands updates to telebot's worker pool; webhook.py brings its own
+        bot.threaded = True
+        bot.worker_pool = telebot.util.ThreadPool(bot)
+    delivery = Delivery(bot)
+    scheduler = collector_scheduler()
+    # Renders run on the queue's worker, off the polling thread; identical requests share one job
+    report_queue = ReportQueue(render=generate_report)
 
 # --- Access Control ---
 def is_allowed_user(entity):
@@ -62,11 +102,33 @@ def handle_callbacks(call):
     elif data == "ip_config": show_ip_config(call.message)
     elif data == "report_menu": show_report_menu(call.message)
     elif data == "alerts": show_alerts(call.message)
+    elif data.startswith("alert_history:"): show_alert_history(call.message, data)
     elif data.startswith("report_"): generate_and_send_report(call.message, data)
     elif data == "r2_utilities_menu": show_utilities_menu(call.message)
     elif data == "r2_reboot": reboot_pi(call.message)
     elif data == "r2_ping_camera": ping_camera(call.message)
     elif data == "expert_mode_shell": expert_mode_shell_handler(call)
+    elif data.startswith("expert_page:"): show_command_page(call.message, data)
+
+@bot.message_handler(commands=['queue'])
+def show_report_queue(message):
+    if not is_allowed_user(message):
+        return bot.send_message(message.chat.id, "Access Denied.")
+    stats = report_queue.stats()
+    bot.send_message(message.chat.id,
+        f"<b>Report queue:</b>\n"
+        f"Queued: {stats['queued']} (in flight: {stats['in_flight']})\n"
+        f"Completed: {stats['completed']}, failed: {stats['failed']}, shared: {stats['coalesced']}\n"
+        f"Avg wait: {stats['avg_wait']:.1f}s, avg render: {stats['avg_run']:.1f}s, max wait: {stats['max_wait']:.1f}s")
+
+@bot.message_handler(commands=['jobs'])
+def show_jobs(message):
+    if not is_allowed_user(message):
+        return bot.send_message(message.chat.id, "Access Denied.")
+    lines = [f"{name}: every {s['interval']:g}s, {s['runs']} runs, {s['missed']} missed, {s['failures']} failed, "
+             f"lag {s['last_lag']:.2f}s (max {s['max_lag']:.2f}s), last run {s['last_runtime']:.1f}s"
+             for name, s in scheduler.stats().items()]
+    bot.send_message(message.chat.id, "<b>Scheduled jobs:</b>\n" + "\n".join(lines))
 
 @bot.message_handler(func=lambda m: True)
 def handle_unknown(m):
@@ -116,13 +178,47 @@ def show_ip_config(message):
 
 def show_alerts(message):
     try:
-        alerts = get_stored_alerts()
-        text = "<b>Alerts:</b><br>" + ("<br>".join(alerts) if alerts else "No critical alerts.")
-        bot.send_message(message.chat.id, text)
+        active = get_active_alerts()
+        text = "<b>Alerts:</b>\n" + ("\n".join(active) if active else "No active alerts.")
+        markup = InlineKeyboardMarkup(row_width=2)
+        markup.add(
+            InlineKeyboardButton("History: Last Hour", callback_data="alert_history:last_hour"),
+            InlineKeyboardButton("Last 24 Hours", callback_data="alert_history:last_24_hours"),
+            InlineKeyboardButton("Last 7 Days", callback_data="alert_history:last_7_days"),
+            InlineKeyboardButton("Last 30 Days", callback_data="alert_history:last_30_days")
+        )
+        bot.send_message(message.chat.id, text, reply_markup=markup)
     except Exception as e:
         logging.error(f"Alerts fetch error: {e}")
         bot.send_message(message.chat.id, "Failed to fetch alerts.")
 
+def format_alert(row):
+    at = datetime.fromtimestamp(row['ts']).strftime('%d %b %H:%M')
+    name = row['metric'] + (f" {row['subject']}" if row['subject'] else "")
+    state = f"resolved {datetime.fromtimestamp(row['resolved_at']).strftime('%d %b %H:%M')}" if row['resolved_at'] else "active"
+    return f"{at} {row['severity'].upper()} {name} {row['value']:.1f} (threshold {row['threshold']:g}), {state}"
+
+def show_alert_history(message, data):
+    """One page of alert history; callback data is alert_history:<period>[:<ts>:<id>] for older pages."""
+    try:
+        parts = data.split(":")
+        period = parts[1]
+        before = (int(parts[2]), int(parts[3])) if len(parts) == 4 else None
+        rows, cursor = get_alert_history(period, before=before)
+        title = period.replace("_", " ").title()
+        text = f"<b>Alert history ({title}):</b>\n" + ("\n".join(format_alert(r) for r in rows) if rows else "No alerts.")
+        markup = None
+        if cursor:
+            markup = InlineKeyboardMarkup()
+            markup.add(InlineKeyboardButton("Older ▶", callback_data=f"alert_history:{period}:{cursor[0]}:{cursor[1]}"))
+        if before:
+            bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup)
+        else:
+            bot.send_message(message.chat.id, text, reply_markup=markup)
+    except Exception as e:
+        logging.error(f"Alert history error: {e}")
+        bot.send_message(message.chat.id, "Failed to fetch alert history.")
+
 def show_report_menu(message):
     markup = InlineKeyboardMarkup()
     markup.add(
@@ -130,28 +226,48 @@ def show_report_menu(message):
         InlineKeyboardButton("Last 24 Hours", callback_data="report_last_24"),
         InlineKeyboardButton("Today", callback_data="report_today"),
         InlineKeyboardButton("Yesterday", callback_data="report_yesterday"),
+        InlineKeyboardButton("Last 7 Days", callback_data="report_last_7"),
+        InlineKeyboardButton("Last 30 Days", callback_data="report_last_30"),
         InlineKeyboardButton("Custom Date", callback_data="report_custom")
     )
     bot.send_message(message.chat.id, "<b>Select a report range:</b>", reply_markup=markup)
 
+def queue_report(chat_id, time_range, custom_date=None, caption="✅ Report Ready", no_data="No data for this range."):
+    """Queues a report and keeps one status message up to date until the PDF is sent."""
+    status = bot.send_message(chat_id, "⏳ Report queued...")
+
+    def edit(text):
+        try:
+            bot.edit_message_text(text, chat_id, status.message_id)
+        except Exception as e:
+            logging.debug(f"Report status edit failed: {e}")
+
+    def progress(job):
+        if job.state == 'queued':
+            edit(f"⏳ Report queued ({report_queue.depth()} in queue)...")
+        elif job.state == 'rendering':
+            edit("🛠 Rendering report...")
+        elif job.state == 'failed':
+            edit("Report generation failed.")
+        elif job.path:
+            delivery.send_document(chat_id, job.path, caption)
+            edit(f"✅ Report ready in {job.wait_seconds + job.run_seconds:.1f}s")
+        else:
+            edit(no_data)
+
+    report_queue.submit(time_range, custom_date, progress)
+
 def generate_and_send_report(message, tag):
     range_map = {
         "report_last_hour": "last_hour",
         "report_last_24": "last_24_hours",
         "report_today": "today",
-        "report_yesterday": "yesterday"
+        "report_yesterday": "yesterday",
+        "report_last_7": "last_7_days",
+        "report_last_30": "last_30_days"
     }
     if tag in range_map:
-        try:
-            path = generate_report(range_map[tag])
-            if path:
-                with open(path, 'rb') as f:
-                    bot.send_document(message.chat.id, f, caption="✅ Report Ready")
-            else:
-                bot.send_message(message.chat.id, "No data for this range.")
-        except Exception as e:
-            logging.error(f"Report error: {e}")
-            bot.send_message(message.chat.id, "Report generation failed.")
+        queue_report(message.chat.id, range_map[tag])
     elif tag == "report_custom":
         bot.send_message(message.chat.id, "Send date in YYYY-MM-DD format:")
         bot.register_next_step_handler(message, get_report_for_date)
@@ -160,15 +276,10 @@ def get_report_for_date(message):
     try:
         date = message.text.strip()
         datetime.strptime(date, "%Y-%m-%d")
-        path = generate_report("custom", date)
-        if path:
-            with open(path, 'rb') as f:
-                bot.send_document(message.chat.id, f)
-        else:
-            bot.send_message(message.chat.id, "No data found for that date.")
     except Exception as e:
         logging.error(f"Custom date report error: {e}")
-        bot.send_message(message.chat.id, "Invalid date or generation error.")
+        return bot.send_message(message.chat.id, "Invalid date or generation error.")
+    queue_report(message.chat.id, "custom", date, caption=None, no_data="No data found for that date.")
 
 def show_utilities_menu(message):
     markup = InlineKeyboardMarkup()
@@ -199,42 +310,75 @@ def execute_shell_command(message):
     if not is_allowed_user(message):
         return bot.send_message(message.chat.id, "Access Denied.")
 
-    cmd = message.text.strip()
-    if not is_safe_command(cmd):
+    argv = parse_command(message.text or "")
+    if argv is None:
         allowed = "\n".join(SAFE_COMMANDS)
         return bot.send_message(
             message.chat.id,
-            f"<b>❌ Blocked Command</b>\nAllowed commands:\n<pre>{allowed}</pre>",
+            f"<b>❌ Blocked Command</b>\nCommands run without a shell (no pipes or redirection).\nAllowed commands:\n<pre>{allowed}</pre>",
             parse_mode="HTML"
         )
 
     try:
-        result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=10)
-        output = result.stdout.strip() or "✅ Command executed, but no output returned."
-        
-        # Escape unsafe HTML characters for Telegram
-        safe_output = output.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-
-        # Limit to last 4000 characters (Telegram message limit)
-        safe_output = safe_output[-4000:]
-
-        bot.send_message(message.chat.id, f"<pre>{safe_output}</pre>", parse_mode="HTML")
-
-    except subprocess.TimeoutExpired:
-        bot.send_message(message.chat.id, "❌ Command timed out.")
+        result = expert_mode.run_command(argv)
+    except FileNotFoundError:
+        return bot.send_message(message.chat.id, f"❌ {expert_mode.escape(argv[0])}: command not found.")
     except Exception as e:
-        bot.send_message(message.chat.id, f"⚠️ Error: {str(e)}")
+        return bot.send_message(message.chat.id, f"⚠️ Error: {expert_mode.escape(str(e))}")
+
+    command = " ".join(argv)
+    command = command if len(command) <= 100 else command[:97] + "..."
+    title = f"$ {expert_mode.escape(command)} ({result.summary()})"
+    if result.archive:
+        # Too long to page through in chat: the whole output as a file, the tail as a preview
+        try:
+            with open(result.archive, 'rb') as f:
+                bot.send_document(message.chat.id, f, caption=title, visible_file_name=f"{argv[0]}-output.txt.gz")
+        finally:
+            os.remove(result.archive)
+        title = f"Last {len(result.text.encode()) // 1024} KB of output:"
+    pages = expert_mode.paginate(result.text.strip() or "✅ Command executed, but no output returned.")
+    result_id = command_pages.add(title, pages) if len(pages) > 1 else None
+    send_command_page(message, title, pages, 0, result_id)
+
+def command_page_markup(result_id, page, count):
+    if result_id is None:
+        return None
+    markup = InlineKeyboardMarkup()
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀ Prev", callback_data=f"expert_page:{result_id}:{page - 1}"))
+    if page < count - 1:
+        buttons.append(InlineKeyboardButton("Next ▶", callback_data=f"expert_page:{result_id}:{page + 1}"))
+    markup.row(*buttons)
+    return markup
+
+def send_command_page(message, title, pages, page, result_id, edit=False):
+    text = f"{title}\n<pre>{pages[page]}</pre>"
+    if len(pages) > 1:
+        text = f"{title} [page {page + 1}/{len(pages)}]\n<pre>{pages[page]}</pre>"
+    markup = command_page_markup(result_id, page, len(pages))
+    if edit:
+        bot.edit_message_text(text, message.chat.id, message.message_id, parse_mode="HTML", reply_markup=markup)
+    else:
+        bot.send_message(message.chat.id, text, parse_mode="HTML", reply_markup=markup)
+
+def show_command_page(message, data):
+    """Next/previous page of a stored Expert Mode result; callback data is expert_page:<id>:<page>."""
+    _, result_id, page = data.split(":")
+    entry = command_pages.get(int(result_id))
+    if entry is None:
+        return bot.send_message(message.chat.id, "That output has expired, run the command again.")
+    title, pages = entry
+    send_command_page(message, title, pages, min(int(page), len(pages) - 1), int(result_id), edit=True)
 
 
 # --- Auto Daily Reports ---
 def notify_all(text):
-    for uid in ALLOWED_CHAT_ID:
-        try:
-            bot.send_message(uid, text)
-        except:
-            pass
+    return delivery.broadcast_message(ALLOWED_CHAT_ID, text)
 
 def auto_daily_report():
+    """Sends yesterday's report once per day; the scheduler calls this every DAILY_REPORT_CHECK seconds."""
     date_file = ".last_report_date"
     
     def read_last_date():
@@ -247,33 +391,57 @@ def auto_daily_report():
         with open(date_file, "w") as f:
             f.write(date_str)
 
-    while True:
-        today_str = datetime.now().date().isoformat()
-        last_date = read_last_date()
-        
-        if last_date != today_str:
-            try:
-                path = generate_report("yesterday")
-                if path:
-                    for uid in ALLOWED_CHAT_ID:
-                        with open(path, 'rb') as f:
-                            bot.send_document(uid, f, caption="📊 Yesterday's Report")
-                    notify_all("<b>📈 Report sent automatically.</b>")
-                else:
-                    notify_all("❌ No data for yesterday.")
-                
-                purge_old_reports()
-                write_last_date(today_str)
-            except Exception as e:
-                logging.error(f"Auto-report error: {e}")
-
-        time.sleep(900)
+    today_str = datetime.now().date().isoformat()
+    last_date = read_last_date()
+
+    if last_date != today_str:
+        try:
+            job = report_queue.submit("yesterday")
+            path = job.wait()
+            if job.error:
+                raise job.error
+            if path:
+                delivery.broadcast_document(ALLOWED_CHAT_ID, path, caption="📊 Yesterday's Report")
+                notify_all("<b>📈 Report sent automatically.</b>")
+            else:
+                notify_all("❌ No data for yesterday.")
+
+            purge_old_reports()
+            write_last_date(today_str)
+        except Exception as e:
+            logging.error(f"Auto-report error: {e}")
 
 # --- Startup ---
+def push_alert(event):
+    """Sends an alert transition (fire/resolve) to every allowed chat as it happens."""
+    delivery.broadcast_message(ALLOWED_CHAT_ID, event.message)
+
+def push_public_ip_change(old, new):
+    delivery.broadcast_message(ALLOWED_CHAT_ID, f"📡 Public IP changed: {old} → {new}")
+
 def start_bot():
-    threading.Thread(target=auto_daily_report, daemon=True).start()
-    bot.infinity_polling(timeout=30)
+    setup()
+    keep_history()
+    try:
+        netlink_watcher.get_watcher()  # Link and address changes are recorded from startup on
+    except OSError as e:
+        logging.warning(f"Netlink watcher not started: {e}")
+    alert_engine.subscribe(push_alert)
+    public_ip.resolver.subscribe(push_public_ip_change)
+    # Collectors, retention and the daily report share one fixed-rate scheduler
+    scheduler.add('daily_report', auto_daily_report, DAILY_REPORT_CHECK, align=False)
+    scheduler.start()
+    # Scrape-time stats next to the samples the collectors push; all in memory
+    metrics_exporter.registry.add_stats('job', scheduler.stats, label='job')
+    metrics_exporter.registry.add_stats('alerts', alert_engine.stats)
+    metrics_exporter.registry.add_stats('report_queue', report_queue.stats)
+    metrics_exporter.registry.add_stats('public_ip', public_ip.resolver.stats)
+    metrics_exporter.start_exporter()
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(bot)
+    else:
+        bot.infinity_polling(timeout=30)
 
 if __name__ == '__main__':
-    purge_old_reports()
     start_bot()
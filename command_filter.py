@@ -1,4 +1,13 @@
 # command_filter.py
+import os
+import pwd
+import math
+import time
+import shlex
+import socket
+import logging
+
+import psutil
 
 SAFE_COMMANDS = [
     "uptime",
@@ -21,7 +30,301 @@ SAFE_COMMANDS = [
     "ifconfig"
 ]
 
+# Commands run without a shell, so these would only reach the program as literal arguments
+SHELL_OPERATORS = {"|", "||", "&", "&&", ";", ">", ">>", "<", "<<"}
+
+def parse_command(cmd: str):
+    """Splits cmd into an argv list. Returns None if it is empty, malformed, uses shell syntax or isn't whitelisted."""
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    if not argv or argv[0] not in SAFE_COMMANDS:
+        return None
+    if any(arg in SHELL_OPERATORS or "`" in arg or "$(" in arg for arg in argv):
+        return None
+    return argv
+
 def is_safe_command(cmd: str) -> bool:
     """Returns True if the command is in the safe whitelist."""
-    first_word = cmd.strip().split()[0]
-    return first_word in SAFE_COMMANDS
+    return parse_command(cmd) is not None
+
+# --- In-process fast paths ---
+# Common forms of whitelisted commands answered from psutil/os instead of forking the binary.
+# An implementation returns the command's output, or None for arguments it doesn't handle,
+# in which case the command runs as a subprocess as usual.
+FAST_PATHS = {}
+
+def fast_path(name):
+    """Registers func(args) -> output or None as the in-process version of a whitelisted command."""
+    def register(func):
+        FAST_PATHS[name] = func
+        return func
+    return register
+
+def run_fast_path(argv):
+    """Output of argv from its in-process implementation, or None if it has to be run for real."""
+    func = FAST_PATHS.get(argv[0])
+    if func is None:
+        return None
+    try:
+        return func(argv[1:])
+    except Exception as e:
+        logging.warning(f"Fast path for {argv[0]} failed, running the command instead: {e}")
+        return None
+
+def _plural(count, unit):
+    return f"{count} {unit}{'' if count == 1 else 's'}"
+
+def _table(rows, left=(0,), minimum=()):
+    """
+    Columns padded to their widest cell (or the width in `minimum`, as df and lsblk reserve);
+    columns in `left` are left-aligned, the rest right-aligned.
+    """
+    minimum = list(minimum) + [0] * len(rows[0])
+    widths = [max(minimum[i], max(len(row[i]) for row in rows)) for i in range(len(rows[0]))]
+    lines = []
+    for row in rows:
+        cells = [cell.ljust(widths[i]) if i in left else cell.rjust(widths[i]) for i, cell in enumerate(row)]
+        lines.append(" ".join(cells).rstrip())
+    return "\n".join(lines) + "\n"
+
+def _human(value, units, round_up=False):
+    """1.3Gi / 20G style sizes as free -h, df -h and lsblk print them; df rounds up."""
+    for unit in units:
+        if value < 1024 or unit == units[-1]:
+            if unit == units[0]:
+                return f"{int(value)}{unit}"
+            if round_up:
+                value = math.ceil(value * 10) / 10 if value < 10 else math.ceil(value)
+            return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+        value /= 1024
+    return str(value)
+
+@fast_path("uptime")
+def _uptime(args):
+    if args not in ([], ["-p"]):
+        return None
+    seconds = int(time.time() - psutil.boot_time())
+    days, rest = divmod(seconds, 86400)
+    hours, minutes = rest // 3600, rest % 3600 // 60
+    if args == ["-p"]:
+        weeks, days = divmod(days, 7)
+        parts = [_plural(n, unit) for n, unit in ((weeks, "week"), (days, "day"), (hours, "hour"), (minutes, "minute")) if n]
+        return "up " + ", ".join(parts or ["0 minutes"]) + "\n"
+    text = f" {time.strftime('%H:%M:%S')} up "
+    if days:
+        text += f"{_plural(days, 'day')}, "
+    text += f"{hours:2d}:{minutes:02d}, " if hours else f"{minutes} min, "
+    users = len(psutil.users())
+    load = _read("/proc/loadavg").split()[:3]  # as uptime prints them; os.getloadavg() rounds differently
+    return text + f"{users:2d} user{'s' if users > 1 else ''},  load average: {', '.join(load)}\n"
+
+@fast_path("free")
+def _free(args):
+    if args not in ([], ["-k"], ["-m"], ["-h"]):
+        return None
+    mem, swap = psutil.virtual_memory(), psutil.swap_memory()
+    if args == ["-h"]:
+        fmt = lambda v: _human(v, ["B", "Ki", "Mi", "Gi", "Ti"])
+    else:
+        divisor = 1024 * 1024 if args == ["-m"] else 1024
+        fmt = lambda v: str(int(v // divisor))
+    rows = [
+        ("Mem:", mem.total, mem.used, mem.free, mem.shared, mem.buffers + mem.cached, mem.available),
+        ("Swap:", swap.total, swap.used, swap.free),
+    ]
+    header = f"{'':8s}" + "".join(f" {h:>11s}" for h in ("total", "used", "free", "shared", "buff/cache", "available"))
+    lines = [header] + [f"{row[0]:8s}" + "".join(f" {fmt(v):>11s}" for v in row[1:]) for row in rows]
+    return "\n".join(lines) + "\n"
+
+def _mounts():
+    """(device, mount point) of every mounted filesystem, in mount order."""
+    with open("/proc/self/mounts") as f:
+        for line in f:
+            fields = line.split()
+            yield fields[0], fields[1].replace("\\040", " ")
+
+@fast_path("df")
+def _df(args):
+    if args not in ([], ["-h"]):
+        return None
+    human = args == ["-h"]
+    rows = [["Filesystem", "Size" if human else "1K-blocks", "Used", "Avail" if human else "Available", "Use%", "Mounted on"]]
+    seen = set()
+    for device, mountpoint in _mounts():
+        try:
+            st = os.statvfs(mountpoint)
+        except OSError:
+            continue
+        if st.f_blocks == 0:
+            continue  # proc, sysfs and other pseudo filesystems
+        if mountpoint in seen or (device.startswith("/") and device in seen):
+            continue  # mounted over, or the same device mounted again (bind mounts)
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        percent = f"{-(-used * 100 // (used + avail)) if used + avail else 0}%"
+        if human:
+            sizes = [_human(v, ["", "K", "M", "G", "T", "P"], round_up=True) for v in (total, used, avail)]
+        else:
+            sizes = [str(v // 1024) for v in (total, used, avail)]
+        seen.update((device, mountpoint))
+        rows.append([device] + sizes + [percent, mountpoint])
+    return _table(rows, left=(0, 5), minimum=(14, 5, 5, 5, 4))
+
+@fast_path("whoami")
+def _whoami(args):
+    return pwd.getpwuid(os.geteuid()).pw_name + "\n" if not args else None
+
+@fast_path("hostname")
+def _hostname(args):
+    return socket.gethostname() + "\n" if not args else None
+
+UNAME_FIELDS = {"s": "sysname", "n": "nodename", "r": "release", "v": "version", "m": "machine"}
+
+@fast_path("uname")
+def _uname(args):
+    info = os.uname()
+    if not args:
+        return info.sysname + "\n"
+    if args == ["-a"]:
+        return f"{info.sysname} {info.nodename} {info.release} {info.version} {info.machine} GNU/Linux\n"
+    flags = "".join(arg[1:] for arg in args if arg.startswith("-") and len(arg) > 1)
+    if len(flags) != sum(len(arg) - 1 for arg in args) or set(flags) - set(UNAME_FIELDS) - {"o"}:
+        return None
+    #   uname prints the fields in its own order, not the order of the flags
+    values = [getattr(info, UNAME_FIELDS[f]) for f in "snrvm" if f in flags]
+    if "o" in flags:
+        values.append("GNU/Linux")
+    return " ".join(values) + "\n"
+
+@fast_path("date")
+def _date(args):
+    if not args:
+        return time.strftime("%a %b %e %H:%M:%S %Z %Y") + "\n"
+    if len(args) == 1 and args[0].startswith("+"):
+        return time.strftime(args[0][1:]) + "\n"
+    return None
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def _tty_name(tty_nr):
+    major, minor = (tty_nr >> 8) & 0xfff, (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if major == 136:
+        return f"pts/{minor}"
+    if major == 4:
+        return f"tty{minor}" if minor < 64 else f"ttyS{minor - 64}"
+    return "?"
+
+def _process_rows():
+    """
+    One dict per process, read straight from /proc/<pid>/stat and cmdline. Going through
+    psutil.process_iter reads half a dozen files per process and is slower than forking ps.
+    """
+    now = time.time()
+    boot = psutil.boot_time()
+    today = time.strftime("%Y%m%d")
+    total_mem = psutil.virtual_memory().total
+    users = {}
+    for pid in sorted(int(entry) for entry in os.listdir("/proc") if entry.isdigit()):
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+            uid = os.stat(f"/proc/{pid}").st_uid
+        except OSError:
+            continue  # exited while we were reading
+        #   comm may itself contain spaces and parentheses; the fields after it are fixed
+        name, fields = stat[stat.index("(") + 1:stat.rindex(")")], stat[stat.rindex(")") + 2:].split()
+        if uid not in users:
+            try:
+                users[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                users[uid] = str(uid)
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        created = boot + int(fields[19]) / CLOCK_TICKS
+        rss = int(fields[21]) * PAGE_SIZE
+        started = time.localtime(created)
+        yield {
+            'user': users[uid][:8],
+            'pid': pid,
+            'ppid': int(fields[1]),
+            'cpu_percent': 100.0 * cpu / max(now - created, 1e-9),
+            'mem_percent': 100.0 * rss / total_mem,
+            'vsz': int(fields[20]) // 1024,
+            'rss': rss // 1024,
+            'tty': _tty_name(int(fields[4])),
+            'stat': fields[0],
+            'start': time.strftime("%H:%M" if time.strftime("%Y%m%d", started) == today else "%b%d", started),
+            'cpu': int(cpu),
+            'command': cmdline or f"[{name}]",
+        }
+
+@fast_path("ps")
+def _ps(args):
+    if args in (["aux"], ["-aux"]):
+        lines = ["USER       PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND"]
+        for p in _process_rows():
+            lines.append(f"{p['user']:<8s} {p['pid']:>5d} {p['cpu_percent']:4.1f} {p['mem_percent']:4.1f} {p['vsz']:>6d} "
+                         f"{p['rss']:>5d} {p['tty']:<8s} {p['stat']:<4s} {p['start']:>5s} {p['cpu'] // 60:3d}:{p['cpu'] % 60:02d} "
+                         f"{p['command']}")
+        return "\n".join(lines) + "\n"
+    if args == ["-ef"]:
+        lines = ["UID          PID    PPID  C STIME TTY          TIME CMD"]
+        for p in _process_rows():
+            cpu = p['cpu']
+            lines.append(f"{p['user']:<8s} {p['pid']:>7d} {p['ppid']:>7d} {int(p['cpu_percent']):2d} {p['start']:>5s} {p['tty']:<8s} "
+                         f"{cpu // 3600:02d}:{cpu % 3600 // 60:02d}:{cpu % 60:02d} {p['command']}")
+        return "\n".join(lines) + "\n"
+    return None
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def _lsblk_size(sectors):
+    size = _human(sectors * 512, ["B", "K", "M", "G", "T", "P"])
+    return size.replace(".0", "")
+
+def _mountpoints():
+    """{"major:minor": [mount point, ...]} from /proc/self/mountinfo, each point once, in mount order."""
+    mounts = {}
+    with open("/proc/self/mountinfo") as f:
+        for line in f:
+            fields = line.split()
+            mounts.setdefault(fields[2], {})[fields[4].replace("\\040", " ")] = None
+    return {dev: list(points) for dev, points in mounts.items()}
+
+@fast_path("lsblk")
+def _lsblk(args):
+    if args:
+        return None
+    mounts = _mountpoints()
+
+    def rows_for(name, path, kind, prefix=""):
+        dev = _read(os.path.join(path, "dev"))
+        removable = _read(os.path.join(path, "removable")) if os.path.exists(os.path.join(path, "removable")) else "0"
+        points = mounts.get(dev) or [""]
+        first = [prefix + name, dev, removable, _lsblk_size(int(_read(os.path.join(path, "size")))),
+                 _read(os.path.join(path, "ro")), kind, points[0]]
+        #   Like lsblk, every further mount point goes on a line of its own under MOUNTPOINTS
+        return [first] + [[""] * 6 + [point] for point in points[1:]]
+
+    def devno(name):
+        return tuple(int(n) for n in _read(os.path.join("/sys/block", name, "dev")).split(":"))
+
+    rows = [["NAME", "MAJ:MIN", "RM", "SIZE", "RO", "TYPE", "MOUNTPOINTS"]]
+    for name in sorted(os.listdir("/sys/block"), key=devno):
+        path = os.path.join("/sys/block", name)
+        major = str(devno(name)[0])
+        if major == "1" or (name.startswith("loop") and _read(os.path.join(path, "size")) == "0"):
+            continue  # ram disks and unused loop devices, hidden like lsblk does
+        kind = "loop" if name.startswith("loop") else "rom" if name.startswith("sr") else "disk"
+        rows += rows_for(name, path, kind)
+        parts = sorted(p for p in os.listdir(path) if os.path.exists(os.path.join(path, p, "partition")))
+        for i, part in enumerate(parts):
+            rows += rows_for(part, os.path.join(path, part), "part", "└─" if i == len(parts) - 1 else "├─")
+    return _table(rows, left=(0, 1, 5, 6), minimum=(0, 0, 2, 5, 2, 4))
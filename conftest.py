@@ -0,0 +1,66 @@
+# conftest.py - Fixtures shared by the Telegram-facing tests
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from telebot import apihelper
+
+
+class FakeBotAPI(ThreadingHTTPServer):
+    """Answers sendMessage/sendDocument like the Bot API and records every call."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeBotAPIHandler)
+        self.calls = []
+        self.rate_limited = 0  # Upcoming requests answered with 429
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlparse(self.path)
+        method = url.path.rsplit("/", 1)[-1]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        uploaded = self.headers.get("Content-Type", "").startswith("multipart/form-data")
+        server = self.server
+        with server.lock:
+            limited = server.rate_limited > 0
+            server.rate_limited -= limited
+            server.calls.append({'method': method, 'chat_id': int(params['chat_id']), 'uploaded': uploaded,
+                                 'document': params.get('document'), 'text': params.get('text'),
+                                 'limited': limited, 'at': time.monotonic(), 'body': request_body})
+            file_id = f"FILE-{len(server.calls)}"
+        time.sleep(server.delay)
+        if limited:
+            body = {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 0",
+                    "parameters": {"retry_after": 0}}
+        else:
+            message = {"message_id": len(server.calls), "date": 0,
+                       "chat": {"id": int(params['chat_id']), "type": "private"}}
+            if method == "sendDocument":
+                message["document"] = {"file_id": params.get('document') or file_id, "file_unique_id": "u"}
+            body = {"ok": True, "result": message}
+        payload = json.dumps(body).encode()
+        self.send_response(429 if limited else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = FakeBotAPI()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(apihelper, "API_URL", f"http://127.0.0.1:{server.server_port}/bot{{0}}/{{1}}")
+    yield server
+    server.shutdown()
+    server.server_close()
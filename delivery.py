@@ -0,0 +1,149 @@
+# delivery.py - Outbound Telegram delivery: upload once, fan out concurrently, back off on 429
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "4"))
+DELIVERY_RATE = float(os.getenv("DELIVERY_RATE", "25"))  # Messages per second; Telegram allows ~30 across chats
+DELIVERY_RETRIES = int(os.getenv("DELIVERY_RETRIES", "3"))
+RETRY_BACKOFF = 1.0  # Seconds before the first retry when Telegram gives no retry_after; doubles each time
+FILE_ID_CACHE = 64  # Uploaded files whose file_id is kept for resending
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Delivery:
+    """
+    Sends messages and documents through a TeleBot. A file is uploaded once; later sends
+    of the same content reuse the file_id Telegram returned.
+    """
+
+    def __init__(self, bot, concurrency=DELIVERY_CONCURRENCY, rate=DELIVERY_RATE, retries=DELIVERY_RETRIES):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.retries = retries
+        self.limiter = RateLimiter(rate)
+        self._file_ids = OrderedDict()  # (size, sha256) -> file_id, least recently used first
+        self._upload_locks = OrderedDict()
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.retried = 0
+
+    def _call(self, func, *args, **kwargs):
+        """Calls a Bot API method, sleeping and retrying when Telegram answers 429."""
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                return func(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.retries:
+                    raise
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after')
+                delay = retry_after if retry_after is not None else RETRY_BACKOFF * 2 ** attempt
+                logging.warning(f"Telegram rate limit hit, retrying in {delay}s")
+                self.retried += 1
+                time.sleep(delay)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._call(self.bot.send_message, chat_id, text, **kwargs)
+
+    @staticmethod
+    def file_key(path):
+        """
+        Identifies a file by its content. Not by mtime: the report cache touches a cached
+        report on every hit, and that must not cause another upload.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        return os.path.getsize(path), digest.hexdigest()
+
+    def _upload(self, chat_id, path, caption):
+        #   Opened per attempt: a retry after a 429 must send the whole file again, not the exhausted handle
+        with open(path, 'rb') as f:
+            return self.bot.send_document(chat_id, f, caption=caption)
+
+    def send_document(self, chat_id, path, caption=None):
+        """Sends the file at path, uploading it only if Telegram doesn't have it yet."""
+        key = self.file_key(path)
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+            self._upload_locks.move_to_end(key)
+            while len(self._upload_locks) > FILE_ID_CACHE:
+                self._upload_locks.popitem(last=False)
+        # Concurrent senders of a new file wait for the first upload instead of repeating it
+        with upload_lock:
+            with self._lock:
+                file_id = self._file_ids.get(key)
+                if file_id is not None:
+                    self._file_ids.move_to_end(key)
+            if file_id is None:
+                message = self._call(self._upload, chat_id, path, caption)
+                with self._lock:
+                    self._file_ids[key] = message.document.file_id
+                    while len(self._file_ids) > FILE_ID_CACHE:
+                        self._file_ids.popitem(last=False)
+                    self.uploads += 1
+                return message
+        return self._call(self.bot.send_document, chat_id, file_id, caption=caption)
+
+    def _fan_out(self, chat_ids, send):
+        results = {}
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return results
+        with ThreadPoolExecutor(min(self.concurrency, len(chat_ids))) as pool:
+            futures = {chat_id: pool.submit(send, chat_id) for chat_id in chat_ids}
+        for chat_id, future in futures.items():
+            try:
+                future.result()
+                results[chat_id] = True
+            except Exception as e:
+                logging.error(f"Delivery to {chat_id} failed: {e}")
+                results[chat_id] = e
+        return results
+
+    def broadcast_message(self, chat_ids, text, **kwargs):
+        """Sends text to every chat concurrently. Returns {chat_id: True or the exception}."""
+        return self._fan_out(chat_ids, lambda chat_id: self.send_message(chat_id, text, **kwargs))
+
+    def broadcast_document(self, chat_ids, path, caption=None):
+        """
+        Uploads the file with the first send, then sends its file_id to the remaining
+        chats concurrently. Returns {chat_id: True or the exception}.
+        """
+        results = {}
+        remaining = list(chat_ids)
+        while remaining:
+            chat_id = remaining.pop(0)
+            try:
+                self.send_document(chat_id, path, caption)
+                results[chat_id] = True
+                break
+            except Exception as e:
+                logging.error(f"Delivery to {chat_id} failed: {e}")
+                results[chat_id] = e
+        results.update(self._fan_out(remaining, lambda chat_id: self.send_document(chat_id, path, caption)))
+        return results
@@ -0,0 +1,221 @@
+# expert_mode.py - Runs Expert Mode commands without a shell, with bounded memory
+import os
+import gzip
+import time
+import signal
+import logging
+import selectors
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+from command_filter import run_fast_path
+
+EXPERT_TIMEOUT = float(os.getenv("EXPERT_TIMEOUT", "10"))
+EXPERT_BUFFER_BYTES = int(os.getenv("EXPERT_BUFFER_BYTES", "65536"))  # Output kept in memory for paging
+EXPERT_MAX_OUTPUT_BYTES = int(os.getenv("EXPERT_MAX_OUTPUT_BYTES", str(10 * 1024 * 1024)))  # Command is stopped past this
+READ_CHUNK = 16384
+KILL_GRACE = 2.0  # Seconds between SIGTERM and SIGKILL
+PAGE_CHARS = 3800  # Escaped characters per page; Telegram allows 4096 per message
+STORED_RESULTS = 20
+
+
+class RingBuffer:
+    """Fixed-size byte buffer keeping the last `capacity` bytes written to it."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = bytearray(capacity)
+        self.written = 0
+
+    def write(self, chunk):
+        size = len(chunk)
+        chunk = memoryview(chunk)[-self.capacity:]
+        start = (self.written + size - len(chunk)) % self.capacity
+        first = min(len(chunk), self.capacity - start)
+        self.data[start:start + first] = chunk[:first]
+        self.data[:len(chunk) - first] = chunk[first:]
+        self.written += size
+
+    @property
+    def dropped(self):
+        return max(0, self.written - self.capacity)
+
+    def getvalue(self):
+        if self.written <= self.capacity:
+            return bytes(self.data[:self.written])
+        start = self.written % self.capacity
+        return bytes(self.data[start:] + self.data[:start])
+
+
+class CommandResult:
+    def __init__(self, argv):
+        self.argv = argv
+        self.returncode = None
+        self.timed_out = False
+        self.truncated = False  # stopped at EXPERT_MAX_OUTPUT_BYTES
+        self.total_bytes = 0
+        self.seconds = 0.0
+        self.text = ""  # the last EXPERT_BUFFER_BYTES of output
+        self.archive = None  # path of the gzipped full output when it didn't fit the buffer
+        self.fast_path = False  # answered in-process, without running the binary
+
+    def summary(self):
+        status = "timed out" if self.timed_out else f"exit {self.returncode}"
+        size = f"{self.total_bytes / 1024:.1f} KB" if self.total_bytes >= 1024 else f"{self.total_bytes} B"
+        extra = ", stopped at the output cap" if self.truncated else ""
+        return f"{status}, {size} in {self.seconds:.1f}s{extra}"
+
+
+def _stop(process):
+    """SIGTERM to the command's whole process group, SIGKILL if it hasn't exited after KILL_GRACE."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(KILL_GRACE)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+class OutputSink:
+    """The ring buffer, plus a gzip file with all of the output once it outgrows the buffer."""
+
+    def __init__(self, buffer_bytes):
+        self.buffer = RingBuffer(buffer_bytes)
+        self.archive = None
+
+    def write(self, chunk):
+        if self.archive is None and self.buffer.written + len(chunk) > self.buffer.capacity:
+            handle, path = tempfile.mkstemp(prefix="expert-", suffix=".txt.gz")
+            os.close(handle)
+            self.archive = gzip.open(path, "wb")
+            self.archive.write(self.buffer.getvalue())
+        if self.archive is not None:
+            self.archive.write(chunk)
+        self.buffer.write(chunk)
+
+    def close(self, result):
+        if self.archive is not None:
+            self.archive.close()
+            result.archive = self.archive.name
+        result.total_bytes = self.buffer.written
+        result.text = self.buffer.getvalue().decode(errors="replace")
+
+
+def run_command(argv, timeout=EXPERT_TIMEOUT, buffer_bytes=EXPERT_BUFFER_BYTES, max_bytes=EXPERT_MAX_OUTPUT_BYTES,
+                fast_paths=True):
+    """
+    Runs argv (no shell) with stdout and stderr merged, streaming the output through a ring
+    buffer. Once the output outgrows the buffer it is also streamed to a gzip file, so the
+    whole of it can be sent as an attachment. Commands with an in-process implementation in
+    command_filter are answered without forking. Returns a CommandResult.
+    """
+    result = CommandResult(argv)
+    started = time.monotonic()
+    sink = OutputSink(buffer_bytes)
+    output = run_fast_path(argv) if fast_paths else None
+    if output is not None:
+        result.fast_path = True
+        result.returncode = 0
+        sink.write(output.encode()[:max_bytes])
+        result.truncated = sink.buffer.written >= max_bytes
+        sink.close(result)
+        result.seconds = time.monotonic() - started
+        logging.info(f"Expert Mode {argv} (in-process): {result.summary()}")
+        return result
+    deadline = started + timeout
+    #   Own session, so a timeout can signal every child the command started too
+    process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ)
+            fd = process.stdout.fileno()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    result.timed_out = True
+                    break
+                if not selector.select(remaining):
+                    continue
+                chunk = os.read(fd, READ_CHUNK)
+                if not chunk:
+                    break
+                sink.write(chunk)
+                if sink.buffer.written >= max_bytes:
+                    result.truncated = True
+                    break
+        if result.timed_out or result.truncated:
+            _stop(process)
+        else:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                result.timed_out = True
+                _stop(process)
+    finally:
+        if process.poll() is None:
+            _stop(process)
+        process.stdout.close()
+        sink.close(result)
+    result.returncode = process.returncode
+    result.seconds = time.monotonic() - started
+    logging.info(f"Expert Mode {argv}: {result.summary()}")
+    return result
+
+
+def escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def paginate(text, page_chars=PAGE_CHARS):
+    """Splits text into HTML-escaped pages of at most page_chars, breaking between lines where it can."""
+    pages, current = [], ""
+    for line in text.splitlines(keepends=True):
+        line = escape(line)
+        while len(line) > page_chars:
+            #   Don't split an entity such as &amp; across pages
+            cut = page_chars - len(current)
+            amp = line.rfind("&", max(0, cut - 4), cut)
+            if amp != -1:
+                cut = amp
+            if cut <= 0:
+                pages.append(current)
+                current = ""
+                continue
+            pages.append(current + line[:cut])
+            current, line = "", line[cut:]
+        if len(current) + len(line) > page_chars:
+            pages.append(current)
+            current = ""
+        current += line
+    if current or not pages:
+        pages.append(current)
+    return pages
+
+
+class PageStore:
+    """The pages of the last few results, for the next/previous buttons."""
+
+    def __init__(self, max_entries=STORED_RESULTS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def add(self, title, pages):
+        with self._lock:
+            self._next_id += 1
+            self._entries[self._next_id] = (title, pages)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return self._next_id
+
+    def get(self, result_id):
+        with self._lock:
+            return self._entries.get(result_id)
@@ -0,0 +1,171 @@
+# metrics_exporter.py - OpenMetrics endpoint for Prometheus/Grafana, served from memory
+import os
+import math
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+METRICS_PORT = os.getenv("METRICS_PORT")  # Exporter is off unless a port is set
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "0.0.0.0")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+PREFIX = "pi_"
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+#   Every family is a gauge, so the same body also parses as the classic Prometheus text format
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+        return f"{name}{{{text}}} {_format_value(value)}\n"
+    return f"{name} {_format_value(value)}\n"
+
+
+class Family:
+    """One gauge and its samples by label set. Rendered text is cached until a sample changes."""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.samples = {}  # ((label, value), ...) -> value
+        self._text = None
+
+    def set(self, labels, value):
+        self.samples[labels] = value
+        self._text = None
+
+    def render(self):
+        if self._text is None:
+            lines = [f"# TYPE {self.name} gauge\n", f"# HELP {self.name} {self.help}\n"]
+            lines += [_sample_line(self.name, labels, value) for labels, value in self.samples.items()]
+            self._text = "".join(lines)
+        return self._text
+
+
+class Registry:
+    """
+    Latest value of every exported metric. Collectors push into it as they sample, so a
+    scrape only formats what is already in memory; stats() callbacks registered with
+    add_stats() are read at scrape time and must not do I/O either.
+    """
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._families = {}
+        self._stats = []  # (name prefix, stats function, label name or None)
+        self._lock = threading.Lock()
+        self.scrapes = 0
+
+    def set(self, name, value, help="", **labels):
+        """Sets gauge prefix+name for the given labels; None is exported as NaN."""
+        name = self.prefix + name
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = Family(name, help or name)
+            family.set(tuple(sorted(labels.items())), value)
+
+    def set_many(self, values, names, **labels):
+        """Sets a gauge for each key of values found in names ({key: (metric name, help)})."""
+        for key, (name, help) in names.items():
+            if key in values:
+                self.set(name, values[key], help, **labels)
+
+    def add_stats(self, name, stats, label=None):
+        """
+        Exposes the numbers in stats() as gauges named prefix+name+'_'+key. With `label`,
+        stats() returns {label value: {key: number}}, as Scheduler.stats() does per job.
+        """
+        with self._lock:
+            self._stats.append((name, stats, label))
+
+    def _stats_families(self, stats_sources):
+        families = {}
+        for name, stats, label in stats_sources:
+            try:
+                result = stats()
+            except Exception as e:
+                logging.error(f"Metrics stats for {name} failed: {e}")
+                continue
+            groups = result.items() if label else [(None, result)]
+            for group, values in groups:
+                labels = ((label, group),) if label else ()
+                for key, value in values.items():
+                    #   Strings (e.g. the public IP itself) and unknowns are left out
+                    if isinstance(value, (int, float)):
+                        metric = f"{self.prefix}{name}_{key}"
+                        family = families.get(metric)
+                        if family is None:
+                            family = families[metric] = Family(metric, f"{name} {key}")
+                        family.set(labels, value)
+        return families.values()
+
+    def render(self):
+        """The whole exposition in OpenMetrics text format."""
+        with self._lock:
+            self.scrapes += 1
+            parts = [family.render() for family in self._families.values()]
+            stats_sources = list(self._stats)
+        parts += [family.render() for family in self._stats_families(stats_sources)]
+        parts.append("# EOF\n")
+        return "".join(parts).encode()
+
+
+#   Process-wide registry; system_monitor and module1 push their samples into it
+registry = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != self.server.metrics_path:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.registry.render()
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics {self.address_string()}: {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, registry=registry, host=METRICS_LISTEN, port=None, path=METRICS_PATH):
+        super().__init__((host, int(port if port is not None else METRICS_PORT)), MetricsHandler)
+        self.registry = registry
+        self.metrics_path = path
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="metrics-exporter", daemon=True).start()
+        logging.info(f"Metrics exporter listening on {self.server_address[0]}:{self.server_address[1]}{self.metrics_path}")
+        return self
+
+
+def start_exporter():
+    """Starts the exporter in the background when METRICS_PORT is set. Returns the server, or None."""
+    if not METRICS_PORT:
+        return None
+    return MetricsServer().start()
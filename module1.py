@@ -3,41 +3,42 @@ import subprocess
 import re
 import time
 import logging
-import sqlite3
-import datetime
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-# Configure logging
-logging.basicConfig(
-    filename='network_monitor.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s'
-)
+import storage
+import alerts
+import probe_engine
+import metrics_exporter
 
-DB_PATH = "/home/onkar/Monitoring_script/logs/monitoring_data.db"  # Database path
+HOSTS = {
+    'Google DNS': '8.8.8.8',
+    'Cloudflare DNS': '1.1.1.1',
+    'Local Gateway': '192.168.1.1'  # Replace with your actual gateway IP
+}
+
+# All hosts are probed at once, at most PROBE_CONCURRENCY at a time;
+# a probe still running after PROBE_TIMEOUT seconds counts as DOWN.
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "8"))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "15"))
+
+# "native" probes in-process with probe_engine; "ping" forks /bin/ping per host
+PROBE_ENGINE = os.getenv("PROBE_ENGINE", "native")
+PROBE_COUNT = 10
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "1.0"))
+
+# Per host, on each probe cycle; an unreachable host counts as 100% loss
+alerts.engine.add(alerts.Rule('packet_loss', {'warning': 20, 'critical': 50}, label="Packet Loss", cycles=3, hysteresis=10))
 
 def create_table():
     """Creates the network_logs table if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS network_logs (
-            timestamp TEXT,
-            host TEXT,
-            latency REAL,
-            jitter REAL,
-            packet_loss REAL,
-            status TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    storage.init_db()
 
-def ping_host(host, count=10):
+def ping_host(host, count=10, timeout=PROBE_TIMEOUT):
     """Pings a host and returns the average latency, jitter, and packet loss."""
     try:
         # Run the ping command
-        result = subprocess.run(['ping', '-c', str(count), host], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        result = subprocess.run(['ping', '-c', str(count), host], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
         
         # Log the full output for debugging
         logging.debug(f"Ping output for {host}: {result.stdout}")
@@ -65,43 +66,64 @@ def ping_host(host, count=10):
             logging.error(f"Ping failed for {host}: {result.stderr}")
             return None
 
+    except subprocess.TimeoutExpired:
+        logging.error(f"Ping to {host} timed out after {timeout} s")
+        return None
     except Exception as e:
         logging.error(f"Error pinging {host}: {str(e)}")
         return None
 
-
-
-def save_to_db(host, latency, jitter, packet_loss, status):
-    """Saves network data to the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute(
-        "INSERT INTO network_logs (timestamp, host, latency, jitter, packet_loss, status) VALUES (?, ?, ?, ?, ?, ?)",
-        (timestamp, host, latency, jitter, packet_loss, status)
-    )
-    conn.commit()
-    conn.close()
+def probe_hosts(hosts, max_workers=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """
+    Probes every host concurrently, at most max_workers at a time: on one asyncio loop with
+    probe_engine (the default "native" engine), or on a thread pool of ping processes.
+    Returns {name: (latency, jitter, packet loss) or None}; a cycle takes about as long as
+    the slowest host, and a host still running after timeout seconds is None.
+    """
+    if PROBE_ENGINE == "native":
+        probes = probe_engine.run_probes(hosts, max_concurrency=max_workers, host_timeout=timeout,
+                                         count=PROBE_COUNT, interval=PROBE_INTERVAL)
+        for name, result in probes.items():
+            logging.debug(f"{name} RTTs ({result.method}): {[round(rtt, 2) for rtt in result.rtts]}")
+        return {name: result.as_tuple() for name, result in probes.items()}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as pool:
+        futures = {name: pool.submit(ping_host, ip, timeout=timeout) for name, ip in hosts.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def save_to_db(host, latency, jitter, packet_loss, status, sampled_at=None):
+    """Queues network data on the shared batched writer."""
+    timestamp, ts = sampled_at or storage.now_timestamp()
+    storage.insert('network_logs', (timestamp, ts, host, latency, jitter, packet_loss, status))
+
+def export_metrics(results, sampled_at):
+    """Publishes a probe cycle's results for the metrics exporter; latency and jitter are NaN while a host is down."""
+    registry = metrics_exporter.registry
+    for name, result in results.items():
+        latency, jitter, packet_loss = result or (None, None, 100.0)
+        registry.set('host_up', 1 if result else 0, "Host answered the last probe cycle", host=name)
+        registry.set('host_latency_milliseconds', latency, "Average round-trip time", host=name)
+        registry.set('host_jitter_milliseconds', jitter, "Spread between the fastest and slowest reply", host=name)
+        registry.set('host_packet_loss_percent', packet_loss, "Probes without a reply", host=name)
+    registry.set('probe_timestamp_seconds', sampled_at[1], "When the last probe cycle started, Unix seconds")
 
 def main():
     create_table()  # Create table before any other operations
-    hosts = {
-        'Google DNS': '8.8.8.8',
-        'Cloudflare DNS': '1.1.1.1',
-        'Local Gateway': '192.168.1.1'  # Replace with your actual gateway IP
-    }
+    hosts = HOSTS
 
-    results = {}
+    # Every host's row in this cycle carries the same timestamp so reports can line them up
+    sampled_at = storage.now_timestamp()
+    results = probe_hosts(hosts)
     for name, ip in hosts.items():
-        result = ping_host(ip)
+        result = results[name]
         if result:
-            results[name] = result
             logging.info(f"{name} ({ip}) - Avg Latency: {result[0]:.2f} ms, Jitter: {result[1]:.2f} ms, Packet Loss: {result[2]:.2f}%")
-            save_to_db(name, result[0], result[1], result[2], "UP")
+            save_to_db(name, result[0], result[1], result[2], "UP", sampled_at)
         else:
-            results[name] = None
             logging.warning(f"Failed to retrieve data for {name} ({ip}).")
-            save_to_db(name, None, None, None, "DOWN")
+            save_to_db(name, None, None, None, "DOWN", sampled_at)
+        alerts.engine.observe('packet_loss', result[2] if result else 100.0, subject=name)
+    export_metrics(results, sampled_at)
 
     gateway_status = results['Local Gateway'] is not None
     dns_status = any(results[dns] is not None for dns in ['Google DNS', 'Cloudflare DNS'])
@@ -112,23 +134,22 @@ def main():
         logging.warning("Network Status: Internet issue detected.")
     else:
         logging.error("Network Status: Router issue detected.")
-        
+
+    storage.flush()  # One commit per probe cycle for all hosts
+
 def get_network_status():
     """
     Fetch the latest network status from the database instead of re-pinging.
     Returns a dictionary with the most recent data for each host.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = storage.connect_readonly()
     cursor = conn.cursor()
     
     results = {}
-    hosts = ['Google DNS', 'Cloudflare DNS', 'Local Gateway']
+    hosts = list(HOSTS)
 
     for host in hosts:
-        cursor.execute(
-            "SELECT latency, jitter, packet_loss, status, timestamp FROM network_logs WHERE host = ? ORDER BY timestamp DESC LIMIT 1",
-            (host,)
-        )
+        cursor.execute(storage.LATEST_STATUS_QUERY, (host,))
         row = cursor.fetchone()
         
         if row:
@@ -147,6 +168,6 @@ def get_network_status():
 
 
 if __name__ == "__main__":
-    while True:
-        main()
-        time.sleep(180)  # Check every 3 minutes
+    # The last recorded status per host; probing belongs to the bot's scheduler
+    for host, status in get_network_status().items():
+        print(host, status)
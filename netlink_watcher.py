@@ -0,0 +1,246 @@
+# netlink_watcher.py - Interface and address table kept current by rtnetlink events (Linux)
+import time
+import errno
+import socket
+import struct
+import logging
+import threading
+from collections import deque
+
+import storage
+
+#   From <linux/netlink.h> and <linux/rtnetlink.h>
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK, RTM_DELLINK, RTM_GETLINK = 16, 17, 18
+RTM_NEWADDR, RTM_DELADDR, RTM_GETADDR = 20, 21, 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+IFLA_IFNAME = 3
+IFA_ADDRESS, IFA_LOCAL, IFA_LABEL = 1, 2, 3
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+NLMSGHDR = struct.Struct("=LHHLL")
+NLMSGERR = struct.Struct("=i")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTATTR = struct.Struct("=HH")
+
+EVENT_HISTORY = 200
+RECV_BUFFER = 1 << 16
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def parse_messages(data):
+    """Splits a netlink datagram into (type, flags, seq, payload) tuples."""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, flags, seq, data[offset + NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+def parse_attributes(data, offset):
+    """{attribute type: raw value} for the rtattrs from offset on."""
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _text(value):
+    return value.split(b"\0", 1)[0].decode(errors="replace")
+
+
+class InterfaceTable:
+    """
+    Links and addresses as the kernel reports them. apply() takes one rtnetlink message and
+    returns the changes it made as (kind, interface, old, new) tuples.
+    """
+
+    def __init__(self):
+        self.links = {}  # index -> {'name': str, 'up': bool}
+        self.addresses = {}  # index -> {(family, address, prefixlen)}
+
+    def clear(self):
+        self.links.clear()
+        self.addresses.clear()
+
+    def name(self, index):
+        link = self.links.get(index)
+        return link['name'] if link else f"if{index}"
+
+    def apply(self, msg_type, payload):
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            return self._apply_link(msg_type, payload)
+        if msg_type in (RTM_NEWADDR, RTM_DELADDR):
+            return self._apply_address(msg_type, payload)
+        return []
+
+    def _apply_link(self, msg_type, payload):
+        _, _, index, flags, _ = IFINFOMSG.unpack_from(payload)
+        attrs = parse_attributes(payload, IFINFOMSG.size)
+        previous = self.links.get(index)
+        name = _text(attrs[IFLA_IFNAME]) if IFLA_IFNAME in attrs else self.name(index)
+        was_up = previous['up'] if previous else False
+        if msg_type == RTM_DELLINK:
+            self.links.pop(index, None)
+            self.addresses.pop(index, None)
+            return [('link', name, 'up', 'down')] if was_up else []
+        #   Up means administratively up with carrier, as `ip link` shows LOWER_UP
+        up = bool(flags & IFF_UP) and bool(flags & IFF_LOWER_UP)
+        self.links[index] = {'name': name, 'up': up}
+        if up == was_up:
+            return []
+        return [('link', name, 'up' if was_up else 'down', 'up' if up else 'down')]
+
+    def _apply_address(self, msg_type, payload):
+        family, prefixlen, _, _, index = IFADDRMSG.unpack_from(payload)
+        attrs = parse_attributes(payload, IFADDRMSG.size)
+        #   IFA_LOCAL is the interface's own address; IFA_ADDRESS is the peer on point-to-point links
+        raw = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        if raw is None or family not in (socket.AF_INET, socket.AF_INET6):
+            return []
+        key = (family, socket.inet_ntop(family, raw), prefixlen)
+        addresses = self.addresses.setdefault(index, set())
+        label = f"{key[1]}/{prefixlen}"
+        if msg_type == RTM_NEWADDR:
+            if key in addresses:
+                return []  # DHCP renewals re-announce the same address
+            addresses.add(key)
+            return [('address', self.name(index), None, label)]
+        if key not in addresses:
+            return []
+        addresses.discard(key)
+        return [('address', self.name(index), label, None)]
+
+    def ipv4_addresses(self):
+        """[(interface, address)] for every IPv4 address."""
+        return [(self.name(index), address)
+                for index, keys in sorted(self.addresses.items())
+                for family, address, _ in sorted(keys) if family == socket.AF_INET]
+
+
+class NetlinkWatcher:
+    """
+    Subscribes to link and address events, dumps the current state once and then keeps
+    the table current from the event stream. Every change after the initial dump is logged,
+    kept in `events` with the time it arrived and recorded in network_events.
+    """
+
+    def __init__(self, record=True):
+        self.table = InterfaceTable()
+        self.events = deque(maxlen=EVENT_HISTORY)  # (time.time(), kind, interface, old, new)
+        self.record = record
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._seq = 0
+
+    def start(self):
+        if self._thread is None:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER * 4)
+            self._sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            self._thread = threading.Thread(target=self._run, name="netlink-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _request(self, msg_type):
+        self._seq += 1
+        body = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) if msg_type == RTM_GETLINK else IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        header = NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type, NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0)
+        self._sock.send(header + body)
+        return self._seq
+
+    def _resync(self):
+        """Starts over from a full dump: links first, then addresses."""
+        self.ready.clear()
+        with self._lock:
+            self.table.clear()
+        return {self._request(RTM_GETLINK): RTM_GETADDR}
+
+    def _run(self):
+        dumps = self._resync()  # seq of a running dump -> dump to request after it, or None
+        while True:
+            try:
+                data = self._sock.recv(RECV_BUFFER)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    #   Events were dropped; the table can't be trusted until dumped again
+                    logging.warning("Netlink receive buffer overrun, resyncing interface table")
+                    dumps = self._resync()
+                    continue
+                logging.error(f"Netlink watcher stopped: {e}")
+                return
+            now = time.time()
+            for msg_type, _, seq, payload in parse_messages(data):
+                if msg_type == NLMSG_DONE and seq in dumps:
+                    self._dump_finished(dumps, seq)
+                    continue
+                if msg_type == NLMSG_ERROR:
+                    code = -NLMSGERR.unpack_from(payload)[0] if len(payload) >= NLMSGERR.size else 0
+                    logging.error(f"Netlink error {code} in reply to request {seq}")
+                    if seq in dumps:
+                        #   That dump won't finish; carry on without it rather than keep readers waiting
+                        self._dump_finished(dumps, seq)
+                    continue
+                with self._lock:
+                    changes = self.table.apply(msg_type, payload)
+                if self.ready.is_set():
+                    for change in changes:
+                        self._on_change(now, *change)
+
+    def _dump_finished(self, dumps, seq):
+        """Requests the dump that follows seq, or marks the table ready after the last one."""
+        following = dumps.pop(seq)
+        if following is not None:
+            dumps[self._request(following)] = None
+        elif not dumps:
+            self.ready.set()
+            logging.info(f"Netlink watcher tracking {len(self.table.links)} interfaces")
+
+    def _on_change(self, at, kind, interface, old, new):
+        self.events.append((at, kind, interface, old, new))
+        if kind == 'link':
+            (logging.warning if new == 'down' else logging.info)(f"Link {interface} {new}")
+        else:
+            logging.info(f"Address on {interface}: {old or '-'} -> {new or '-'}")
+        if self.record:
+            try:
+                storage.record_network_event(kind, old, new, subject=interface, at=at)
+            except Exception as e:
+                logging.error(f"Recording network event failed: {e}")
+
+    def private_ips(self):
+        """IPv4 addresses excluding loopback (127.*) and APIPA (169.*)."""
+        with self._lock:
+            addresses = self.table.ipv4_addresses()
+        return [ip for _, ip in addresses if not (ip.startswith('127.') or ip.startswith('169.'))]
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher():
+    """Returns the process-wide watcher, starting it on first use. Raises OSError without rtnetlink."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = NetlinkWatcher().start()
+        return _watcher
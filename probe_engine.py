@@ -0,0 +1,215 @@
+# probe_engine.py - In-process ICMP/UDP/TCP probe engine
+import os
+import time
+import struct
+import socket
+import asyncio
+import logging
+
+# Probe method used when none is given: "auto" picks ICMP if the kernel allows
+# unprivileged ICMP sockets (net.ipv4.ping_group_range), TCP connect otherwise.
+PROBE_METHOD = os.getenv("PROBE_METHOD", "auto")
+TCP_PROBE_PORT = int(os.getenv("TCP_PROBE_PORT", "53"))
+UDP_ECHO_PORT = 7
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+_icmp_available = None
+
+
+class ProbeResult:
+    """Every RTT of one probe run against a host, with loss and jitter derived from them."""
+
+    def __init__(self, host, method, sent, rtts):
+        self.host = host
+        self.method = method
+        self.sent = sent
+        self.rtts = rtts  # milliseconds, in send order, lost probes omitted
+
+    @property
+    def received(self):
+        return len(self.rtts)
+
+    @property
+    def packet_loss(self):
+        return 100.0 * (self.sent - self.received) / self.sent if self.sent else 100.0
+
+    @property
+    def latency(self):
+        return sum(self.rtts) / len(self.rtts) if self.rtts else None
+
+    @property
+    def jitter(self):
+        """
+        Spread between the slowest and fastest reply (max - min), the jitter ping_host
+        derives from ping's summary and every network_logs row has always stored.
+        """
+        return max(self.rtts) - min(self.rtts) if self.rtts else None
+
+    def as_tuple(self):
+        """(avg latency, jitter, packet loss) like module1.ping_host, or None if nothing came back."""
+        if not self.rtts:
+            return None
+        return self.latency, self.jitter, self.packet_loss
+
+    def __repr__(self):
+        return f"ProbeResult({self.host!r}, {self.method}, sent={self.sent}, received={self.received})"
+
+
+def icmp_available():
+    """True if this process may open an unprivileged ICMP datagram socket."""
+    global _icmp_available
+    if _icmp_available is None:
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+            _icmp_available = True
+        except OSError:
+            _icmp_available = False
+    return _icmp_available
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(seq):
+    payload = struct.pack("!d", time.monotonic())
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+    checksum = _checksum(header + payload)
+    # The kernel fills in the identifier for ICMP datagram sockets
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, 0, seq) + payload
+
+
+def _parse_icmp_reply(data):
+    if len(data) < 8:
+        return None
+    icmp_type, _, _, _, seq = struct.unpack("!BBHHH", data[:8])
+    return seq if icmp_type == ICMP_ECHO_REPLY else None
+
+
+def _parse_udp_reply(data):
+    return struct.unpack("!H", data[:2])[0] if len(data) >= 2 else None
+
+
+async def _datagram_probe(sock, address, make_packet, parse_reply, count, interval, timeout):
+    """
+    Sends count probes interval apart on one connected datagram socket and matches
+    replies by sequence number. Returns RTTs in send order.
+    """
+    loop = asyncio.get_running_loop()
+    sent_at = {}
+    rtts = {}
+
+    async def receiver():
+        while len(rtts) < count:
+            try:
+                data = await loop.sock_recv(sock, 1024)
+            except ConnectionRefusedError:
+                continue  # ICMP port unreachable for an earlier probe; that probe is lost
+            seq = parse_reply(data)
+            if seq in sent_at and seq not in rtts:
+                rtts[seq] = (time.monotonic() - sent_at[seq]) * 1000
+
+    await loop.sock_connect(sock, address)
+    receiving = asyncio.ensure_future(receiver())
+    try:
+        for seq in range(count):
+            sent_at[seq] = time.monotonic()
+            try:
+                await loop.sock_sendall(sock, make_packet(seq))
+            except OSError as e:
+                logging.debug(f"Probe send to {address[0]} failed: {e}")
+            if seq < count - 1:
+                await asyncio.sleep(interval)
+        await asyncio.wait_for(receiving, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        receiving.cancel()
+    return [rtts[seq] for seq in sorted(rtts)]
+
+
+async def probe_icmp(host, count=10, interval=0.2, timeout=2.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    try:
+        rtts = await _datagram_probe(sock, (host, 0), _echo_request, _parse_icmp_reply, count, interval, timeout)
+    finally:
+        sock.close()
+    return ProbeResult(host, "icmp", count, rtts)
+
+
+async def probe_udp(host, port=UDP_ECHO_PORT, count=10, interval=0.2, timeout=2.0):
+    """Probes a UDP echo service; each datagram carries its sequence number."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        rtts = await _datagram_probe(sock, (host, port), lambda seq: struct.pack("!H", seq) + b"probe",
+                                     _parse_udp_reply, count, interval, timeout)
+    finally:
+        sock.close()
+    return ProbeResult(host, "udp", count, rtts)
+
+
+async def probe_tcp(host, port=TCP_PROBE_PORT, count=10, interval=0.2, timeout=2.0):
+    """Times TCP handshakes; a refused connection still proves the host answered."""
+    rtts = []
+    for seq in range(count):
+        started = time.monotonic()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            rtts.append((time.monotonic() - started) * 1000)
+            writer.close()
+        except ConnectionRefusedError:
+            rtts.append((time.monotonic() - started) * 1000)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        if seq < count - 1:
+            await asyncio.sleep(interval)
+    return ProbeResult(host, "tcp", count, rtts)
+
+
+async def probe(host, count=10, interval=0.2, timeout=2.0, method=None, port=None):
+    """Probes one host with the given (or configured) method. Returns a ProbeResult."""
+    method = method or PROBE_METHOD
+    if method == "auto":
+        method = "icmp" if icmp_available() else "tcp"
+    if method == "icmp":
+        return await probe_icmp(host, count, interval, timeout)
+    if method == "udp":
+        return await probe_udp(host, port or UDP_ECHO_PORT, count, interval, timeout)
+    if method == "tcp":
+        return await probe_tcp(host, port or TCP_PROBE_PORT, count, interval, timeout)
+    raise ValueError(f"Unknown probe method: {method}")
+
+
+async def probe_many(targets, max_concurrency=8, host_timeout=None, **kwargs):
+    """
+    Probes {name: host} concurrently on the running loop, at most max_concurrency at once.
+    A host still running after host_timeout seconds counts as all probes lost.
+    Returns {name: ProbeResult}.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(host):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(probe(host, **kwargs), host_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Probe of {host} exceeded {host_timeout} s")
+                return ProbeResult(host, kwargs.get('method') or PROBE_METHOD, kwargs.get('count', 10), [])
+
+    names = list(targets)
+    results = await asyncio.gather(*(bounded(targets[name]) for name in names))
+    return dict(zip(names, results))
+
+
+def run_probes(targets, **kwargs):
+    """Synchronous wrapper around probe_many for the collectors."""
+    return asyncio.run(probe_many(targets, **kwargs))
@@ -0,0 +1,144 @@
+# public_ip.py - Cached public IP lookups that never hold up the bot
+import os
+import time
+import logging
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, TimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import storage
+
+PUBLIC_IP_ENDPOINTS = [url.strip() for url in os.getenv(
+    "PUBLIC_IP_ENDPOINTS", "https://api.ipify.org,https://ifconfig.me/ip,https://icanhazip.com").split(",") if url.strip()]
+PUBLIC_IP_TTL = float(os.getenv("PUBLIC_IP_TTL", "300"))  # Seconds a looked-up address is served from cache
+PUBLIC_IP_TIMEOUT = float(os.getenv("PUBLIC_IP_TIMEOUT", "3"))  # Connect and read timeout per endpoint
+
+
+class PublicIPResolver:
+    """
+    Looks the public IP up on every endpoint at once and takes the first valid answer.
+    Readers get the cached address; once it is older than `ttl` they still get it while a
+    single background lookup refreshes it. Subscribers are called as notify(old, new) when
+    the address changes, and every change is recorded in the network_events table.
+    """
+
+    def __init__(self, endpoints=None, ttl=PUBLIC_IP_TTL, timeout=PUBLIC_IP_TIMEOUT):
+        self.endpoints = list(endpoints or PUBLIC_IP_ENDPOINTS)
+        self.ttl = ttl
+        self.timeout = timeout
+        # One pooled session; keep-alive saves the TLS handshake on every refresh
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        #   Room for a second race while a slow endpoint of the previous one times out
+        self._pool = ThreadPoolExecutor(len(self.endpoints) * 2, thread_name_prefix="public-ip")
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._subscribers = []
+        self.address = None
+        self.updated = None  # monotonic time of the last successful lookup
+        self.last_known = None  # last address recorded in network_events, loaded on the first lookup
+        self.lookups = 0
+        self.failures = 0
+
+    def subscribe(self, notify):
+        self._subscribers.append(notify)
+
+    def age(self):
+        return time.monotonic() - self.updated if self.updated is not None else None
+
+    def get(self, wait=None):
+        """
+        The public IP, or None if it could not be looked up. Never blocks longer than `wait`
+        (default: one endpoint timeout), and only when there is no address cached yet.
+        """
+        age = self.age()
+        if age is not None and age < self.ttl:
+            return self.address
+        future = self.refresh_async()
+        if self.address is not None:
+            return self.address  # stale but useful; the refresh runs in the background
+        try:
+            return future.result(self.timeout if wait is None else wait)
+        except TimeoutError:
+            return None
+
+    def refresh(self):
+        """Looks the address up now, joining a lookup already running. Returns it, or None."""
+        return self.refresh_async().result()
+
+    def refresh_async(self):
+        with self._lock:
+            if self._inflight is None:
+                self._inflight = Future()
+                threading.Thread(target=self._refresh, args=(self._inflight,), name="public-ip-refresh", daemon=True).start()
+            return self._inflight
+
+    def _refresh(self, future):
+        address = None
+        try:
+            address = self.resolve()
+            if address is not None:
+                self._update(address)
+        except Exception as e:
+            logging.error(f"Public IP lookup failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight = None
+            #   Always answered, so refresh() (the scheduler job) can't wait forever
+            future.set_result(address if address is not None else self.address)
+
+    def _fetch(self, url):
+        response = self.session.get(url, timeout=(self.timeout, self.timeout))
+        response.raise_for_status()
+        return str(ipaddress.ip_address(response.text.strip()))
+
+    def resolve(self):
+        """Races every endpoint; returns the first valid address or None if none answered in time."""
+        self.lookups += 1
+        futures = {self._pool.submit(self._fetch, url): url for url in self.endpoints}
+        try:
+            for future in as_completed(futures, timeout=self.timeout * 2):
+                try:
+                    return future.result()
+                except (requests.RequestException, ValueError) as e:
+                    logging.debug(f"Public IP endpoint {futures[future]} failed: {e}")
+        except TimeoutError:
+            logging.debug("Public IP endpoints timed out")
+        finally:
+            for future in futures:
+                future.cancel()
+        self.failures += 1
+        logging.warning(f"No public IP endpoint answered ({len(self.endpoints)} tried)")
+        return None
+
+    def _update(self, address):
+        self.updated = time.monotonic()
+        if address == self.address:
+            return
+        old, self.address = self.address, address
+        if self.last_known is None:
+            self.last_known = storage.last_network_event('public_ip')
+        if address == self.last_known:
+            return  # Same as before the restart
+        previous, self.last_known = self.last_known, address
+        logging.info(f"Public IP changed: {previous} -> {address}")
+        storage.record_network_event('public_ip', previous, address)
+        if old is None and previous is None:
+            return  # First address ever seen; nothing changed
+        for notify in list(self._subscribers):
+            try:
+                notify(previous, address)
+            except Exception as e:
+                logging.error(f"Public IP change notification failed: {e}")
+
+    def stats(self):
+        return {'address': self.address, 'age': self.age(), 'lookups': self.lookups, 'failures': self.failures}
+
+
+#   Process-wide resolver, refreshed by the scheduler and read by the bot
+resolver = PublicIPResolver()
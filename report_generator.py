@@ -1,17 +1,36 @@
 # -*- coding: utf-8 -*-
 
-import sqlite3
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_pdf import PdfPages
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import multiprocessing
+import threading
+import logging
+import time
 import os
+import json
+import hashlib
 
-DB_PATH = "/home/onkar/Monitoring_script/logs/monitoring_data.db"
-REPORT_DIR = "/home/onkar/Monitoring_script/report"
+try:
+    from pypdf import PdfWriter  # optional: merges pages rendered in parallel
+except ImportError:
+    PdfWriter = None
+
+import storage
+
+REPORT_DIR = os.getenv("REPORT_DIR", "/home/onkar/Monitoring_script/report")
 os.makedirs(REPORT_DIR, exist_ok=True)
 
+NETWORK_HOSTS = ['Google DNS', 'Cloudflare DNS', 'Local Gateway']
+
+# Rows of different hosts within one bucket are treated as the same probe cycle
+ALIGN_SECONDS = 180
+
 SYSTEM_THRESHOLDS = {
     'cpu_usage': 80.0,
     'ram_usage': 80.0,
@@ -19,93 +38,204 @@ SYSTEM_THRESHOLDS = {
     'temperature': 60.0
 }
 
-def fetch_network_data(start_time, end_time):
-    conn = sqlite3.connect(DB_PATH)
-    query = '''
-        SELECT timestamp, host, latency, jitter, packet_loss, status FROM network_logs
-        WHERE timestamp BETWEEN ? AND ?
-        ORDER BY timestamp ASC
-    '''
-    df = pd.read_sql_query(query, conn, params=(start_time, end_time), parse_dates=['timestamp'])
-    conn.close()
-    return df
-
-def fetch_system_util_data(start_time, end_time):
-    conn = sqlite3.connect(DB_PATH)
-    query = '''
-        SELECT timestamp, 
-               cpu_temp AS temperature, 
-               cpu_usage, 
-               ram_usage, 
-               storage_usage 
-        FROM system_resources
-        WHERE timestamp BETWEEN ? AND ?
-        ORDER BY timestamp ASC
-    '''
-    df = pd.read_sql_query(query, conn, params=(start_time, end_time), parse_dates=['timestamp'])
-    conn.close()
-    return df
-
-
-def plot_metric(df, metric, pdf, start, end):
-    plt.figure(figsize=(10, 5))
-    for host in df['host'].unique():
-        subset = df[df['host'] == host]
-        plt.plot(subset['timestamp'], subset[metric], label=host)
-    plt.title(f"{metric.title()} Over Time")
-    plt.xlabel("Time")
-    plt.ylabel(metric.title())
-    plt.xticks(rotation=45)
-    plt.grid(True)
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-    plt.legend()
-    plt.figtext(0.99, 0.05,
-                f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nPeriod: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}\n\n",
-                horizontalalignment='right', fontsize=8)
-    pdf.savefig()
-    plt.close()
-
-def plot_availability(df, pdf, start, end):
-    df_status = df[df['host'] == 'Google DNS'].copy()
-    df_status['availability'] = df_status['status'].apply(lambda x: 1 if x == 'UP' else 0)
-    plt.figure(figsize=(10, 3))
-    plt.plot(df_status['timestamp'], df_status['availability'], drawstyle='steps-post', marker='o', color='green')
-    plt.title("Internet Availability")
-    plt.xlabel("Time")
-    plt.ylabel("Availability")
-    plt.xticks(rotation=45)
-    plt.ylim(-0.1, 1.1)
-    plt.grid(True)
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-    plt.figtext(0.99, 0.05,
-                f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nPeriod: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}\n\n",
-                horizontalalignment='right', fontsize=8)
-    pdf.savefig()
-    plt.close()
+# Processes used to render report pages; 1 renders serially in this process
+RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", str(os.cpu_count() or 1)))
 
-def plot_system_util(df, metric, pdf, start, end):
-    plt.figure(figsize=(10, 5))
-    plt.plot(df['timestamp'], df[metric], label=metric, color='orange')
+# Ranges up to this long (today, yesterday, last 24 hours) always read raw rows, so their
+# charts keep every latency and loss spike
+RAW_MAX_SPAN = timedelta(days=1)
+
+# Longer ranges use a rollup only if it still gives at least this many points over the range
+MIN_PLOT_POINTS = 120
+
+# Each plotted line is downsampled to about this many points before drawing
+MAX_PLOT_POINTS = int(os.getenv("REPORT_MAX_PLOT_POINTS", "1000"))
+
+# Rows read from the database per chunk while building a report
+FETCH_CHUNK_ROWS = int(os.getenv("REPORT_CHUNK_ROWS", "5000"))
+
+def pick_resolution(start, end):
+    """Returns the coarsest rollup resolution (seconds) giving enough points, or None for raw rows."""
+    if end - start <= RAW_MAX_SPAN:
+        return None
+    span = (end - start).total_seconds()
+    for resolution in sorted(storage.ROLLUP_RESOLUTIONS, reverse=True):
+        if span / resolution >= MIN_PLOT_POINTS:
+            return resolution
+    return None
+
+def _iter_range(raw_query, rollup_query, start, end, chunk_rows):
+    """Yields the range as DataFrames of at most chunk_rows rows, in time order."""
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    resolution = pick_resolution(start, end)
+    if resolution is None:
+        query, params = raw_query, (start_ts, end_ts)
+    else:
+        query, params = rollup_query, (resolution, start_ts - start_ts % resolution, end_ts)
+    conn = storage.connect_readonly()
+    try:
+        yield from pd.read_sql_query(query, conn, params=params, parse_dates=['timestamp'], chunksize=chunk_rows)
+    finally:
+        conn.close()
+
+def _read_range(raw_query, rollup_query, start, end):
+    return pd.concat(_iter_range(raw_query, rollup_query, start, end, FETCH_CHUNK_ROWS), ignore_index=True)
+
+def fetch_network_data(start, end):
+    return _read_range(storage.NETWORK_RANGE_QUERY, storage.NETWORK_ROLLUP_QUERY, start, end)
+
+def fetch_system_util_data(start, end):
+    return _read_range(storage.SYSTEM_RANGE_QUERY, storage.SYSTEM_ROLLUP_QUERY, start, end)
+
+def _time_formatter(start, end):
+    return mdates.DateFormatter('%H:%M' if end - start <= timedelta(days=1) else '%m-%d')
+
+
+def split_by_host(df):
+    """Groups the network frame by host once; every page reuses the result."""
+    return dict(tuple(df.groupby('host', sort=False))) if not df.empty else {}
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of n_out points (first and last included)
+    that keep the visual shape of the line through x, y.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 buckets between the end points
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def downsample(df, column, max_points=None, threshold=None):
+    """
+    Reduces df to about max_points rows for plotting column with LTTB. The first NaN of
+    each gap is kept so the line still breaks there, and the peak of every excursion
+    to or above threshold is kept so threshold spikes survive.
+    """
+    max_points = MAX_PLOT_POINTS if max_points is None else max_points
+    if len(df) <= max_points:
+        return df
+    values = df[column].to_numpy(dtype=float)
+    missing = np.isnan(values)
+    finite = np.flatnonzero(~missing)
+    x = df['timestamp'].to_numpy().astype('int64')[finite].astype(float)
+    y = values[finite]
+    keep = [finite[lttb_indices(x, y, max_points)],
+            np.flatnonzero(missing & ~np.r_[True, missing[:-1]])]
+    if threshold is not None:
+        above = np.flatnonzero(y >= threshold)
+        if len(above):
+            runs = np.split(above, np.flatnonzero(np.diff(above) > 1) + 1)
+            keep.append(finite[[run[y[run].argmax()] for run in runs]])
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+def status_changes(df, max_points=None):
+    """Keeps only the rows where status changes (plus the last one), for step plots of long ranges."""
+    max_points = MAX_PLOT_POINTS if max_points is None else max_points
+    if len(df) <= max_points:
+        return df
+    status = df['status'].to_numpy()
+    changed = np.r_[True, status[1:] != status[:-1]]
+    changed[-1] = True
+    return df[changed]
+
+# One figure per page layout per process, cleared and redrawn for every page
+_templates = {}
+_render_lock = threading.Lock()
+
+def _page_figure(layout, figsize):
+    template = _templates.get(layout)
+    if template is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        template = _templates[layout] = (fig, fig.add_subplot())
+    fig, ax = template
+    ax.clear()
+    for text in list(fig.texts):
+        text.remove()
+    return fig, ax
+
+def _style_time_axes(fig, ax, start, end, xlabel="Time"):
+    ax.set_xlabel(xlabel)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True)
+    ax.xaxis.set_major_formatter(_time_formatter(start, end))
+    fig.text(0.99, 0.05,
+             f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nPeriod: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}\n\n",
+             horizontalalignment='right', fontsize=8)
+
+def draw_metric(by_host, metric, start, end):
+    fig, ax = _page_figure('wide', (10, 5))
+    for host, subset in by_host.items():
+        ax.plot(subset['timestamp'], subset[metric], label=host)
+    ax.set_title(f"{metric.title()} Over Time")
+    ax.set_ylabel(metric.title())
+    _style_time_axes(fig, ax, start, end)
+    ax.legend()
+    return fig
+
+def draw_availability(df_status, start, end):
+    fig, ax = _page_figure('strip', (10, 3))
+    availability = (df_status['status'].to_numpy() == 'UP').astype(int)
+    ax.plot(df_status['timestamp'], availability, drawstyle='steps-post', marker='o', color='green')
+    ax.set_title("Internet Availability")
+    ax.set_ylabel("Availability")
+    ax.set_ylim(-0.1, 1.1)
+    _style_time_axes(fig, ax, start, end)
+    return fig
+
+def draw_system_util(df, metric, start, end):
+    fig, ax = _page_figure('wide', (10, 5))
+    ax.plot(df['timestamp'], df[metric], label=metric, color='orange')
     if metric in SYSTEM_THRESHOLDS:
-        plt.axhline(y=SYSTEM_THRESHOLDS[metric], color='red', linestyle='--', label=f"Threshold {SYSTEM_THRESHOLDS[metric]}")
-    plt.title(f"System {metric.replace('_', ' ').title()} Over Time")
-    plt.xlabel("Time")
-    plt.ylabel(metric.replace('_', ' ').title())
-    plt.xticks(rotation=45)
-    plt.grid(True)
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-    plt.legend()
-    plt.figtext(0.99, 0.05,
-                f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nPeriod: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}\n\n",
-                horizontalalignment='right', fontsize=8)
-    pdf.savefig()
-    plt.close()
-
-def classify_downtime(df):
-    df_pivot = df.pivot(index='timestamp', columns='host', values='status').fillna('DOWN')
-    no_electricity = df_pivot.apply(lambda row: all(row[h] == 'DOWN' for h in ['Google DNS', 'Cloudflare DNS', 'Local Gateway']), axis=1)
-    no_internet = df_pivot.apply(lambda row: (row['Google DNS'] == 'DOWN' and row['Cloudflare DNS'] == 'DOWN') and row['Local Gateway'] == 'UP', axis=1)
-    return no_electricity.sum(), no_internet.sum(), df_pivot.shape[0]
+        ax.axhline(y=SYSTEM_THRESHOLDS[metric], color='red', linestyle='--', label=f"Threshold {SYSTEM_THRESHOLDS[metric]}")
+    ax.set_title(f"System {metric.replace('_', ' ').title()} Over Time")
+    ax.set_ylabel(metric.replace('_', ' ').title())
+    _style_time_axes(fig, ax, start, end)
+    ax.legend()
+    return fig
+
+def plot_metric(df, metric, pdf, start, end, by_host=None):
+    by_host = split_by_host(df) if by_host is None else by_host
+    pdf.savefig(draw_metric(by_host, metric, start, end))
+
+def plot_availability(df, pdf, start, end, by_host=None):
+    by_host = split_by_host(df) if by_host is None else by_host
+    pdf.savefig(draw_availability(by_host.get('Google DNS', df.iloc[0:0]), start, end))
+
+def plot_system_util(df, metric, pdf, start, end):
+    pdf.savefig(draw_system_util(df, metric, start, end))
+
+def classify_downtime(df, bucket_seconds=ALIGN_SECONDS):
+    """
+    Aligns the hosts on bucket_seconds-wide time buckets (a host is UP in a bucket if any
+    of its rows there is UP; a host missing from a bucket counts as DOWN) and classifies
+    each bucket with NumPy boolean ops.
+    Returns (no electricity buckets, internet down buckets, total buckets).
+    """
+    if df.empty:
+        return 0, 0, 0
+    aligned = pd.DataFrame({
+        'bucket': df['timestamp'].dt.floor(f"{bucket_seconds}s"),
+        'host': df['host'],
+        'up': df['status'].to_numpy() == 'UP',
+    })
+    grid = aligned.groupby(['bucket', 'host'])['up'].max().unstack('host').reindex(columns=NETWORK_HOSTS)
+    up = grid.fillna(False).to_numpy(dtype=bool)
+    google, cloudflare, gateway = up[:, 0], up[:, 1], up[:, 2]
+    no_electricity = ~(google | cloudflare | gateway)
+    no_internet = ~google & ~cloudflare & gateway
+    return int(no_electricity.sum()), int(no_internet.sum()), up.shape[0]
 
 def summarize_system_util(df):
     return {
@@ -115,57 +245,215 @@ def summarize_system_util(df):
         'avg_temp': df['temperature'].mean()
     }
 
-def add_summary_page(df_net, df_sys, pdf, start, end):
-    df_google = df_net[df_net['host'] == 'Google DNS'].copy()
+def summary_stats(df_net, df_sys, by_host=None):
+    """The figures on the summary page, computed from whole frames."""
+    by_host = split_by_host(df_net) if by_host is None else by_host
+    df_google = by_host.get('Google DNS', df_net.iloc[0:0])
     total_entries = len(df_google)
     if total_entries == 0:
         uptime_pct = 0
         downtime_pct = 0
+    elif 'up_count' in df_google:
+        # Rollup rows: weight each bucket by its sample count
+        uptime_pct = (df_google['up_count'].sum() / df_google['samples'].sum()) * 100
+        downtime_pct = 100 - uptime_pct
     else:
         up_count = df_google[df_google['status'] == 'UP'].shape[0]
         uptime_pct = (up_count / total_entries) * 100
         downtime_pct = 100 - uptime_pct
 
-    avg_latency = df_google['latency'].mean()
-    avg_jitter = df_google['jitter'].mean()
-    avg_packet_loss = df_google['packet_loss'].mean()
-
     no_elec_count, no_internet_count, total_net = classify_downtime(df_net)
     no_elec_pct = (no_elec_count / total_net) * 100 if total_net else 0
     no_internet_pct = (no_internet_count / total_net) * 100 if total_net else 0
 
     system_stats = summarize_system_util(df_sys) if not df_sys.empty else {'avg_cpu': 0, 'avg_ram': 0, 'avg_storage': 0, 'avg_temp': 0}
+    return dict(system_stats, uptime_pct=uptime_pct, downtime_pct=downtime_pct,
+                no_elec_pct=no_elec_pct, no_internet_pct=no_internet_pct)
 
-    plt.figure(figsize=(10, 6))
-    plt.axis('off')
+def draw_summary(stats, start, end):
+    fig, ax = _page_figure('summary', (10, 6))
+    ax.axis('off')
     summary_text = f"""
 📊 Network & System Report Summary
 
 🕒 Time Period: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}
 📅 Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
-📶 Internet Uptime: {uptime_pct:.2f}%
-📉 Internet Downtime: {downtime_pct:.2f}%
-⚠️ No Electricity: {no_elec_pct:.2f}%
-📡 Internet Down (Electricity Present): {no_internet_pct:.2f}%
+📶 Internet Uptime: {stats['uptime_pct']:.2f}%
+📉 Internet Downtime: {stats['downtime_pct']:.2f}%
+⚠️ No Electricity: {stats['no_elec_pct']:.2f}%
+📡 Internet Down (Electricity Present): {stats['no_internet_pct']:.2f}%
 
-🧠 Avg CPU Usage: {system_stats['avg_cpu']:.2f}%
-🧠 Avg RAM Usage: {system_stats['avg_ram']:.2f}%
-💾 Avg Storage Usage: {system_stats['avg_storage']:.2f}%
-🌡️ Avg Temperature: {system_stats['avg_temp']:.2f}°C
+🧠 Avg CPU Usage: {stats['avg_cpu']:.2f}%
+🧠 Avg RAM Usage: {stats['avg_ram']:.2f}%
+💾 Avg Storage Usage: {stats['avg_storage']:.2f}%
+🌡️ Avg Temperature: {stats['avg_temp']:.2f}°C
     """
-    plt.text(0, 0.5, summary_text, fontsize=12, va='center')
-    pdf.savefig()
-    plt.close()
+    ax.text(0, 0.5, summary_text, fontsize=12, va='center')
+    return fig
 
-def generate_report(time_range='today', custom_date=None):
-    now = datetime.now()
+def add_summary_page(df_net, df_sys, pdf, start, end, by_host=None):
+    pdf.savefig(draw_summary(summary_stats(df_net, df_sys, by_host), start, end))
+
+def _first_per_bucket(positions, bucket):
+    """The first of positions in each run of equal bucket ids."""
+    b = bucket[positions]
+    return positions[np.r_[True, b[1:] != b[:-1]]] if len(positions) else positions
+
+def _envelope(df, columns, start, width):
+    """
+    Keeps, for each width-wide time bucket and each column, the rows holding the minimum
+    and the maximum and the first row of any gap. 'status' is enveloped as UP = 1.
+    df must be in time order.
+    """
+    if df.empty:
+        return df
+    bucket = ((df['timestamp'] - start) // width).to_numpy()
+    keep = []
+    for column in columns:
+        if column == 'status':
+            values = (df['status'].to_numpy() == 'UP').astype(float)
+        else:
+            values = df[column].to_numpy(dtype=float)
+        finite = ~np.isnan(values)
+        ranked = np.flatnonzero(finite)
+        ranked = ranked[np.lexsort((values[ranked], bucket[ranked]))]  # by bucket, then value
+        lowest = _first_per_bucket(ranked, bucket)
+        highest = _first_per_bucket(ranked[::-1], bucket)
+        gaps = _first_per_bucket(np.flatnonzero(~finite & np.r_[True, finite[:-1]]), bucket)
+        keep += [lowest, highest, gaps]
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+class ReportAccumulator:
+    """
+    Folds a report range chunk by chunk into the summary figures and min/max envelopes of
+    the plotted series, so memory depends on MAX_PLOT_POINTS rather than on the range length.
+    """
+
+    NETWORK_COLUMNS = ['latency', 'jitter', 'packet_loss', 'status']
+    SYSTEM_COLUMNS = ['cpu_usage', 'ram_usage', 'storage_usage', 'temperature']
+
+    def __init__(self, start, end, max_points=None):
+        self.start = pd.Timestamp(start)
+        self.width = max((pd.Timestamp(end) - self.start) / (MAX_PLOT_POINTS if max_points is None else max_points),
+                         pd.Timedelta(seconds=1))
+        self.network_rows = 0
+        self.system_rows = 0
+        # Envelopes of each chunk; chunks arrive in time order, so only the bucket at a
+        # chunk edge can be kept twice and the lists stay bounded by the bucket count
+        self._network = {}  # host -> [envelope frames]
+        self._system = []
+        self._google_rows = 0
+        self._google_samples = 0
+        self._google_up = 0
+        self._downtime = [0, 0, 0]
+        self._open_bucket = None  # rows of the last ALIGN_SECONDS bucket, completed by the next chunk
+        self._system_sums = {column: 0.0 for column in self.SYSTEM_COLUMNS}
+        self._system_counts = {column: 0 for column in self.SYSTEM_COLUMNS}
+
+    @property
+    def empty(self):
+        return not (self.network_rows or self.system_rows)
+
+    def add_network(self, chunk):
+        if chunk.empty:
+            return
+        self.network_rows += len(chunk)
+        for host, rows in split_by_host(chunk).items():
+            self._network.setdefault(host, []).append(_envelope(rows, self.NETWORK_COLUMNS, self.start, self.width))
+            if host == 'Google DNS':
+                self._google_rows += len(rows)
+                if 'up_count' in rows:
+                    self._google_up += rows['up_count'].sum()
+                    self._google_samples += rows['samples'].sum()
+                else:
+                    self._google_up += int((rows['status'] == 'UP').sum())
+                    self._google_samples += len(rows)
+
+        # A bucket may continue in the next chunk; classify it once it is complete
+        if self._open_bucket is not None:
+            chunk = pd.concat([self._open_bucket, chunk])
+        bucket = chunk['timestamp'].dt.floor(f"{ALIGN_SECONDS}s")
+        last = (bucket == bucket.iloc[-1]).to_numpy()
+        self._open_bucket = chunk[last]
+        self._classify(chunk[~last])
+
+    def _classify(self, rows):
+        for i, count in enumerate(classify_downtime(rows)):
+            self._downtime[i] += count
+
+    def add_system(self, chunk):
+        if chunk.empty:
+            return
+        self.system_rows += len(chunk)
+        for column in self.SYSTEM_COLUMNS:
+            values = chunk[column]
+            self._system_sums[column] += values.sum()
+            self._system_counts[column] += int(values.count())
+        self._system.append(_envelope(chunk, self.SYSTEM_COLUMNS, self.start, self.width))
+
+    def finish(self):
+        if self._open_bucket is not None:
+            self._classify(self._open_bucket)
+            self._open_bucket = None
+        return self
+
+    def _mean(self, column):
+        count = self._system_counts[column]
+        return self._system_sums[column] / count if count else float('nan')
+
+    def summary(self):
+        """The same figures summary_stats() gives for the whole range."""
+        if self._google_rows == 0:
+            uptime_pct = downtime_pct = 0
+        else:
+            uptime_pct = (self._google_up / self._google_samples) * 100
+            downtime_pct = 100 - uptime_pct
+        no_elec_count, no_internet_count, total_net = self._downtime
+        if self.system_rows:
+            system_stats = {'avg_cpu': self._mean('cpu_usage'), 'avg_ram': self._mean('ram_usage'),
+                            'avg_storage': self._mean('storage_usage'), 'avg_temp': self._mean('temperature')}
+        else:
+            system_stats = {'avg_cpu': 0, 'avg_ram': 0, 'avg_storage': 0, 'avg_temp': 0}
+        return dict(system_stats, uptime_pct=uptime_pct, downtime_pct=downtime_pct,
+                    no_elec_pct=(no_elec_count / total_net) * 100 if total_net else 0,
+                    no_internet_pct=(no_internet_count / total_net) * 100 if total_net else 0)
+
+    def network_frame(self):
+        """Envelope rows of every host, in time order, for the chart pages."""
+        if not self._network:
+            return pd.DataFrame(columns=['timestamp', 'host'] + self.NETWORK_COLUMNS)
+        hosts = [_envelope(pd.concat(frames), self.NETWORK_COLUMNS, self.start, self.width)
+                 for frames in self._network.values()]
+        return pd.concat(hosts).sort_values('timestamp', kind='stable')
+
+    def system_frame(self):
+        if not self._system:
+            return pd.DataFrame(columns=['timestamp'] + self.SYSTEM_COLUMNS)
+        return _envelope(pd.concat(self._system), self.SYSTEM_COLUMNS, self.start, self.width)
+
+def collect_report_data(start, end, chunk_rows=None):
+    """Streams the range out of the database into a ReportAccumulator."""
+    chunk_rows = chunk_rows or FETCH_CHUNK_ROWS
+    data = ReportAccumulator(start, end)
+    for chunk in _iter_range(storage.NETWORK_RANGE_QUERY, storage.NETWORK_ROLLUP_QUERY, start, end, chunk_rows):
+        data.add_network(chunk)
+    for chunk in _iter_range(storage.SYSTEM_RANGE_QUERY, storage.SYSTEM_ROLLUP_QUERY, start, end, chunk_rows):
+        data.add_system(chunk)
+    return data.finish()
+
+def resolve_range(time_range='today', custom_date=None, now=None):
+    """Returns the (start, end) datetimes a report range covers."""
+    now = now or datetime.now()
     if time_range == 'last_hour':
         start = now - timedelta(hours=1)
         end = now
     elif time_range == 'last_24_hours':
         start = now - timedelta(days=1)
         end = now
+    elif time_range in ('last_7_days', 'last_30_days'):
+        start = now - timedelta(days=7 if time_range == 'last_7_days' else 30)
+        end = now
     elif time_range == 'today':
         start = datetime(now.year, now.month, now.day)
         end = now
@@ -180,35 +468,215 @@ def generate_report(time_range='today', custom_date=None):
             raise ValueError("Invalid custom date format. Use YYYY-MM-DD.")
     else:
         raise ValueError("Invalid time_range or missing custom_date.")
+    return start, end
 
-    df_net = fetch_network_data(start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
-    df_sys = fetch_system_util_data(start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+# --- Report cache ---
+# Bump when report layout changes so cached PDFs from older code aren't served
+REPORT_FORMAT_VERSION = 1
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# An open-range report (last hour, today, ...) is reused for at most this many seconds
+OPEN_RANGE_BUCKET = int(os.getenv("REPORT_OPEN_RANGE_BUCKET", "60"))
 
-    if df_net.empty and df_sys.empty:
-        return None
+cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
 
-    filename = f"network_report_{start.strftime('%Y%m%d_%H%M%S')}.pdf"
-    report_path = os.path.join(REPORT_DIR, filename)
+def data_watermark():
+    """Highest row id in each raw table; changes whenever new samples are committed."""
+    conn = storage.connect_readonly()
+    try:
+        return tuple(conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+                     for table in storage.TIMESTAMPED_TABLES)
+    finally:
+        conn.close()
+
+def range_watermark(start, end):
+    """
+    What a closed range's report is drawn from: the newest raw row in it, or for a range
+    read from rollups the number of samples folded into them. Rows flushed after the range
+    ended, or a rollup catching up, change it.
+    """
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    resolution = pick_resolution(start, end)
+    conn = storage.connect_readonly()
+    try:
+        if resolution is None:
+            return tuple(conn.execute(f"SELECT MAX(ts) FROM {table} WHERE ts BETWEEN ? AND ?",
+                                      (start_ts, end_ts)).fetchone()[0]
+                         for table in storage.TIMESTAMPED_TABLES)
+        return tuple(conn.execute(f"SELECT SUM(samples) FROM {table} WHERE resolution = ? AND bucket BETWEEN ? AND ?",
+                                  (resolution, start_ts - start_ts % resolution, end_ts)).fetchone()[0]
+                     for table in ('network_rollup', 'system_rollup'))
+    finally:
+        conn.close()
 
-    with PdfPages(report_path) as pdf:
-        add_summary_page(df_net, df_sys, pdf, start, end)
+def report_cache_key(start, end, options, now):
+    """
+    Keyed on the bounds, not the range name, so a custom date and "yesterday" share one
+    entry. A closed range (it ended before now) is keyed on its range watermark, so a
+    batch written after it ended still gets into the report. An open range is keyed on the
+    data watermark, so it is rebuilt once new rows have arrived, and on the
+    OPEN_RANGE_BUCKET its bounds fall in, so its period stays current even when the
+    collectors have stopped writing.
+    """
+    parts = {'options': options}
+    if end < now:
+        parts.update(start=start.isoformat(), end=end.isoformat(), watermark=range_watermark(start, end))
+    else:
+        parts['watermark'] = data_watermark()
+        parts['bucket'] = [int(start.timestamp()) // OPEN_RANGE_BUCKET, int(min(end, now).timestamp()) // OPEN_RANGE_BUCKET]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
 
-        if not df_net.empty:
-            for metric in ['latency', 'jitter', 'packet_loss']:
-                plot_metric(df_net, metric, pdf, start, end)
-            plot_availability(df_net, pdf, start, end)
+def _cached_report(key):
+    suffix = f"_{key}.pdf"
+    for fname in os.listdir(REPORT_DIR):
+        if fname.endswith(suffix):
+            return os.path.join(REPORT_DIR, fname)
+    return None
 
-        if not df_sys.empty:
-            for metric in ['cpu_usage', 'ram_usage', 'storage_usage', 'temperature']:
-                plot_system_util(df_sys, metric, pdf, start, end)
+def get_cache_stats():
+    return dict(cache_stats)
 
-    return report_path
+def report_pages(df_net, df_sys, start, end, summary=None):
+    """
+    The report as an ordered list of (page name, draw function, args). summary holds
+    precomputed summary figures when the frames are already reduced for plotting.
+    """
+    net_by_host = split_by_host(df_net)
+    summary = summary_stats(df_net, df_sys, net_by_host) if summary is None else summary
+    pages = [('summary', draw_summary, (summary, start, end))]
+    # Chart pages get downsampled series
+    if not df_net.empty:
+        for metric in ['latency', 'jitter', 'packet_loss']:
+            series = {host: downsample(subset, metric) for host, subset in net_by_host.items()}
+            pages.append((metric, draw_metric, (series, metric, start, end)))
+        df_status = status_changes(net_by_host.get('Google DNS', df_net.iloc[0:0]))
+        pages.append(('availability', draw_availability, (df_status, start, end)))
+    if not df_sys.empty:
+        for metric in ['cpu_usage', 'ram_usage', 'storage_usage', 'temperature']:
+            series = downsample(df_sys, metric, threshold=SYSTEM_THRESHOLDS.get(metric))
+            pages.append((metric, draw_system_util, (series, metric, start, end)))
+    return pages
+
+def _render_pages(pages, path):
+    """Draws pages into one PDF at path. Returns [(page name, seconds)]."""
+    timings = []
+    with PdfPages(path) as pdf:
+        for name, draw, args in pages:
+            started = time.perf_counter()
+            pdf.savefig(draw(*args))
+            timings.append((name, time.perf_counter() - started))
+    return timings
+
+_render_pools = {}  # worker count -> long-lived ProcessPoolExecutor
+_render_pools_lock = threading.Lock()
+
+def _warm_up_renderer():
+    """Pool initializer: loads the Agg canvas and fonts once per worker instead of on its first page."""
+    FigureCanvasAgg(Figure()).draw()
+
+def _render_pool(workers):
+    """
+    The render pool for `workers` processes, started on first use and kept for later
+    reports. Workers come from a forkserver rather than a fork of this process: the bot
+    runs many threads, and a fork can copy a lock (logging, sqlite, matplotlib) that one
+    of them holds, leaving the child deadlocked.
+    """
+    with _render_pools_lock:
+        pool = _render_pools.get(workers)
+        if pool is None:
+            context = multiprocessing.get_context("forkserver")
+            #   The server imports pandas/matplotlib once; every worker forks from it already loaded
+            context.set_forkserver_preload([__name__])
+            pool = _render_pools[workers] = ProcessPoolExecutor(workers, mp_context=context,
+                                                                initializer=_warm_up_renderer)
+        return pool
+
+def _render_parallel(pages, report_path, workers):
+    # Contiguous chunks keep page order and let each worker reuse its figures across pages
+    size = -(-len(pages) // workers)
+    chunks = [pages[i:i + size] for i in range(0, len(pages), size)]
+    parts = [f"{report_path}.part{i}" for i in range(len(chunks))]
+    try:
+        pool = _render_pool(workers)
+        timings = [t for chunk_timings in pool.map(_render_pages, chunks, parts) for t in chunk_timings]
+        writer = PdfWriter()
+        for part in parts:
+            writer.append(part)
+        with open(report_path, "wb") as f:
+            writer.write(f)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+    return timings
+
+def render_report(df_net, df_sys, start, end, report_path, workers=None, summary=None):
+    """
+    Renders the report pages into report_path, split across up to `workers` processes
+    when pypdf is available to merge the parts. Returns [(page name, seconds)].
+    """
+    pages = report_pages(df_net, df_sys, start, end, summary)
+    workers = min(RENDER_WORKERS if workers is None else workers, len(pages))
+    started = time.perf_counter()
+    if workers > 1 and PdfWriter is not None:
+        timings = _render_parallel(pages, report_path, workers)
+    else:
+        workers = 1
+        with _render_lock:
+            timings = _render_pages(pages, report_path)
+    total = time.perf_counter() - started
+    logging.info(f"Rendered {len(pages)} pages in {total:.2f}s with {workers} worker(s): "
+                 + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings))
+    return timings
 
-def purge_old_reports():
+def generate_report(time_range='today', custom_date=None, use_cache=True):
     now = datetime.now()
+    start, end = resolve_range(time_range, custom_date, now)
+    options = {'version': REPORT_FORMAT_VERSION, 'min_points': MIN_PLOT_POINTS, 'max_points': MAX_PLOT_POINTS}
+    key = report_cache_key(start, end, options, now)
+
+    if use_cache:
+        cached = _cached_report(key)
+        if cached:
+            cache_stats['hits'] += 1
+            os.utime(cached)  # LRU: mtime is the last use
+            return cached
+        cache_stats['misses'] += 1
+
+    data = collect_report_data(start, end)
+    if data.empty:
+        return None
+
+    filename = f"network_report_{start.strftime('%Y%m%d_%H%M%S')}_{key}.pdf"
+    report_path = os.path.join(REPORT_DIR, filename)
+
+    # Render beside the final name so a concurrent reader never sees half a PDF
+    tmp_path = report_path + ".tmp"
+    render_report(data.network_frame(), data.system_frame(), start, end, tmp_path, summary=data.summary())
+    os.replace(tmp_path, report_path)
+
+    purge_old_reports()
+    return report_path
+
+def purge_old_reports(max_bytes=None):
+    """
+    Evicts least recently used reports until REPORT_DIR fits in max_bytes
+    (REPORT_CACHE_MAX_BYTES by default). Returns the number of files removed.
+    """
+    max_bytes = REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    reports = []
     for fname in os.listdir(REPORT_DIR):
         fpath = os.path.join(REPORT_DIR, fname)
-        if os.path.isfile(fpath):
-            created = datetime.fromtimestamp(os.path.getctime(fpath))
-            if (now - created).total_seconds() > 86400:
-                os.remove(fpath)
+        if os.path.isfile(fpath) and fname.endswith(".pdf"):
+            st = os.stat(fpath)
+            reports.append((st.st_mtime, st.st_size, fpath))
+    reports.sort()
+    total = sum(size for _, size, _ in reports)
+    removed = 0
+    for _, size, fpath in reports[:-1]:  # never the report just produced
+        if total <= max_bytes:
+            break
+        os.remove(fpath)
+        total -= size
+        removed += 1
+    cache_stats['evictions'] += removed
+    return removed
@@ -0,0 +1,148 @@
+# report_queue.py - Background report jobs shared by every bot user
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+REPORT_QUEUE_WORKERS = int(os.getenv("REPORT_QUEUE_WORKERS", "1"))
+LATENCY_HISTORY = 50  # Finished jobs kept for the latency figures
+
+
+class ReportJob:
+    """One report render; everyone who asks for the same range while it runs subscribes to it."""
+
+    def __init__(self, key):
+        self.key = key
+        self.state = 'queued'  # queued -> rendering -> done | failed
+        self.path = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.subscribers = []  # [notify, last state it was told about]
+        self._done = threading.Event()
+        self._notify_lock = threading.Lock()
+
+    @property
+    def wait_seconds(self):
+        return (self.started or time.monotonic()) - self.submitted
+
+    @property
+    def run_seconds(self):
+        return (self.finished or time.monotonic()) - self.started if self.started else 0.0
+
+    def wait(self, timeout=None):
+        """Blocks until the job has finished. Returns the report path (None if there was no data)."""
+        self._done.wait(timeout)
+        return self.path
+
+
+class ReportQueue:
+    """
+    Runs report renders on worker threads, one job per distinct (time_range, custom_date)
+    in flight. Subscribers are called as notify(job) on every state change.
+    """
+
+    def __init__(self, render=None, workers=REPORT_QUEUE_WORKERS):
+        self.render = render
+        self._jobs = queue.Queue()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._latencies = deque(maxlen=LATENCY_HISTORY)  # (wait, run) seconds of finished jobs
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"report-worker-{i}", daemon=True).start()
+
+    def submit(self, time_range, custom_date=None, notify=None):
+        """Queues a report, or joins the identical one already queued or rendering. Returns the job."""
+        key = (time_range, custom_date)
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is None:
+                job = self._in_flight[key] = ReportJob(key)
+                self._jobs.put(job)
+            else:
+                self.coalesced += 1
+            if notify:
+                subscriber = [notify, None]
+                job.subscribers.append(subscriber)
+        if notify:
+            self._notify_one(job, subscriber)
+        return job
+
+    def depth(self):
+        """Jobs waiting for a worker."""
+        return self._jobs.qsize()
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            in_flight = len(self._in_flight)
+        waits = [w for w, _ in latencies]
+        runs = [r for _, r in latencies]
+        return {
+            'queued': self.depth(),
+            'in_flight': in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'avg_wait': sum(waits) / len(waits) if waits else 0.0,
+            'avg_run': sum(runs) / len(runs) if runs else 0.0,
+            'max_wait': max(waits, default=0.0),
+        }
+
+    def _render(self, time_range, custom_date):
+        if self.render is None:
+            from report_generator import generate_report
+            self.render = generate_report
+        return self.render(time_range, custom_date)
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            job.state = 'rendering'
+            job.started = time.monotonic()
+            self._notify(job)
+            try:
+                job.path = self._render(*job.key)
+                job.state = 'done'
+            except Exception as e:
+                logging.error(f"Report job {job.key} failed: {e}")
+                job.error = e
+                job.state = 'failed'
+            job.finished = time.monotonic()
+            with self._lock:
+                # Later requests for this range start a new render (and hit the report cache)
+                del self._in_flight[job.key]
+                self._latencies.append((job.wait_seconds, job.run_seconds))
+                if job.state == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            logging.info(f"Report job {job.key} {job.state}: waited {job.wait_seconds:.1f}s, "
+                         f"ran {job.run_seconds:.1f}s, {len(job.subscribers)} subscriber(s), {self.depth()} queued")
+            job._done.set()
+            self._notify(job)
+
+    def _notify(self, job):
+        with self._lock:
+            subscribers = list(job.subscribers)
+        for subscriber in subscribers:
+            self._notify_one(job, subscriber)
+
+    def _notify_one(self, job, subscriber):
+        # Serialized per job so a subscriber sees each state once, in order, even when
+        # it joins while the worker is announcing a change
+        with job._notify_lock:
+            notify, seen = subscriber
+            if seen == job.state or seen in ('done', 'failed'):
+                return
+            subscriber[1] = job.state
+            try:
+                notify(job)
+            except Exception as e:
+                logging.error(f"Report job notification failed: {e}")
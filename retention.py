@@ -0,0 +1,158 @@
+# retention.py - Chunked pruning of old rows from monitoring_data.db
+import os
+import time
+import logging
+
+import storage
+
+RAW_RETENTION_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "90"))
+EVENT_RETENTION_DAYS = int(os.getenv("RETENTION_EVENT_DAYS", "365"))  # alerts and network_events
+
+#   (table, time column, extra condition, days to keep); None keeps rows forever
+RETENTION_POLICIES = [
+    ('network_logs', 'ts', None, RAW_RETENTION_DAYS),
+    ('system_resources', 'ts', None, RAW_RETENTION_DAYS),
+    ('network_rollup', 'bucket', 'resolution = 60', 30),
+    ('network_rollup', 'bucket', 'resolution = 3600', 365),
+    ('network_rollup', 'bucket', 'resolution = 86400', None),
+    ('system_rollup', 'bucket', 'resolution = 60', 30),
+    ('system_rollup', 'bucket', 'resolution = 3600', 365),
+    ('system_rollup', 'bucket', 'resolution = 86400', None),
+    #   Open alerts stay until resolved; the newest public IP is what a restart compares against
+    ('alerts', 'ts', 'resolved_at IS NOT NULL', EVENT_RETENTION_DAYS),
+    ('network_events', 'ts', "(kind != 'public_ip' OR id < (SELECT MAX(id) FROM network_events WHERE kind = 'public_ip'))",
+     EVENT_RETENTION_DAYS),
+]
+
+#   Rollup tables are WITHOUT ROWID; their rows are addressed by primary key
+ROLLUP_KEYS = {'network_rollup': "resolution, bucket, host", 'system_rollup': "resolution, bucket"}
+
+#   Each delete batch should hold the write lock for at most MAX_BATCH_SECONDS;
+#   the batch size adapts between MIN_BATCH_ROWS and MAX_BATCH_ROWS to stay under it.
+MIN_BATCH_ROWS = 100
+MAX_BATCH_ROWS = 5000
+MAX_BATCH_SECONDS = 0.2
+BATCH_PAUSE = 0.05
+MAX_RUN_SECONDS = 120  #   Whatever is left over is picked up by the next run
+#   How often the scheduler checks whether a run is due; a run skipped while the rollups
+#   catch up is retried this soon instead of a whole interval later
+RETRY_SECONDS = int(os.getenv("RETENTION_RETRY", "300"))
+
+VACUUM_STEP_PAGES = 256
+
+
+def _delete_batch(conn, table, column, condition, cutoff, limit):
+    where = f"{column} < ?" + (f" AND {condition}" if condition else "")
+    key = ROLLUP_KEYS.get(table)
+    if key is None:
+        query = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)"
+    else:
+        query = f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)"
+    return conn.execute(query, (cutoff, limit)).rowcount
+
+
+def prune_table(writer, table, column, condition, cutoff, deadline):
+    """Deletes rows older than cutoff in time-bounded batches. Returns rows deleted."""
+    deleted = 0
+    batch_rows = MIN_BATCH_ROWS
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        count = writer.execute(lambda conn: _delete_batch(conn, table, column, condition, cutoff, batch_rows))
+        elapsed = time.monotonic() - started
+        deleted += count
+        if count < batch_rows:
+            break
+        if elapsed > MAX_BATCH_SECONDS:
+            batch_rows = max(MIN_BATCH_ROWS, batch_rows // 2)
+        elif elapsed < MAX_BATCH_SECONDS / 4:
+            batch_rows = min(MAX_BATCH_ROWS, batch_rows * 2)
+        time.sleep(BATCH_PAUSE)
+    return deleted
+
+
+def _file_pages(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return page_size, page_count, freelist
+
+
+def _vacuum_step(conn):
+    if conn.execute("PRAGMA freelist_count").fetchone()[0] == 0:
+        return False
+    #   execute() steps the pragma once, which frees a single page; executescript runs it to completion
+    conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+    return True
+
+
+def incremental_vacuum(writer, deadline):
+    """
+    Returns free pages to the filesystem a few at a time. Does nothing on databases
+    created before auto_vacuum=INCREMENTAL was set; their free pages are reused by new rows.
+    """
+    if writer.execute(lambda conn: conn.execute("PRAGMA auto_vacuum").fetchone()[0]) != 2:
+        logging.info("auto_vacuum is not INCREMENTAL; run VACUUM once offline to enable file shrinking")
+        return
+    while time.monotonic() < deadline and writer.execute(_vacuum_step):
+        time.sleep(BATCH_PAUSE)
+
+
+def run_retention(now=None):
+    """
+    Applies RETENTION_POLICIES once. Returns rows deleted per table, bytes reclaimed
+    from the file, and free bytes left inside it.
+    """
+    writer = storage.get_writer()
+    if not writer.rollups_ready:
+        logging.info("Retention skipped: rollups are still catching up with history")
+        return None
+
+    now = time.time() if now is None else now
+    started = time.monotonic()
+    deadline = started + MAX_RUN_SECONDS
+    page_size, pages_before, _ = writer.execute(_file_pages)
+
+    deleted = {}
+    for table, column, condition, days in RETENTION_POLICIES:
+        if days is None:
+            continue
+        cutoff = int(now - days * 86400)
+        count = prune_table(writer, table, column, condition, cutoff, deadline)
+        deleted[table] = deleted.get(table, 0) + count
+
+    incremental_vacuum(writer, deadline)
+    _, pages_after, freelist = writer.execute(_file_pages)
+
+    result = {
+        'deleted': deleted,
+        'bytes_reclaimed': (pages_before - pages_after) * page_size,
+        'free_bytes': freelist * page_size,
+        'duration': time.monotonic() - started,
+    }
+    logging.info(f"Retention run: deleted {sum(deleted.values())} rows {deleted}, "
+                 f"reclaimed {result['bytes_reclaimed'] / 1024:.1f} KB in {result['duration']:.1f}s")
+    return result
+
+
+_last_run = None  #   Monotonic time of the last run that was not skipped
+
+
+def run_due(interval, now=None):
+    """
+    Scheduler entry point, called every RETRY_SECONDS: runs retention once `interval`
+    seconds have passed since the last completed run. Returns run_retention()'s result,
+    or None when nothing was due or the run was skipped.
+    """
+    global _last_run
+    now = time.monotonic() if now is None else now
+    if _last_run is not None and now - _last_run < interval:
+        return None
+    result = run_retention()
+    if result is not None:
+        _last_run = now
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    run_retention()
@@ -0,0 +1,196 @@
+# scheduler.py - One fixed-rate scheduler for the collectors, retention and report jobs
+import os
+import time
+import socket
+import functools
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SYSTEM_INTERVAL = float(os.getenv("SYSTEM_INTERVAL", "60"))
+NETWORK_INTERVAL = float(os.getenv("NETWORK_INTERVAL", "180"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "86400"))
+PUBLIC_IP_INTERVAL = float(os.getenv("PUBLIC_IP_INTERVAL", "300"))
+
+#   A job running longer than this many of its intervals counts as stalled; the
+#   systemd watchdog is then no longer fed and the service gets restarted
+STALL_INTERVALS = 3
+
+
+def sd_notify(state):
+    """Sends state (e.g. "READY=1") to systemd if it started us with Type=notify. Returns True if sent."""
+    address = os.getenv("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]  # abstract socket namespace
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+        return True
+    except OSError as e:
+        logging.warning(f"sd_notify failed: {e}")
+        return False
+
+
+def watchdog_interval():
+    """Half the systemd WatchdogSec in seconds, or None if the watchdog is off for this process."""
+    usec = os.getenv("WATCHDOG_USEC")
+    pid = os.getenv("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
+
+
+class Job:
+    """A function run every `interval` seconds on a fixed grid of monotonic deadlines."""
+
+    def __init__(self, name, func, interval, align=True, stall_after=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.align = align
+        self.stall_after = stall_after or interval * STALL_INTERVALS
+        self.next_due = None
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_runtime = 0.0
+        self.total_runtime = 0.0
+        self.running_since = None
+
+    def first_deadline(self, now):
+        if not self.align:
+            return now
+        #   Line the first run up with a wall-clock multiple of the interval, so
+        #   jobs with related intervals (60 s, 180 s) fire at the same instants
+        return now + (-time.time()) % self.interval
+
+    def advance(self, now):
+        """Moves to the next deadline on the grid, counting the ones already gone by as missed."""
+        self.next_due += self.interval
+        if now > self.next_due:
+            behind = int((now - self.next_due) // self.interval) + 1
+            self.missed += behind
+            self.next_due += behind * self.interval
+            logging.warning(f"Job {self.name} missed {behind} tick(s)")
+
+    def stalled(self, now):
+        return self.running_since is not None and now - self.running_since > self.stall_after
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'missed': self.missed,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'last_runtime': self.last_runtime,
+            'avg_runtime': self.total_runtime / self.runs if self.runs else 0.0,
+            'running': self.running_since is not None,
+        }
+
+
+class Scheduler:
+    """
+    Runs every job on its own fixed-rate schedule from one asyncio loop. Job functions are
+    blocking, so each run goes to a worker thread; a job never overlaps itself, and a slow
+    job delays only its own next tick.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._loop = None
+        self._stop = None
+
+    def add(self, name, func, interval, align=True, stall_after=None):
+        self.jobs[name] = Job(name, func, interval, align, stall_after)
+        return self
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def stalled(self):
+        now = time.monotonic()
+        return [job.name for job in self.jobs.values() if job.stalled(now)]
+
+    async def _run_job(self, job, pool):
+        loop = asyncio.get_running_loop()
+        job.next_due = job.first_deadline(time.monotonic())
+        while True:
+            await asyncio.sleep(max(0.0, job.next_due - time.monotonic()))
+            started = time.monotonic()
+            job.last_lag = started - job.next_due
+            job.max_lag = max(job.max_lag, job.last_lag)
+            job.running_since = started
+            try:
+                await loop.run_in_executor(pool, job.func)
+            except Exception:
+                job.failures += 1
+                logging.exception(f"Job {job.name} failed")
+            finally:
+                job.running_since = None
+                job.runs += 1
+                job.last_runtime = time.monotonic() - started
+                job.total_runtime += job.last_runtime
+            job.advance(time.monotonic())
+
+    async def _feed_watchdog(self, interval):
+        while True:
+            stalled = self.stalled()
+            if stalled:
+                logging.error(f"Jobs stalled, withholding watchdog: {', '.join(stalled)}")
+            else:
+                sd_notify("WATCHDOG=1")
+            await asyncio.sleep(interval)
+
+    async def run_async(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        with ThreadPoolExecutor(max(1, len(self.jobs)), thread_name_prefix="job") as pool:
+            tasks = [asyncio.create_task(self._run_job(job, pool)) for job in self.jobs.values()]
+            interval = watchdog_interval()
+            if interval:
+                tasks.append(asyncio.create_task(self._feed_watchdog(interval)))
+            sd_notify("READY=1")
+            logging.info(f"Scheduler started: {', '.join(f'{j.name} every {j.interval:g}s' for j in self.jobs.values())}")
+            try:
+                await self._stop.wait()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        """Runs the scheduler in this thread until stop() is called."""
+        asyncio.run(self.run_async())
+
+    def start(self):
+        """Runs the scheduler on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+
+def collector_scheduler():
+    """The system metrics, network probe, public IP and retention jobs."""
+    import module1
+    import public_ip
+    import retention
+    import system_monitor
+
+    return (Scheduler()
+            .add('system', system_monitor.log_system_metrics, SYSTEM_INTERVAL)
+            .add('network', module1.main, NETWORK_INTERVAL)
+            .add('public_ip', public_ip.resolver.refresh, PUBLIC_IP_INTERVAL, align=False)
+            .add('retention', functools.partial(retention.run_due, RETENTION_INTERVAL), retention.RETRY_SECONDS,
+                 align=False, stall_after=retention.MAX_RUN_SECONDS * 5))
+
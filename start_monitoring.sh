@@ -1,4 +1,5 @@
 #!/bin/bash
 cd /home/onkar/Monitoring_script
 source monitoring_venv/bin/activate
-python3 bot.py
+#exec so python is the service's main process and may talk to systemd (Type=notify)
+exec python3 bot.py
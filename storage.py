@@ -0,0 +1,579 @@
+# storage.py - Shared SQLite storage layer for the collectors, bot and reports
+import os
+import time
+import atexit
+import logging
+import sqlite3
+import datetime
+import threading
+import urllib.parse
+
+DB_PATH = os.getenv("MONITORING_DB_PATH", "/home/onkar/Monitoring_script/logs/monitoring_data.db")  # Database path
+
+#   Batching policy: a batch is committed when it reaches BATCH_MAX_ROWS rows
+#   or when its oldest row has waited BATCH_MAX_DELAY seconds, whichever comes first.
+BATCH_MAX_ROWS = int(os.getenv("DB_BATCH_MAX_ROWS", "100"))
+BATCH_MAX_DELAY = float(os.getenv("DB_BATCH_MAX_DELAY", "30"))
+
+#   Backfill of the epoch `ts` column on databases created before it existed
+BACKFILL_CHUNK_ROWS = 5000
+BACKFILL_PAUSE = 0.05  #   Seconds between chunks so collectors can take the write lock
+
+SCHEMA_VERSION = 4
+
+#   Rollup bucket sizes in seconds: minute, hour and day. Buckets are multiples of the size
+#   in Unix time, i.e. aligned to UTC: a day bucket runs from UTC midnight, not local
+#   midnight, and in zones with a half-hour offset hour buckets start at :30 local time
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+NETWORK_ROLLUP_METRICS = ['latency', 'jitter', 'packet_loss']
+SYSTEM_ROLLUP_METRICS = ['cpu_temp', 'cpu_usage', 'ram_usage', 'storage_usage']
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS network_logs (
+        timestamp TEXT,
+        host TEXT,
+        latency REAL,
+        jitter REAL,
+        packet_loss REAL,
+        status TEXT,
+        ts INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS system_resources (
+        timestamp TEXT,
+        cpu_temp REAL,
+        cpu_usage REAL,
+        ram_usage REAL,
+        storage_usage REAL,
+        ts INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        source TEXT PRIMARY KEY,
+        last_rowid INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER,
+        metric TEXT,
+        subject TEXT,
+        severity TEXT,
+        value REAL,
+        threshold REAL,
+        resolved_at INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS network_events (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER,
+        kind TEXT,
+        subject TEXT,
+        old_value TEXT,
+        new_value TEXT
+    )
+    ''',
+]
+
+
+def _metric_columns(metrics):
+    return ",\n".join(f"        {m}_n INTEGER, {m}_sum REAL, {m}_min REAL, {m}_max REAL" for m in metrics)
+
+
+#   min/max/count/sum per metric per bucket; averages are {m}_sum / {m}_n
+SCHEMA += [
+    f'''
+    CREATE TABLE IF NOT EXISTS network_rollup (
+        resolution INTEGER,
+        bucket INTEGER,
+        host TEXT,
+        samples INTEGER,
+        up_count INTEGER,
+        down_count INTEGER,
+{_metric_columns(NETWORK_ROLLUP_METRICS)},
+        PRIMARY KEY (resolution, bucket, host)
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS system_rollup (
+        resolution INTEGER,
+        bucket INTEGER,
+        samples INTEGER,
+{_metric_columns(SYSTEM_ROLLUP_METRICS)},
+        PRIMARY KEY (resolution, bucket)
+    ) WITHOUT ROWID
+    ''',
+]
+
+
+def _rollup_upsert(source, rollup, keys, metrics, counters):
+    """
+    Builds the statement folding source rows with rowid in (?, ?] into one rollup resolution.
+    counters maps extra count columns to the SQL expression aggregated for them.
+    """
+    columns = ['resolution', 'bucket'] + keys + ['samples'] + list(counters)
+    selects = [':resolution', '(ts / :resolution) * :resolution'] + keys + ['COUNT(*)'] + [f"SUM({expr})" for expr in counters.values()]
+    updates = [f"samples = samples + excluded.samples"] + [f"{c} = {c} + excluded.{c}" for c in counters]
+    for m in metrics:
+        columns += [f"{m}_n", f"{m}_sum", f"{m}_min", f"{m}_max"]
+        selects += [f"COUNT({m})", f"TOTAL({m})", f"MIN({m})", f"MAX({m})"]
+        updates += [
+            f"{m}_n = {m}_n + excluded.{m}_n",
+            f"{m}_sum = {m}_sum + excluded.{m}_sum",
+            f"{m}_min = min(coalesce({m}_min, excluded.{m}_min), coalesce(excluded.{m}_min, {m}_min))",
+            f"{m}_max = max(coalesce({m}_max, excluded.{m}_max), coalesce(excluded.{m}_max, {m}_max))",
+        ]
+    conflict = ", ".join(['resolution', 'bucket'] + keys)
+    group = ", ".join(['2'] + keys)
+    return (
+        f"INSERT INTO {rollup} ({', '.join(columns)}) "
+        f"SELECT {', '.join(selects)} FROM {source} "
+        f"WHERE rowid > :low AND rowid <= :high AND ts IS NOT NULL GROUP BY {group} "
+        f"ON CONFLICT ({conflict}) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+ROLLUP_UPSERTS = {
+    'network_logs': _rollup_upsert('network_logs', 'network_rollup', ['host'], NETWORK_ROLLUP_METRICS,
+                                   {'up_count': "status = 'UP'", 'down_count': "status <> 'UP'"}),
+    'system_resources': _rollup_upsert('system_resources', 'system_rollup', [], SYSTEM_ROLLUP_METRICS, {}),
+}
+
+#   `ts` holds the sample time as integer Unix epoch seconds; `timestamp` keeps the local-time text
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_network_logs_host_ts ON network_logs (host, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_network_logs_ts ON network_logs (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_system_resources_ts ON system_resources (ts)",
+    #   Alert history pages walk (ts, id) backwards; the partial index finds the open alerts to resolve
+    "CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_metric_ts ON alerts (metric, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts (metric, subject) WHERE resolved_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_network_events_kind ON network_events (kind, ts)",
+]
+
+TIMESTAMPED_TABLES = ['network_logs', 'system_resources']
+
+#   Columns added after their table first shipped: (table, column, type)
+ADDED_COLUMNS = [(table, 'ts', 'INTEGER') for table in TIMESTAMPED_TABLES] + [
+    ('network_events', 'subject', 'TEXT'),
+]
+
+#   Reader queries, kept here so the index plan can be checked in one place
+LATEST_STATUS_QUERY = "SELECT latency, jitter, packet_loss, status, timestamp FROM network_logs WHERE host = ? ORDER BY ts DESC LIMIT 1"
+
+NETWORK_RANGE_QUERY = '''
+    SELECT timestamp, host, latency, jitter, packet_loss, status FROM network_logs
+    WHERE ts BETWEEN ? AND ?
+    ORDER BY ts ASC
+'''
+
+SYSTEM_RANGE_QUERY = '''
+    SELECT timestamp,
+           cpu_temp AS temperature,
+           cpu_usage,
+           ram_usage,
+           storage_usage
+    FROM system_resources
+    WHERE ts BETWEEN ? AND ?
+    ORDER BY ts ASC
+'''
+
+NETWORK_ROLLUP_QUERY = '''
+    SELECT datetime(bucket, 'unixepoch', 'localtime') AS timestamp,
+           host,
+           latency_sum / latency_n AS latency,
+           jitter_sum / jitter_n AS jitter,
+           packet_loss_sum / packet_loss_n AS packet_loss,
+           CASE WHEN up_count * 2 >= samples THEN 'UP' ELSE 'DOWN' END AS status,
+           samples,
+           up_count
+    FROM network_rollup
+    WHERE resolution = ? AND bucket BETWEEN ? AND ?
+    ORDER BY bucket ASC
+'''
+
+SYSTEM_ROLLUP_QUERY = '''
+    SELECT datetime(bucket, 'unixepoch', 'localtime') AS timestamp,
+           cpu_temp_sum / cpu_temp_n AS temperature,
+           cpu_usage_sum / cpu_usage_n AS cpu_usage,
+           ram_usage_sum / ram_usage_n AS ram_usage,
+           storage_usage_sum / storage_usage_n AS storage_usage
+    FROM system_rollup
+    WHERE resolution = ? AND bucket BETWEEN ? AND ?
+    ORDER BY bucket ASC
+'''
+
+#   Keyset paging: each page starts strictly before the (ts, id) of the previous page's last row
+ALERT_HISTORY_QUERY = '''
+    SELECT id, ts, metric, subject, severity, value, threshold, resolved_at FROM alerts
+    WHERE ts >= ? AND (ts, id) < (?, ?)
+    ORDER BY ts DESC, id DESC
+    LIMIT ?
+'''
+
+ALERT_HISTORY_METRIC_QUERY = '''
+    SELECT id, ts, metric, subject, severity, value, threshold, resolved_at FROM alerts
+    WHERE metric = ? AND ts >= ? AND (ts, id) < (?, ?)
+    ORDER BY ts DESC, id DESC
+    LIMIT ?
+'''
+
+LAST_NETWORK_EVENT_QUERY = "SELECT new_value FROM network_events WHERE kind = ? ORDER BY ts DESC, id DESC LIMIT 1"
+
+INSERTS = {
+    'network_logs': "INSERT INTO network_logs (timestamp, ts, host, latency, jitter, packet_loss, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    'system_resources': "INSERT INTO system_resources (timestamp, ts, cpu_temp, cpu_usage, ram_usage, storage_usage) VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+
+def create_schema(conn):
+    """
+    Creates all monitoring tables if they don't exist and migrates older ones:
+    adds missing columns (e.g. `ts`) and the indexes. Filling `ts` for old rows is left to backfill_ts().
+    """
+    for statement in SCHEMA:
+        conn.execute(statement)
+    for table, column, column_type in ADDED_COLUMNS:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            logging.info(f"Migrating {table}: adding {column} column")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def now_timestamp():
+    """Returns the current time as a (local timestamp text, epoch seconds) pair for inserts."""
+    now = datetime.datetime.now().replace(microsecond=0)
+    return now.strftime("%Y-%m-%d %H:%M:%S"), int(now.timestamp())
+
+
+def backfill_ts(conn, table, chunk_rows=BACKFILL_CHUNK_ROWS):
+    """
+    Fills `ts` for one chunk of rows written before the column existed.
+    The text timestamps are local time, hence the 'utc' modifier. Returns rows updated.
+    """
+    cursor = conn.execute(
+        f"""UPDATE {table} SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE ts IS NULL LIMIT ?)""",
+        (chunk_rows,)
+    )
+    return cursor.rowcount
+
+
+def update_rollups(conn, table, chunk_rows=None):
+    """
+    Folds rows of table past the rollup watermark into every rollup resolution
+    and advances the watermark. chunk_rows caps the rows folded per call. Returns rows folded.
+    """
+    row = conn.execute("SELECT last_rowid FROM rollup_state WHERE source = ?", (table,)).fetchone()
+    low = row[0] if row else 0
+    high = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    if high < low:
+        low = 0  #   Table was emptied and rowids restarted
+    if chunk_rows is not None:
+        high = min(high, low + chunk_rows)
+    if high == low:
+        return 0
+    for resolution in ROLLUP_RESOLUTIONS:
+        conn.execute(ROLLUP_UPSERTS[table], {'resolution': resolution, 'low': low, 'high': high})
+    conn.execute(
+        "INSERT INTO rollup_state (source, last_rowid) VALUES (?, ?) ON CONFLICT (source) DO UPDATE SET last_rowid = excluded.last_rowid",
+        (table, high)
+    )
+    return high - low
+
+
+class BatchWriter:
+    """
+    Long-lived writer connection in WAL mode.
+    Rows are queued per table and written with executemany, one commit per batch.
+    """
+
+    def __init__(self, db_path, max_rows=BATCH_MAX_ROWS, max_delay=BATCH_MAX_DELAY):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        if self.conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            #   Only possible before the first table exists; lets retention shrink the file in steps
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: no fsync per commit, only at checkpoints
+        create_schema(self.conn)
+
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._pending_rows = 0
+        self._oldest = None
+        self._closed = False
+
+        self.started = time.monotonic()
+        self.rows_written = 0
+        self.commits = 0
+        self.rollups_ready = False  #   Set once run_backfill() has caught the rollups up with history
+
+        self._wakeup = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="db-flusher", daemon=True)
+        self._flusher.start()
+
+    def add(self, table, row):
+        """Queues one row for insertion into table."""
+        self.add_many(table, [row])
+
+    def add_many(self, table, rows):
+        """Queues several rows for insertion into table."""
+        if table not in INSERTS:
+            raise ValueError(f"Unknown table: {table}")
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Writer is closed")
+            self._pending.setdefault(table, []).extend(rows)
+            self._pending_rows += len(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._pending_rows >= self.max_rows:
+                self.flush()
+            else:
+                self._wakeup.set()
+
+    def flush(self):
+        """Writes every queued row in a single transaction."""
+        with self._lock:
+            if not self._pending_rows:
+                return 0
+            pending, count = self._pending, self._pending_rows
+            try:
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    for table, rows in pending.items():
+                        self.conn.executemany(INSERTS[table], rows)
+                        if self.rollups_ready:
+                            update_rollups(self.conn, table)
+            except sqlite3.Error as e:
+                logging.error(f"Batch write of {count} rows failed: {e}")
+                raise
+            self._pending = {}
+            self._pending_rows = 0
+            self._oldest = None
+            self.rows_written += count
+            self.commits += 1
+            logging.debug(f"Committed {count} rows ({self.rows_written} rows / {self.commits} commits total)")
+            return count
+
+    def execute(self, func):
+        """Runs func(conn) inside its own transaction after flushing queued rows."""
+        with self._lock:
+            self.flush()
+            with self.conn:
+                #   Take the write lock up front so reads inside func (e.g. the rollup
+                #   watermark) can't race a writer in another process
+                self.conn.execute("BEGIN IMMEDIATE")
+                return func(self.conn)
+
+    def stats(self):
+        """Returns row and commit counters, totals and per second since start."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return {
+                'rows': self.rows_written,
+                'commits': self.commits,
+                'pending': self._pending_rows,
+                'rows_per_sec': self.rows_written / elapsed,
+                'commits_per_sec': self.commits / elapsed,
+                'rows_per_commit': self.rows_written / self.commits if self.commits else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self.flush()
+            finally:
+                self._closed = True
+                self._wakeup.set()
+                self.conn.close()
+
+    def _flush_loop(self):
+        while not self._closed:
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            remaining = oldest + self.max_delay - time.monotonic()
+            if remaining > 0:
+                self._wakeup.wait(remaining)
+                self._wakeup.clear()
+                continue
+            try:
+                with self._lock:
+                    if not self._closed:
+                        self.flush()
+            except sqlite3.Error:
+                time.sleep(1)  #   Rows stay queued; retry on the next pass
+
+
+#   --- Module-level writer shared by everything in this process ---
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Returns the process-wide writer, opening it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BatchWriter(DB_PATH)
+            threading.Thread(target=run_backfill, args=(_writer,), name="ts-backfill", daemon=True).start()
+        return _writer
+
+
+def _run_chunks(writer, step, pause):
+    """Repeats step(conn) in its own transaction until it reports a short chunk."""
+    total = 0
+    while True:
+        updated, done = writer.execute(step)
+        total += updated
+        if done:
+            return total
+        time.sleep(pause)
+
+
+def run_backfill(writer, chunk_rows=BACKFILL_CHUNK_ROWS, pause=BACKFILL_PAUSE):
+    """
+    Backfills `ts`, then folds existing history into the rollup tables, in short
+    transactions one chunk at a time so the collectors keep writing while an old
+    database is migrated. Afterwards every flush maintains the rollups itself.
+    Returns rows whose `ts` was backfilled.
+    """
+    def backfill_step(table):
+        def step(conn):
+            updated = backfill_ts(conn, table, chunk_rows)
+            return updated, updated < chunk_rows
+        return step
+
+    def rollup_step(conn):
+        folded = sum(update_rollups(conn, table, chunk_rows) for table in TIMESTAMPED_TABLES)
+        if folded == 0:
+            writer.rollups_ready = True  #   Under the writer lock, so no batch slips past
+        return folded, folded == 0
+
+    total = 0
+    try:
+        for table in TIMESTAMPED_TABLES:
+            total += _run_chunks(writer, backfill_step(table), pause)
+        if total:
+            logging.info(f"Backfilled ts for {total} rows")
+        folded = _run_chunks(writer, rollup_step, pause)
+        if folded:
+            logging.info(f"Folded {folded} historical rows into rollups")
+    except (sqlite3.Error, RuntimeError) as e:
+        logging.error(f"Backfill stopped: {e}")
+    return total
+
+
+def record_alert(event):
+    """
+    Writes an alert transition. Each (metric, subject) has at most one open row: a fire or
+    an ease stamps resolved_at on the open row of the other level and opens a row for the
+    new one, so history shows critical -> warning -> resolved; a resolve closes the open
+    row. Committed right away rather than batched.
+    """
+    ts = int(event.at)
+
+    def write(conn):
+        conn.execute(
+            "UPDATE alerts SET resolved_at = ? WHERE metric = ? AND subject IS ? AND resolved_at IS NULL AND severity IS NOT ?",
+            (ts, event.metric, event.subject, event.level)
+        )
+        if event.kind != 'resolve':
+            conn.execute(
+                "INSERT INTO alerts (ts, metric, subject, severity, value, threshold) VALUES (?, ?, ?, ?, ?, ?)",
+                (ts, event.metric, event.subject, event.level, event.value, event.threshold)
+            )
+
+    get_writer().execute(write)
+
+
+def record_network_event(kind, old_value, new_value, subject=None, at=None):
+    """Records a change such as a new public IP or a link going down, committed right away."""
+    get_writer().execute(lambda conn: conn.execute(
+        "INSERT INTO network_events (ts, kind, subject, old_value, new_value) VALUES (?, ?, ?, ?, ?)",
+        (int(time.time() if at is None else at), kind, subject, old_value, new_value)
+    ))
+
+
+def last_network_event(kind):
+    """The new_value of the latest event of kind, or None."""
+    conn = connect_readonly()
+    try:
+        row = conn.execute(LAST_NETWORK_EVENT_QUERY, (kind,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def init_db():
+    """Creates the database and its tables if they don't exist."""
+    get_writer()
+
+
+def insert(table, row):
+    """Queues a row for the batched writer."""
+    get_writer().add(table, row)
+
+
+def flush():
+    """Commits any queued rows immediately."""
+    if _writer is not None:
+        _writer.flush()
+
+
+def write_stats():
+    """Returns the writer's row/commit counters (empty if nothing was written)."""
+    return _writer.stats() if _writer is not None else {}
+
+
+def close():
+    """Flushes queued rows and closes the writer connection."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def set_db_path(path):
+    """Points the storage layer at another database file, closing the current writer."""
+    global DB_PATH
+    close()
+    DB_PATH = path
+
+
+def connect_readonly():
+    """
+    Opens a read-only connection for the bot and reports.
+    WAL lets it read while the collectors are writing.
+    """
+    if not os.path.exists(DB_PATH):
+        init_db()
+    uri = f"file:{urllib.parse.quote(os.path.abspath(DB_PATH))}?mode=ro"
+    return sqlite3.connect(uri, uri=True, timeout=10, check_same_thread=False)
+
+
+atexit.register(close)
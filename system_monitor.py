@@ -3,20 +3,14 @@ import os
 import psutil
 import time
 import logging
-import sqlite3
-import datetime
-import requests  #   Import the requests module
 import socket  #   Import the socket module
+import threading
+from collections import deque
 
-#   Configure logging
-logging.basicConfig(
-    filename='system_monitor.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    encoding='utf-8'
-)
-
-DB_PATH = "/home/onkar/Monitoring_script/logs/monitoring_data.db"  #   Database path
+import storage
+import alerts
+import netlink_watcher
+import metrics_exporter
 
 #   Alert Thresholds
 WARNING_CPU_TEMP = 60
@@ -26,103 +20,374 @@ CRITICAL_RAM_USAGE = 80
 WARNING_STORAGE_USAGE = 70
 CRITICAL_STORAGE_USAGE = 80
 
-import psutil
-
-#   --- Alert Storage ---
-stored_alerts = []  #   Initialize an empty list to store alerts
-
-def get_cpu_usage():
-    return psutil.cpu_percent(interval=1)
-
-def get_ram_usage():
-    return psutil.virtual_memory().percent
-
-def get_disk_usage():
-    return psutil.disk_usage('/').percent
-
-def get_temperature():
-    try:
-        temp = psutil.sensors_temperatures().get('cpu_thermal', [{}])[0].get('current', None)
-        return temp if temp else "N/A"
-    except AttributeError:
-        return "N/A"
+#   Background sampler cadence; each collector may ask for a slower interval of its own
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", "1.0"))
+TEMP_SAMPLE_INTERVAL = float(os.getenv("TEMP_SAMPLE_INTERVAL", "10.0"))
+SAMPLE_HISTORY_SECONDS = 300  #   Long enough for the 5 min average
+AVERAGED_METRICS = ('cpu_usage', 'ram_usage', 'storage_usage', 'cpu_temp')
+
+#   --- Alert Rules ---
+#   Evaluated on every sampler tick; RAM and temperature on their 5 min / 1 min mean so a
+#   short spike doesn't page anyone, and each alert clears only once clear of the hysteresis band
+alerts.engine.add(alerts.Rule('cpu_temp', {'warning': WARNING_CPU_TEMP, 'critical': CRITICAL_CPU_TEMP},
+                              label="CPU Temperature", unit=" \u00B0C", window=60, hysteresis=3))
+alerts.engine.add(alerts.Rule('ram_usage', {'warning': WARNING_RAM_USAGE, 'critical': CRITICAL_RAM_USAGE},
+                              label="RAM Usage", window=300, hysteresis=5))
+alerts.engine.add(alerts.Rule('storage_usage', {'warning': WARNING_STORAGE_USAGE, 'critical': CRITICAL_STORAGE_USAGE},
+                              label="Storage Usage", hysteresis=2))
+
+#   --- Exported Metrics ---
+#   Sampler values published by metrics_exporter: key -> (metric name, help)
+EXPORTED_METRICS = {
+    'cpu_temp': ('cpu_temperature_celsius', "CPU temperature"),
+    'cpu_usage': ('cpu_usage_percent', "CPU usage over the last sampler interval"),
+    'ram_usage': ('ram_usage_percent', "RAM in use"),
+    'ram_used': ('ram_used_bytes', "RAM in use"),
+    'ram_total': ('ram_total_bytes', "Total RAM"),
+    'storage_usage': ('storage_usage_percent', "Root filesystem in use"),
+    'storage_used': ('storage_used_bytes', "Root filesystem in use"),
+    'storage_total': ('storage_total_bytes', "Root filesystem size"),
+    'disk_read_bps': ('disk_read_bytes_per_second', "Disk reads"),
+    'disk_write_bps': ('disk_write_bytes_per_second', "Disk writes"),
+    'net_rx_bps': ('network_receive_bytes_per_second', "Bytes received on all interfaces"),
+    'net_tx_bps': ('network_transmit_bytes_per_second', "Bytes sent on all interfaces"),
+}
 
 def create_table():
     """Creates the system_resources table if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS system_resources (
-            timestamp TEXT,
-            cpu_temp REAL,
-            cpu_usage REAL,
-            ram_usage REAL,
-            storage_usage REAL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    storage.init_db()
+
+#   --- Collectors ---
+class Collector:
+    """
+    Base class for metric collectors. A collector declares the metrics it produces and
+    how often it wants to run, and reads them straight from procfs/sysfs under `root`
+    (so tests can point it at a fixture tree). No collector may start a subprocess.
+    """
+    name = "collector"
+    metrics = ()
+    interval = SAMPLE_INTERVAL
+
+    def __init__(self, root="/", interval=None):
+        self.root = root
+        if interval is not None:
+            self.interval = interval
+        self.next_due = 0.0
+        self.calls = 0
+        self.total_seconds = 0.0
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def read(self, *parts):
+        with open(self.path(*parts)) as f:
+            return f.read()
+
+    def collect(self, now):
+        """Returns {metric: value}; a value is None when it can't be computed yet."""
+        raise NotImplementedError
+
+    def sample(self, now=None):
+        """Runs collect() and records its cost. Returns {metric: value}."""
+        now = time.monotonic() if now is None else now
+        started = time.perf_counter()
+        try:
+            values = self.collect(now)
+        except (OSError, ValueError) as e:
+            logging.error(f"{self.name} collector failed: {e}")
+            values = dict.fromkeys(self.metrics)
+        self.total_seconds += time.perf_counter() - started
+        self.calls += 1
+        self.next_due = now + self.interval
+        return values
+
+    def cost(self):
+        return {
+            'calls': self.calls,
+            'avg_us': self.total_seconds / self.calls * 1e6 if self.calls else 0.0,
+            'total_ms': self.total_seconds * 1e3,
+        }
+
+
+class RateCollector(Collector):
+    """Collector whose metrics are per-second rates of monotonically increasing counters."""
+
+    def __init__(self, root="/", interval=None):
+        super().__init__(root, interval)
+        self._previous = None
+
+    def counters(self):
+        raise NotImplementedError
+
+    def collect(self, now):
+        current = self.counters()
+        previous, self._previous = self._previous, (now, current)
+        if previous is None or now <= previous[0]:
+            return dict.fromkeys(self.metrics)
+        elapsed = now - previous[0]
+        return {m: max(0, current[m] - previous[1][m]) / elapsed for m in self.metrics}
+
+
+class ThermalCollector(Collector):
+    name = "thermal"
+    metrics = ('cpu_temp',)
+    interval = TEMP_SAMPLE_INTERVAL
+
+    def zone(self):
+        """Picks the CPU thermal zone (cpu_thermal on a Pi), else the first one."""
+        base = self.path("sys", "class", "thermal")
+        zones = sorted(z for z in os.listdir(base) if z.startswith("thermal_zone")) if os.path.isdir(base) else []
+        for zone in zones:
+            try:
+                if "cpu" in self.read("sys", "class", "thermal", zone, "type").lower():
+                    return zone
+            except OSError:
+                continue
+        return zones[0] if zones else None
+
+    def collect(self, now):
+        zone = self.zone()
+        if zone is None:
+            return {'cpu_temp': None}
+        return {'cpu_temp': int(self.read("sys", "class", "thermal", zone, "temp")) / 1000}
+
+
+class CpuCollector(Collector):
+    name = "cpu"
+    metrics = ('cpu_usage',)
+
+    def __init__(self, root="/", interval=None):
+        super().__init__(root, interval)
+        self._previous = None
+
+    def collect(self, now):
+        fields = [int(v) for v in self.read("proc", "stat").splitlines()[0].split()[1:]]
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  #   idle + iowait
+        total = sum(fields[:8])  #   guest time is already counted in user/nice
+        previous, self._previous = self._previous, (idle, total)
+        if previous is None or total <= previous[1]:
+            return {'cpu_usage': None}
+        busy = (total - previous[1]) - (idle - previous[0])
+        return {'cpu_usage': 100.0 * busy / (total - previous[1])}
+
+
+class MemoryCollector(Collector):
+    name = "memory"
+    metrics = ('ram_total', 'ram_used', 'ram_usage')
+
+    def collect(self, now):
+        info = {}
+        for line in self.read("proc", "meminfo").splitlines():
+            key, _, rest = line.partition(":")
+            info[key] = int(rest.split()[0]) * 1024
+        total = info['MemTotal']
+        available = info.get('MemAvailable', info['MemFree'] + info.get('Buffers', 0) + info.get('Cached', 0))
+        used = total - available
+        return {'ram_total': total, 'ram_used': used, 'ram_usage': 100.0 * used / total}
+
+
+class StorageCollector(Collector):
+    name = "storage"
+    metrics = ('storage_total', 'storage_used', 'storage_usage')
+    interval = 10.0
+
+    def collect(self, now):
+        st = os.statvfs(self.root)
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        available = st.f_bavail * st.f_frsize
+        #   Same formula as df: reserved blocks count as neither used nor available
+        return {'storage_total': total, 'storage_used': used, 'storage_usage': 100.0 * used / (used + available)}
+
+
+class DiskIOCollector(RateCollector):
+    name = "diskio"
+    metrics = ('disk_read_bps', 'disk_write_bps')
+    SECTOR_BYTES = 512
+
+    def counters(self):
+        block = self.path("sys", "block")
+        disks = set(os.listdir(block)) if os.path.isdir(block) else None
+        read = write = 0
+        for line in self.read("proc", "diskstats").splitlines():
+            parts = line.split()
+            name = parts[2]
+            if name.startswith(("loop", "ram")) or (disks is not None and name not in disks):
+                continue  #   Whole disks only, so partitions aren't counted twice
+            read += int(parts[5]) * self.SECTOR_BYTES
+            write += int(parts[9]) * self.SECTOR_BYTES
+        return {'disk_read_bps': read, 'disk_write_bps': write}
+
+
+class NetDevCollector(RateCollector):
+    name = "netdev"
+    metrics = ('net_rx_bps', 'net_tx_bps')
+
+    def counters(self):
+        rx = tx = 0
+        for line in self.read("proc", "net", "dev").splitlines()[2:]:
+            iface, _, data = line.partition(":")
+            if iface.strip() == "lo":
+                continue
+            fields = data.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+        return {'net_rx_bps': rx, 'net_tx_bps': tx}
+
+
+def default_collectors(root="/"):
+    return [ThermalCollector(root), CpuCollector(root), MemoryCollector(root),
+            StorageCollector(root), DiskIOCollector(root), NetDevCollector(root)]
+
+#   Extra collectors registered before the sampler starts are sampled alongside the built-ins
+COLLECTORS = []
+
+def register_collector(collector):
+    """Adds a Collector instance to the process-wide sampler's set."""
+    COLLECTORS.append(collector)
+    if _sampler is not None:
+        _sampler.collectors.append(collector)
 
 def get_cpu_temperature():
-    """Get the CPU temperature using vcgencmd (Raspberry Pi)."""
-    try:
-        res = os.popen('vcgencmd measure_temp').readline()
-        temp_str = res.replace("temp=", "").replace("'C\n", "")
-        return float(temp_str)
-    except Exception as e:
-        logging.error(f"Failed to get CPU temperature: {e}")
-        return None
+    """Get the CPU temperature from sysfs (Raspberry Pi: cpu_thermal zone)."""
+    return ThermalCollector().sample()['cpu_temp']
 
 def get_cpu_usage():
-    return psutil.cpu_percent(interval=1)
+    """Latest sampled CPU usage in percent."""
+    return get_system_snapshot()['cpu_usage']
 
 def get_ram_usage():
-    mem = psutil.virtual_memory()
-    return mem.total, mem.used, mem.percent
+    snap = get_system_snapshot()
+    return snap['ram_total'], snap['ram_used'], snap['ram_usage']
 
 def get_storage_usage():
-    disk = psutil.disk_usage('/')
-    return disk.total, disk.used, disk.percent
+    snap = get_system_snapshot()
+    return snap['storage_total'], snap['storage_used'], snap['storage_usage']
+
+def collector_costs():
+    """Per-collector call count and average/total time spent sampling."""
+    return {c.name: c.cost() for c in get_sampler().collectors}
 
 def save_to_db(cpu_temp, cpu_usage, ram_percent, storage_percent):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute(
-        "INSERT INTO system_resources (timestamp, cpu_temp, cpu_usage, ram_usage, storage_usage) VALUES (?, ?, ?, ?, ?)",
-        (timestamp, cpu_temp, cpu_usage, ram_percent, storage_percent)
-    )
-    conn.commit()
-    conn.close()
+    """Queues a system sample on the shared batched writer."""
+    timestamp, ts = storage.now_timestamp()
+    storage.insert('system_resources', (timestamp, ts, cpu_temp, cpu_usage, ram_percent, storage_percent))
 
-def check_and_send_alerts(cpu_temp, ram_percent, storage_percent):
+#   --- Background Sampler ---
+class SystemSampler:
     """
-    Checks system metrics against thresholds and logs alerts.
-    Also stores critical alerts in the stored_alerts list.
+    Runs each collector on its own interval from a daemon thread and keeps rolling
+    snapshots, so readers never wait for a measurement. Every value carries the
+    monotonic time it was sampled at.
     """
-    global stored_alerts  #   Use the global stored_alerts list
-
-    if cpu_temp is not None:
-        if cpu_temp >= CRITICAL_CPU_TEMP:
-            alert_message = f"? CRITICAL: CPU Temperature {cpu_temp:.1f} \u00B0C (Threshold: {CRITICAL_CPU_TEMP} \u00B0C)"
-            logging.critical(alert_message)
-            stored_alerts.append(alert_message)  #   Store the alert
-        elif cpu_temp >= WARNING_CPU_TEMP:
-            logging.warning(f"?? WARNING: CPU Temperature {cpu_temp:.1f} \u00B0C (Threshold: {WARNING_CPU_TEMP} \u00B0C)")
-
-    if ram_percent >= CRITICAL_RAM_USAGE:
-        alert_message = f"? CRITICAL: RAM Usage {ram_percent:.1f}% (Threshold: {CRITICAL_RAM_USAGE}%)"
-        logging.critical(alert_message)
-        stored_alerts.append(alert_message)  #   Store the alert
-    elif ram_percent >= WARNING_RAM_USAGE:
-        logging.warning(f"?? WARNING: RAM Usage {ram_percent:.1f}% (Threshold: {WARNING_RAM_USAGE}%)")
-
-    if storage_percent >= CRITICAL_STORAGE_USAGE:
-        alert_message = f"? CRITICAL: Storage Usage {storage_percent:.1f}% (Threshold: {CRITICAL_STORAGE_USAGE}%)"
-        logging.critical(alert_message)
-        stored_alerts.append(alert_message)  #   Store the alert
-    elif storage_percent >= WARNING_STORAGE_USAGE:
-        logging.warning(f"?? WARNING: Storage Usage {storage_percent:.1f}% (Threshold: {WARNING_STORAGE_USAGE}%)")
+
+    def __init__(self, collectors=None, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.collectors = collectors if collectors is not None else default_collectors() + COLLECTORS
+        self.snapshots = deque(maxlen=int(SAMPLE_HISTORY_SECONDS / interval) + 1)
+        self.values = {}  #   metric -> (value, sampled_at)
+        self._latest = None
+        self._ready = threading.Event()
+        self._thread = None
+        self.listeners = []  #   Called with every new snapshot, on the sampler thread
+
+    def start(self):
+        if self._thread is None:
+            #   Baseline for the delta-based collectors; the first real sample follows one interval later
+            now = time.monotonic()
+            for collector in self.collectors:
+                self._record(collector.sample(now), now)
+            self._thread = threading.Thread(target=self._run, name="system-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        next_run = time.monotonic()
+        while True:
+            next_run += self.interval
+            time.sleep(max(0.0, next_run - time.monotonic()))
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"System sampler error: {e}")
+
+    def _record(self, values, now):
+        for metric, value in values.items():
+            self.values[metric] = (value, now)
+
+    def sample(self, now=None):
+        """Runs every due collector and appends a snapshot."""
+        now = time.monotonic() if now is None else now
+        for collector in self.collectors:
+            if now >= collector.next_due:
+                self._record(collector.sample(now), now)
+        snapshot = {metric: value for metric, (value, _) in self.values.items()}
+        snapshot['sampled_at'] = now
+        self.snapshots.append(snapshot)
+        self._latest = snapshot
+        self._ready.set()
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logging.error(f"Sampler listener failed: {e}")
+
+    def latest(self, wait=None):
+        """Returns the newest snapshot, waiting up to `wait` seconds for the first one."""
+        if self._latest is None and wait:
+            self._ready.wait(wait)
+        return self._latest
+
+    def average(self, metric, seconds):
+        """Mean of metric over the last `seconds`, or None without samples."""
+        cutoff = time.monotonic() - seconds
+        values = [s[metric] for s in reversed(self.snapshots) if s['sampled_at'] >= cutoff and s.get(metric) is not None]
+        return sum(values) / len(values) if values else None
+
+    def snapshot(self, wait=None):
+        """
+        Latest values plus 1 s / 1 min / 5 min averages and the age of each value in seconds.
+        """
+        latest = self.latest(wait)
+        if latest is None:
+            return None
+        now = time.monotonic()
+        result = dict(latest)
+        result['age'] = {metric: now - sampled_at for metric, (_, sampled_at) in list(self.values.items())}
+        result['averages'] = {
+            metric: {'1s': self.average(metric, 1), '1m': self.average(metric, 60), '5m': self.average(metric, 300)}
+            for metric in AVERAGED_METRICS
+        }
+        return result
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def get_sampler():
+    """Returns the process-wide sampler, starting it on first use."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = SystemSampler()
+            _sampler.listeners.append(feed_alerts)
+            _sampler.listeners.append(export_metrics)
+            _sampler.start()
+        return _sampler
+
+def get_system_snapshot():
+    """Latest sampled metrics with averages and staleness; waits briefly only on the very first call."""
+    sampler = get_sampler()
+    return sampler.snapshot(wait=sampler.interval * 2 + 1)
+
+def feed_alerts(snapshot):
+    """Sampler listener: runs the alert rules on every snapshot."""
+    alerts.engine.observe_many(snapshot, now=snapshot['sampled_at'])
+
+def export_metrics(snapshot):
+    """Sampler listener: publishes the latest values for the metrics exporter."""
+    metrics_exporter.registry.set_many(snapshot, EXPORTED_METRICS)
+    metrics_exporter.registry.set('boot_time_seconds', psutil.boot_time(), "System boot time, Unix seconds")
 
 def get_uptime():
     """
@@ -151,17 +416,23 @@ def format_uptime(uptime_seconds):
 
 def log_system_metrics():
     try:
-        cpu_temp = get_cpu_temperature()
-        cpu_usage = get_cpu_usage()
-        ram_total, ram_used, ram_percent = get_ram_usage()
-        storage_total, storage_used, storage_percent = get_storage_usage()
+        snap = get_system_snapshot()
+        if snap is None:
+            logging.warning("No system sample yet, skipping this system_resources row")
+            return
+        cpu_temp = snap['cpu_temp']
+        #   Store the mean since the previous 60 s cycle rather than one instant; None (stored as
+        #   NULL) until the sampler has two CPU samples inside the window
+        cpu_usage = snap['averages']['cpu_usage']['1m']
+        ram_total, ram_used, ram_percent = snap['ram_total'], snap['ram_used'], snap['ram_usage']
+        storage_total, storage_used, storage_percent = snap['storage_total'], snap['storage_used'], snap['storage_usage']
 
         if cpu_temp is not None:
             cpu_temp_str = f"{cpu_temp:.1f} \u00B0C"  #   Display in Celsius
         else:
             cpu_temp_str = "N/A"
 
-        log_message = (f"CPU Temp: {cpu_temp_str} | CPU Usage: {cpu_usage:.1f}% | "
+        log_message = (f"CPU Temp: {cpu_temp_str} | CPU Usage: {format_percent(cpu_usage)} | "
                        f"RAM: {ram_used / (1024 ** 2):.2f} MB / {ram_total / (1024 ** 2):.2f} MB ({ram_percent:.1f}%) | "
                        f"Storage: {storage_used / (1024 ** 3):.2f} GB / {storage_total / (1024 ** 3):.2f} GB ({storage_percent:.1f}%)")
 
@@ -170,70 +441,66 @@ def log_system_metrics():
 
         save_to_db(cpu_temp, cpu_usage, ram_percent, storage_percent)
 
-        #   Preserve original functionality: Log warnings/criticals
-        if cpu_temp is not None:
-            if cpu_temp >= CRITICAL_CPU_TEMP:
-                alert_message = f"? CRITICAL: CPU Temperature {cpu_temp:.1f} \u00B0C (Threshold: {CRITICAL_CPU_TEMP} \u00B0C)"
-                logging.critical(alert_message)
-            elif cpu_temp >= WARNING_CPU_TEMP:
-                logging.warning(f"?? WARNING: CPU Temperature {cpu_temp:.1f} \u00B0C (Threshold: {WARNING_CPU_TEMP} \u00B0C)")
-
-        if ram_percent >= CRITICAL_RAM_USAGE:
-            alert_message = f"? CRITICAL: RAM Usage {ram_percent:.1f}% (Threshold: {CRITICAL_RAM_USAGE}%)"
-            logging.critical(alert_message)
-        elif ram_percent >= WARNING_RAM_USAGE:
-            logging.warning(f"?? WARNING: RAM Usage {ram_percent:.1f}% (Threshold: {WARNING_RAM_USAGE}%)")
-
-        if storage_percent >= CRITICAL_STORAGE_USAGE:
-            alert_message = f"? CRITICAL: Storage Usage {storage_percent:.1f}% (Threshold: {CRITICAL_STORAGE_USAGE}%)"
-            logging.critical(alert_message)
-        elif storage_percent >= WARNING_STORAGE_USAGE:
-            logging.warning(f"?? WARNING: Storage Usage {storage_percent:.1f}% (Threshold: {WARNING_STORAGE_USAGE}%)")
-
-        #   ALSO call the alert checking function (for external modules or new functionality)
-        check_and_send_alerts(cpu_temp, ram_percent, storage_percent)
-
     except Exception as e:
         logging.exception(f"Error in log_system_metrics: {e}")
 
+def format_percent(value):
+    """Averages and deltas are None until the sampler has enough samples."""
+    return f"{value:.1f}%" if value is not None else "n/a"
+
 def get_system_status():
     """
     Returns system metrics as a formatted string, including uptime.
     """
-    cpu_temp = get_cpu_temperature()
-    cpu_usage = get_cpu_usage()
-    ram_total, ram_used, ram_percent = get_ram_usage()
-    storage_total, storage_used, storage_percent = get_storage_usage()
+    snap = get_system_snapshot()
+    if snap is None:
+        return " System Status\n Sampler has not produced data yet, try again shortly.\n"
+    cpu_temp = snap['cpu_temp']
+    cpu_usage = snap['cpu_usage']
+    cpu_avg = snap['averages']['cpu_usage']
+    ram_total, ram_used, ram_percent = snap['ram_total'], snap['ram_used'], snap['ram_usage']
+    storage_total, storage_used, storage_percent = snap['storage_total'], snap['storage_used'], snap['storage_usage']
     uptime_seconds = get_uptime()
     uptime_string = format_uptime(uptime_seconds)
+    cpu_temp_str = f"{cpu_temp:.1f}\u00B0C" if cpu_temp is not None else "N/A"
 
     system_status = (
         f" System Status\n"
-        f" CPU Temp: {cpu_temp:.1f}\u00B0CC\n"
-        f" CPU Usage: {cpu_usage:.1f}%\n"
+        f" CPU Temp: {cpu_temp_str} ({snap['age']['cpu_temp']:.0f}s old)\n"
+        f" CPU Usage: {format_percent(cpu_usage)} (1m avg {format_percent(cpu_avg['1m'])}, 5m avg {format_percent(cpu_avg['5m'])})\n"
         f" RAM: {ram_used / (1024 ** 2):.2f} MB / {ram_total / (1024 ** 2):.2f} MB ({ram_percent:.1f}%)\n"
         f" Storage: {storage_used / (1024 ** 3):.2f} GB / {storage_total / (1024 ** 3):.2f} GB ({storage_percent:.1f}%)\n"
         f" Uptime: {uptime_string}\n"  #   Added Uptime
     )
+    if snap.get('disk_read_bps') is not None:
+        system_status += f" Disk I/O: {snap['disk_read_bps'] / 1024:.1f} KB/s read, {snap['disk_write_bps'] / 1024:.1f} KB/s write\n"
+    if snap.get('net_rx_bps') is not None:
+        system_status += f" Network: {snap['net_rx_bps'] / 1024:.1f} KB/s in, {snap['net_tx_bps'] / 1024:.1f} KB/s out\n"
+    system_status += f" Sampled: {snap['age']['cpu_usage']:.1f}s ago\n"
 
     return system_status
 
 #   --- IP Address Functions ---
 def get_public_ip():
     """
-    Retrieves the public IP address.
+    Retrieves the public IP address from the resolver's cache; waits a few seconds at most.
     """
-    try:
-        response = requests.get('https://api.ipify.org')
-        return response.text
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching public IP: {e}")
-        return "Error fetching public IP"
+    import public_ip  #   Only needed here; keeps requests out of the collector's import time
+    return public_ip.resolver.get() or "Error fetching public IP"
 
 def get_private_ip():
     """
     Retrieves all private IP addresses excluding loopback (127.*) and APIPA (169.*).
+    Served from the rtnetlink watcher's table; walks the interfaces only where it can't run.
     """
+    try:
+        watcher = netlink_watcher.get_watcher()
+        if watcher.ready.wait(1):
+            private_ips = watcher.private_ips()
+            return private_ips if private_ips else "Private IP not found"
+    except OSError as e:
+        logging.warning(f"Netlink watcher unavailable, walking interfaces: {e}")
+
     private_ips = []
     try:
         #   Get all network interfaces
@@ -256,70 +523,79 @@ def get_private_ip():
 
 def set_alert_threshold(metric, threshold_type, value):
     """
-    Allows setting alert thresholds dynamically.
-    metric: "cpu_temp", "ram_usage", "storage_usage"
+    Allows setting alert thresholds dynamically; takes effect from the next sample.
+    metric: "cpu_temp", "ram_usage", "storage_usage" (or "packet_loss")
     threshold_type: "warning", "critical"
     value:  The new threshold value
     """
-    global WARNING_CPU_TEMP, CRITICAL_CPU_TEMP, WARNING_RAM_USAGE, CRITICAL_RAM_USAGE, WARNING_STORAGE_USAGE, CRITICAL_STORAGE_USAGE
-
     try:
         value = float(value)  #   Ensure the value is a number
     except ValueError:
         logging.error(f"Invalid threshold value: {value}")
         return False
 
-    if metric == "cpu_temp":
-        if threshold_type == "warning":
-            WARNING_CPU_TEMP = value
-        elif threshold_type == "critical":
-            CRITICAL_CPU_TEMP = value
-        else:
-            logging.error(f"Invalid threshold type: {threshold_type}")
-            return False
-    elif metric == "ram_usage":
-        if threshold_type == "warning":
-            WARNING_RAM_USAGE = value
-        elif threshold_type == "critical":
-            CRITICAL_RAM_USAGE = value
-        else:
-            logging.error(f"Invalid threshold type: {threshold_type}")
-            return False
-    elif metric == "storage_usage":
-        if threshold_type == "warning":
-            WARNING_STORAGE_USAGE = value
-        elif threshold_type == "critical":
-            CRITICAL_STORAGE_USAGE = value
-        else:
-            logging.error(f"Invalid threshold type: {threshold_type}")
-            return False
-    else:
+    if metric not in alerts.engine.rules:
         logging.error(f"Invalid metric: {metric}")
         return False
+    if not alerts.engine.set_threshold(metric, threshold_type, value):
+        logging.error(f"Invalid threshold type: {threshold_type}")
+        return False
 
     logging.info(f"Threshold for {metric} ({threshold_type}) set to {value}")
     return True
 
-def get_stored_alerts():
+def get_active_alerts():
     """
-    Retrieves the stored critical alerts.
+    Messages for the alerts currently firing.
     """
-    global stored_alerts
-    alerts = stored_alerts
-    stored_alerts = []  #   Clear the alerts after retrieving them
-    return alerts
-
-#   Example of a new function to get alert history (this is a placeholder - you'd need to implement actual retrieval)
-def get_alert_history(time_period):
+    messages = []
+    for metric, subject, level, value in alerts.engine.active():
+        rule = alerts.engine.rules[metric]
+        name = rule.label + (f" {subject}" if subject else "")
+        messages.append(f"{alerts.LEVEL_ICONS[level]} {level.upper()}: {name} {value:.1f}{rule.unit}")
+    return messages
+
+#   --- Alert History ---
+ALERT_PERIODS = {
+    "last_hour": 3600,
+    "last_24_hours": 86400,
+    "last_7_days": 7 * 86400,
+    "last_30_days": 30 * 86400,
+    "all": None,
+}
+ALERT_PAGE_SIZE = 10
+
+def get_alert_history(time_period, metric=None, limit=ALERT_PAGE_SIZE, before=None):
     """
-    Retrieves alert history (This is a placeholder - implement actual retrieval).
-    time_period: "last_hour", "last_24_hours", etc.
+    Retrieves one page of alert history, newest first.
+    time_period: a key of ALERT_PERIODS ("last_hour", "last_24_hours", ...)
+    metric: only alerts for this metric
+    before: the cursor returned with the previous page
+    Returns (rows, cursor for the next page or None); each row is a dict.
     """
-    #   Replace this with your actual alert history retrieval logic
-    return "Alert history retrieval not implemented yet."
+    if time_period not in ALERT_PERIODS:
+        raise ValueError(f"Invalid time period: {time_period}")
+    seconds = ALERT_PERIODS[time_period]
+    since = int(time.time()) - seconds if seconds else 0
+    before_ts, before_id = before or (2 ** 62, 2 ** 62)
+
+    conn = storage.connect_readonly()
+    try:
+        if metric:
+            cursor = conn.execute(storage.ALERT_HISTORY_METRIC_QUERY, (metric, since, before_ts, before_id, limit + 1))
+        else:
+            cursor = conn.execute(storage.ALERT_HISTORY_QUERY, (since, before_ts, before_id, limit + 1))
+        columns = [c[0] for c in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    #   One extra row tells whether another page follows
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, ((rows[-1]['ts'], rows[-1]['id']) if more else None)
 
 if __name__ == "__main__":
-    create_table()  #   create table if it does not exist.
-    while True:
-        log_system_metrics()
-        time.sleep(60)  #   Log every 60 seconds
+    #   One status readout; sampling and writing belong to the bot's scheduler, so running
+    #   this next to the bot must not collect a second time
+    print(get_system_status())
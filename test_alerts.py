@@ -0,0 +1,146 @@
+# test_alerts.py
+import threading
+
+import pytest
+
+import alerts
+
+
+def engine_with(*rules):
+    engine = alerts.AlertEngine()
+    for rule in rules:
+        engine.add(rule)
+    return engine
+
+
+def feed(engine, metric, values, subject=None, start=0.0, step=1.0):
+    events = []
+    for i, value in enumerate(values):
+        event = engine.observe(metric, value, subject, now=start + i * step)
+        if event:
+            events.append(event)
+    return events
+
+
+def test_window_mean_matches_recomputed_mean():
+    window = alerts.Window(10)
+    values = [float(v % 17) for v in range(200)]
+    for t, value in enumerate(values):
+        mean = window.add(t, value)
+        recent = values[max(0, t - 9):t + 1]
+        assert mean == pytest.approx(sum(recent) / len(recent))
+    assert len(window.samples) == 10
+
+
+def test_windowed_average_fires_once_and_resolves_with_hysteresis():
+    engine = engine_with(alerts.Rule('ram_usage', {'critical': 80}, window=300, hysteresis=5, cooldown=0))
+    # A one-minute spike to 95% barely moves a 5 min mean that sat at 60%
+    assert feed(engine, 'ram_usage', [60] * 240 + [95] * 60, step=1) == []
+
+    events = feed(engine, 'ram_usage', [95] * 300, start=300)
+    assert [e.kind for e in events] == ['fire']
+    assert events[0].level == 'critical' and events[0].value >= 80
+    assert engine.active()[0][:3] == ('ram_usage', None, 'critical')
+
+    # Hovering just under the threshold keeps it active; only below 75 resolves
+    assert feed(engine, 'ram_usage', [77] * 300, start=600) == []
+    events = feed(engine, 'ram_usage', [50] * 300, start=900)
+    assert [e.kind for e in events] == ['resolve']
+    assert engine.active() == []
+
+
+def test_consecutive_cycles_per_subject():
+    engine = engine_with(alerts.Rule('packet_loss', {'warning': 20}, cycles=3, cooldown=0))
+    assert feed(engine, 'packet_loss', [30, 30, 0, 30, 30], subject='gw') == []
+    assert feed(engine, 'packet_loss', [0, 0, 0], subject='dns') == []
+    events = feed(engine, 'packet_loss', [30], subject='gw', start=10)
+    assert [(e.kind, e.subject) for e in events] == [('fire', 'gw')]
+    assert engine.active() == [('packet_loss', 'gw', 'warning', 30)]
+
+
+def test_escalation_and_cooldown():
+    engine = engine_with(alerts.Rule('cpu_temp', {'warning': 60, 'critical': 65}, hysteresis=2, cooldown=100))
+    events = feed(engine, 'cpu_temp', [61, 66, 64, 62, 50])
+    assert [(e.kind, e.level) for e in events] == [('fire', 'warning'), ('fire', 'critical'),
+                                                    ('ease', 'warning'), ('resolve', None)]
+    # Flapping back within the cooldown is suppressed, then fires once it has passed
+    assert feed(engine, 'cpu_temp', [61, 61], start=10) == []
+    assert engine.suppressed == 2
+    assert [e.kind for e in feed(engine, 'cpu_temp', [61], start=101)] == ['fire']
+
+
+def test_set_threshold_applies_to_next_sample():
+    engine = engine_with(alerts.Rule('storage_usage', {'warning': 70, 'critical': 80}))
+    assert feed(engine, 'storage_usage', [72])[0].level == 'warning'
+    assert engine.set_threshold('storage_usage', 'critical', 71)
+    assert feed(engine, 'storage_usage', [72], start=1)[0].level == 'critical'
+    assert not engine.set_threshold('storage_usage', 'fatal', 90)
+    assert not engine.set_threshold('nope', 'warning', 90)
+
+
+def test_transitions_are_pushed_to_subscribers():
+    engine = engine_with(alerts.Rule('ram_usage', {'critical': 80}, label="RAM Usage"))
+    received = []
+    done = threading.Event()
+
+    def notify(event):
+        received.append(event.message)
+        if len(received) == 2:
+            done.set()
+
+    engine.subscribe(notify)
+    feed(engine, 'ram_usage', [90, 90, 10])
+    assert done.wait(5)
+    assert received[0].startswith("🔴 CRITICAL: RAM Usage") and received[1].startswith("✅ RESOLVED")
+
+
+def test_set_alert_threshold_updates_the_shared_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import system_monitor
+    rule = alerts.engine.rules['ram_usage']
+    before = dict(rule.thresholds)
+    try:
+        assert system_monitor.set_alert_threshold('ram_usage', 'warning', '55')
+        assert rule.thresholds['warning'] == 55.0
+        assert not system_monitor.set_alert_threshold('ram_usage', 'warning', 'lots')
+        assert not system_monitor.set_alert_threshold('fan_speed', 'warning', 1)
+    finally:
+        rule.thresholds = before
+
+
+def test_history_is_persisted_and_paged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import storage
+    import system_monitor
+    storage.set_db_path(str(tmp_path / "monitoring_data.db"))
+    try:
+        engine = engine_with(alerts.Rule('cpu_temp', {'warning': 60, 'critical': 65}, cooldown=0),
+                             alerts.Rule('packet_loss', {'warning': 20}, cooldown=0))
+        for event in feed(engine, 'cpu_temp', [61, 66, 61, 50] * 6):
+            storage.record_alert(event)
+        for event in feed(engine, 'packet_loss', [30, 0] * 3, subject='Local Gateway'):
+            storage.record_alert(event)
+        storage.record_alert(feed(engine, 'cpu_temp', [70], start=100)[0])  # left open
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = system_monitor.get_alert_history("last_hour", limit=7, before=cursor)
+            seen += rows
+            if cursor is None:
+                break
+        assert len(seen) == 6 * 3 + 3 + 1  # warning, critical and the warning it eased to, per episode
+        assert [(r['ts'], r['id']) for r in seen] == sorted(((r['ts'], r['id']) for r in seen), reverse=True)
+        assert len({r['id'] for r in seen}) == len(seen)
+        assert sum(r['resolved_at'] is None for r in seen) == 1
+
+        episode = sorted((r for r in seen if r['metric'] == 'cpu_temp'), key=lambda r: r['id'])[:3]
+        assert [r['severity'] for r in episode] == ['warning', 'critical', 'warning']
+        assert episode[0]['resolved_at'] == episode[1]['ts'] and episode[1]['resolved_at'] == episode[2]['ts']
+
+        rows, cursor = system_monitor.get_alert_history("last_hour", metric='packet_loss')
+        assert cursor is None and len(rows) == 3
+        assert all(r['subject'] == 'Local Gateway' and r['resolved_at'] for r in rows)
+        with pytest.raises(ValueError):
+            system_monitor.get_alert_history("last_century")
+    finally:
+        storage.close()
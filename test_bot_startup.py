@@ -0,0 +1,46 @@
+# test_bot_startup.py - Import-time and memory budget for bot.py cold start
+import os
+import sys
+import subprocess
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+#   Generous for a dev machine; a regression that pulls the report stack back in
+#   costs well over a second and ~90 MB
+IMPORT_BUDGET_SECONDS = 1.0
+RSS_BUDGET_MB = 80
+HEAVY_MODULES = {'pandas', 'numpy', 'matplotlib', 'report_generator'}
+
+
+def import_bot(cwd, then=""):
+    env = dict(os.environ, BOT_TOKEN="123456:TEST", PYTHONPATH=REPO)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         #   VmRSS rather than ru_maxrss, which keeps the forking parent's peak across exec
+         f"import bot; {then}print(open('/proc/self/status').read().split('VmRSS:')[1].split()[0])"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                imports[name.strip()] = int(cumulative) / 1e6
+    return imports, int(result.stdout.split()[-1]) / 1024
+
+
+def test_bot_cold_start_stays_light(tmp_path):
+    imports, rss_mb = import_bot(tmp_path)
+    assert not HEAVY_MODULES & set(imports), "bot.py imports the report stack at startup"
+    assert imports['bot'] < IMPORT_BUDGET_SECONDS, f"import bot took {imports['bot']:.2f}s"
+    assert rss_mb < RSS_BUDGET_MB, f"bot startup RSS {rss_mb:.0f} MB"
+
+
+def test_importing_bot_has_no_side_effects(tmp_path):
+    # Report render workers re-import the launching script as __mp_main__
+    import_bot(tmp_path, then="import threading; assert threading.active_count() == 1, threading.enumerate(); ")
+    assert os.listdir(tmp_path) == []
+
+
+def test_setup_leaves_logging_to_the_bot(tmp_path):
+    import_bot(tmp_path, then="bot.setup(); ")
+    assert os.listdir(tmp_path) == ["bot_debug.log"]
@@ -0,0 +1,78 @@
+# test_command_filter.py
+import shutil
+import subprocess
+
+import pytest
+
+import expert_mode
+import command_filter
+from command_filter import run_fast_path
+
+
+def real(argv):
+    if shutil.which(argv[0]) is None:
+        pytest.skip(f"{argv[0]} not installed")
+    return subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+
+
+@pytest.mark.parametrize("command", ["whoami", "hostname", "uname", "uname -a", "uname -srm", "uptime -p", "date +%Y-%m-%d"])
+def test_fast_path_output_matches_the_binary(command):
+    argv = command.split()
+    assert run_fast_path(argv) == real(argv)
+
+
+def test_tables_match_the_binary_layout():
+    for argv in (["free"], ["free", "-h"]):
+        ours, theirs = run_fast_path(argv).splitlines(), real(argv).splitlines()
+        assert ours[0] == theirs[0]
+        assert [line.split()[0] for line in ours] == [line.split()[0] for line in theirs]
+    for argv in (["df"], ["df", "-h"]):
+        ours, theirs = run_fast_path(argv).splitlines(), real(argv).splitlines()
+        assert ours[0] == theirs[0]
+        assert [line.split()[-1] for line in ours] == [line.split()[-1] for line in theirs]
+    ours, theirs = run_fast_path(["lsblk"]).splitlines(), real(["lsblk"]).splitlines()
+    assert ours[0] == theirs[0]
+    assert [line.split()[0] for line in ours] == [line.split()[0] for line in theirs]
+
+
+def test_process_listings_have_the_binary_columns():
+    for argv in (["ps", "aux"], ["ps", "-ef"]):
+        lines = run_fast_path(argv).splitlines()
+        assert lines[0].split() == real(argv).splitlines()[0].split()
+        assert len(lines) > 2
+
+
+@pytest.mark.parametrize("command", ["free -g", "df -i", "ps -o pid", "uname -z", "date -d yesterday", "hostname -I",
+                                     "lsblk -f", "uptime -s", "whoami --help", "ls"])
+def test_unsupported_forms_fall_back(command):
+    assert run_fast_path(command.split()) is None
+
+
+def test_failing_fast_path_falls_back(monkeypatch):
+    def broken(args):
+        raise OSError("no /proc")
+    monkeypatch.setitem(command_filter.FAST_PATHS, "uptime", broken)
+    assert run_fast_path(["uptime"]) is None
+
+
+def test_run_command_answers_without_forking(monkeypatch):
+    def no_fork(*args, **kwargs):
+        raise AssertionError("forked")
+    monkeypatch.setattr(expert_mode.subprocess, "Popen", no_fork)
+    result = expert_mode.run_command(["uname", "-s"])
+    assert result.fast_path and result.returncode == 0 and result.text.strip() == "Linux"
+    with pytest.raises(AssertionError):
+        expert_mode.run_command(["uname", "-z"])
+
+
+def test_lsblk_puts_each_mountpoint_on_its_own_line(monkeypatch):
+    first = run_fast_path(["lsblk"]).splitlines()[1:2]
+    if not first:
+        pytest.skip("no block devices")
+    name, dev = first[0].split()[:2]
+    monkeypatch.setattr(command_filter, "_mountpoints", lambda: {dev: ["/srv/a", "/srv/b"]})
+    lines = run_fast_path(["lsblk"]).splitlines()
+    row = next(i for i, line in enumerate(lines) if line.startswith(name + " "))
+    assert lines[row].endswith(" /srv/a")
+    assert lines[row + 1].strip() == "/srv/b"
+    assert lines[row + 1].index("/srv/b") == lines[row].index("/srv/a") == lines[0].index("MOUNTPOINTS")
@@ -0,0 +1,97 @@
+# test_delivery.py - Delivery layer against the local fake Bot API server in conftest.py
+import os
+import time
+
+import pytest
+import telebot
+
+import delivery as delivery_module
+from delivery import Delivery
+
+
+@pytest.fixture
+def bot():
+    return telebot.TeleBot("123456:TEST", threaded=False)
+
+
+@pytest.fixture
+def report(tmp_path):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"%PDF-1.4 fake report" * 100)
+    return str(path)
+
+
+def test_document_is_uploaded_once_for_every_recipient(api, bot, report):
+    delivery = Delivery(bot, rate=1000)
+    results = delivery.broadcast_document([1, 2, 3, 4], report, caption="Report")
+
+    assert results == {1: True, 2: True, 3: True, 4: True}
+    uploads = [c for c in api.calls if c['uploaded']]
+    assert len(uploads) == 1
+    first_file_id = "FILE-1"
+    assert all(c['document'] == first_file_id for c in api.calls if not c['uploaded'])
+
+    delivery.send_document(5, report)  # a later send of the same cached report
+    assert sum(c['uploaded'] for c in api.calls) == 1
+
+
+def test_fan_out_is_concurrent(api, bot):
+    api.delay = 0.2
+    delivery = Delivery(bot, concurrency=4, rate=1000)
+    started = time.monotonic()
+    results = delivery.broadcast_message([1, 2, 3, 4], "hello")
+    assert all(r is True for r in results.values())
+    assert time.monotonic() - started < 0.6  # serial would take 0.8 s
+
+
+def test_rate_limit_spaces_sends(api, bot):
+    delivery = Delivery(bot, concurrency=4, rate=20)
+    delivery.broadcast_message(range(1, 6), "hello")
+    times = sorted(c['at'] for c in api.calls)
+    assert times[-1] - times[0] >= 4 / 20 * 0.9
+
+
+def test_429_is_retried(api, bot):
+    api.rate_limited = 2
+    delivery = Delivery(bot, rate=1000)
+    results = delivery.broadcast_message([1], "hello")
+    assert results == {1: True}
+    assert delivery.retried == 2
+    assert [c['limited'] for c in api.calls] == [True, True, False]
+
+
+def test_failures_are_reported_not_swallowed(api, bot):
+    api.rate_limited = 10
+    delivery = Delivery(bot, rate=1000, retries=1)
+    results = delivery.broadcast_message([1, 2], "hello")
+    assert all(isinstance(r, telebot.apihelper.ApiTelegramException) for r in results.values())
+
+
+def test_upload_retried_after_429_sends_the_whole_file(api, bot, report):
+    api.rate_limited = 1
+    delivery = Delivery(bot, rate=1000)
+    delivery.broadcast_document([1, 2], report)
+    first, retry = [c for c in api.calls if c['uploaded']]
+    assert first['limited'] and not retry['limited']
+    content = open(report, 'rb').read()
+    assert content in first['body'] and content in retry['body']
+    assert len(retry['body']) == len(first['body'])
+    assert delivery.uploads == 1
+
+
+def test_touched_file_is_not_uploaded_again(api, bot, report):
+    delivery = Delivery(bot, rate=1000)
+    delivery.send_document(1, report)
+    os.utime(report, (time.time() + 60, time.time() + 60))  # what a report cache hit does
+    delivery.send_document(2, report)
+    assert sum(c['uploaded'] for c in api.calls) == 1
+
+
+def test_file_id_cache_is_bounded(api, bot, tmp_path, monkeypatch):
+    monkeypatch.setattr(delivery_module, "FILE_ID_CACHE", 3)
+    delivery = Delivery(bot, rate=1000)
+    for i in range(6):
+        path = tmp_path / f"report{i}.pdf"
+        path.write_bytes(b"report %d" % i)
+        delivery.send_document(1, str(path))
+    assert len(delivery._file_ids) == 3 and len(delivery._upload_locks) == 3
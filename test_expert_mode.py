@@ -0,0 +1,97 @@
+# test_expert_mode.py
+import os
+import sys
+import gzip
+import time
+
+import pytest
+
+import expert_mode
+from command_filter import parse_command
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_ring_buffer_keeps_the_last_bytes():
+    ring = expert_mode.RingBuffer(10)
+    ring.write(b"abcdef")
+    assert ring.getvalue() == b"abcdef"
+    ring.write(b"ghijkl")
+    assert ring.getvalue() == b"cdefghijkl" and ring.dropped == 2
+    ring.write(b"0123456789ABCDEF")
+    assert ring.getvalue() == b"6789ABCDEF" and ring.written == 28
+
+
+def test_parse_command_builds_argv_without_a_shell():
+    assert parse_command("journalctl -u 'monitoring bot' -n 50") == ["journalctl", "-u", "monitoring bot", "-n", "50"]
+    assert parse_command("ls; rm -rf /") is None
+    assert parse_command("cat /var/log/syslog | grep error") is None
+    assert parse_command("ls $(whoami)") is None
+    assert parse_command("ls 'unterminated") is None
+    assert parse_command("rm -rf /") is None
+    assert parse_command("   ") is None
+
+
+def test_small_output_stays_in_memory():
+    result = expert_mode.run_command(python("print('hello'); import sys; print('oops', file=sys.stderr); sys.exit(3)"))
+    assert result.returncode == 3
+    assert result.text.split() == ["hello", "oops"]
+    assert result.archive is None and not result.timed_out
+
+
+def test_large_output_is_bounded_in_memory_and_archived():
+    lines = 20000  # ~500 KB through a 16 KB buffer
+    result = expert_mode.run_command(python(f"for i in range({lines}): print(f'line {{i:06d}} ' + 'x' * 12)"),
+                                     buffer_bytes=16384)
+    try:
+        assert result.returncode == 0
+        assert len(result.text.encode()) == 16384
+        assert result.text.endswith(f"line {lines - 1:06d} {'x' * 12}\n")
+        with gzip.open(result.archive, "rt") as f:
+            full = f.read().splitlines()
+        assert len(full) == lines and full[0].startswith("line 000000")
+        assert result.total_bytes == sum(len(line) + 1 for line in full)
+    finally:
+        os.remove(result.archive)
+
+
+def test_output_cap_stops_the_command():
+    started = time.monotonic()
+    result = expert_mode.run_command(python("import sys\nwhile True: sys.stdout.write('y' * 4096)"),
+                                     buffer_bytes=8192, max_bytes=256 * 1024)
+    os.remove(result.archive)
+    assert result.truncated and result.returncode is not None
+    assert 256 * 1024 <= result.total_bytes < 256 * 1024 + expert_mode.READ_CHUNK
+    assert time.monotonic() - started < 5
+
+
+def test_timeout_kills_the_whole_process_group(tmp_path):
+    pidfile = tmp_path / "child.pid"
+    # The child outlives its parent's stdout unless the group is killed
+    code = (f"import subprocess, sys; p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']); "
+            f"open({str(pidfile)!r}, 'w').write(str(p.pid)); print('started', flush=True); p.wait()")
+    started = time.monotonic()
+    result = expert_mode.run_command(python(code), timeout=1.0)
+    assert result.timed_out and result.text.strip() == "started"
+    assert time.monotonic() - started < 1.0 + expert_mode.KILL_GRACE + 1
+    child = int(pidfile.read_text())
+    for _ in range(50):
+        try:
+            os.kill(child, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("child process survived the timeout")
+
+
+def test_pages_fit_a_telegram_message():
+    text = "".join(f"{i} <tag> & {'z' * (i % 300)}\n" for i in range(2000)) + "&" * 9000
+    pages = expert_mode.paginate(text, page_chars=3800)
+    assert len(pages) > 10
+    assert all(0 < len(page) <= 3800 for page in pages)
+    rebuilt = "".join(pages).replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+    assert rebuilt == text
+    assert expert_mode.paginate("") == [""]
@@ -0,0 +1,76 @@
+# test_metrics_exporter.py
+import urllib.request
+import urllib.error
+
+import pytest
+
+import metrics_exporter
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics_exporter.Registry()
+    monkeypatch.setattr(metrics_exporter, "registry", registry)
+    return registry
+
+
+def test_render_is_valid_openmetrics(registry):
+    registry.set('cpu_temperature_celsius', 48.5, "CPU temperature")
+    registry.set('host_latency_milliseconds', 12.25, "Average round-trip time", host='Google DNS')
+    registry.set('host_latency_milliseconds', None, host='Local "Gateway"\\')
+    registry.set('cpu_temperature_celsius', 49.0)
+    text = registry.render().decode()
+    assert text.endswith("# EOF\n")
+    assert "# TYPE pi_cpu_temperature_celsius gauge\n# HELP pi_cpu_temperature_celsius CPU temperature\n" in text
+    assert "pi_cpu_temperature_celsius 49.0\n" in text and "48.5" not in text
+    assert 'pi_host_latency_milliseconds{host="Google DNS"} 12.25\n' in text
+    assert 'pi_host_latency_milliseconds{host="Local \\"Gateway\\"\\\\"} NaN\n' in text
+    assert text.count("# TYPE pi_host_latency_milliseconds") == 1
+
+
+def test_stats_are_read_at_scrape_time(registry):
+    jobs = {'system': {'runs': 3, 'running': False, 'max_lag': 0.5}}
+    registry.add_stats('job', lambda: jobs, label='job')
+    registry.add_stats('public_ip', lambda: {'address': "203.0.113.7", 'age': None, 'lookups': 2})
+    registry.add_stats('broken', lambda: 1 / 0)
+    text = registry.render().decode()
+    assert 'pi_job_runs{job="system"} 3.0\n' in text and 'pi_job_running{job="system"} 0.0\n' in text
+    assert "pi_public_ip_lookups 2.0\n" in text
+    assert "203.0.113.7" not in text and "pi_public_ip_age" not in text and "broken" not in text
+    jobs['system']['runs'] = 4
+    assert 'pi_job_runs{job="system"} 4.0\n' in registry.render().decode()
+
+
+def test_collectors_publish_their_samples(registry, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import module1
+    import system_monitor
+    system_monitor.export_metrics({'cpu_temp': 51.0, 'ram_usage': 40.5, 'ram_total': 8 * 1024 ** 3, 'sampled_at': 12.0})
+    module1.export_metrics({'Google DNS': (14.0, 2.5, 0.0), 'Local Gateway': None}, ("2026-10-18 03:00:00", 1792292400))
+    text = registry.render().decode()
+    assert "pi_cpu_temperature_celsius 51.0\n" in text and "pi_ram_usage_percent 40.5\n" in text
+    assert "pi_ram_total_bytes 8589934592.0\n" in text and "sampled_at" not in text
+    assert 'pi_host_up{host="Google DNS"} 1.0\n' in text and 'pi_host_up{host="Local Gateway"} 0.0\n' in text
+    assert 'pi_host_latency_milliseconds{host="Local Gateway"} NaN\n' in text
+    assert 'pi_host_packet_loss_percent{host="Local Gateway"} 100.0\n' in text
+    assert "pi_probe_timestamp_seconds 1792292400.0\n" in text
+
+
+def test_http_endpoint(registry):
+    registry.set('ram_usage_percent', 40.0)
+    server = metrics_exporter.MetricsServer(registry, host="127.0.0.1", port=0).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        request = urllib.request.Request(base + "/metrics", headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("application/openmetrics-text")
+            assert b"pi_ram_usage_percent 40.0\n" in response.read()
+        with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base + "/", timeout=5)
+        assert error.value.code == 404
+        assert registry.scrapes == 2
+    finally:
+        server.shutdown()
+        server.server_close()
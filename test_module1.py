@@ -0,0 +1,65 @@
+# test_module1.py - Probe cycles with a fake probe in place of the network
+import time
+import asyncio
+
+import pytest
+
+import storage
+import module1
+import probe_engine
+
+HOSTS = {f"host{i}": f"192.0.2.{i}" for i in range(6)}
+
+
+@pytest.fixture
+def fake_probe(monkeypatch):
+    """Replaces probe_engine.probe; delays holds per-host seconds, seen the peak concurrency."""
+    state = {'delays': {}, 'active': 0, 'peak': 0}
+
+    async def probe(host, count=10, **kwargs):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        try:
+            await asyncio.sleep(state['delays'].get(host, 0.05))
+            return probe_engine.ProbeResult(host, "udp", count, [1.0] * count)
+        finally:
+            state['active'] -= 1
+
+    monkeypatch.setattr(probe_engine, "probe", probe)
+    monkeypatch.setattr(module1, "PROBE_ENGINE", "native")
+    monkeypatch.setattr(module1, "PROBE_INTERVAL", 0)
+    return state
+
+
+def test_probes_never_exceed_the_concurrency_cap(fake_probe):
+    results = module1.probe_hosts(HOSTS, max_workers=2, timeout=5)
+    assert fake_probe['peak'] == 2
+    assert all(result == (1.0, 0.0, 0.0) for result in results.values())
+    assert list(results) == list(HOSTS)
+
+
+def test_a_slow_host_does_not_hold_up_the_others(fake_probe):
+    fake_probe['delays']["192.0.2.0"] = 10
+    started = time.monotonic()
+    results = module1.probe_hosts(HOSTS, max_workers=8, timeout=0.3)
+    elapsed = time.monotonic() - started
+    assert results["host0"] is None
+    assert all(results[name] == (1.0, 0.0, 0.0) for name in HOSTS if name != "host0")
+    assert elapsed < 1.0, f"cycle took {elapsed:.2f}s"
+
+
+def test_hosts_in_one_cycle_share_sampled_at(fake_probe, tmp_path, monkeypatch):
+    storage.set_db_path(str(tmp_path / "monitoring_data.db"))
+    clock = iter(range(1704067200, 1704067300))
+    # A fresh timestamp on every call: rows only match if the cycle takes one up front
+    monkeypatch.setattr(storage, "now_timestamp", lambda: (None, next(clock)))
+    rows = []
+    monkeypatch.setattr(module1, "HOSTS", {"Local Gateway": "192.0.2.1", "Google DNS": "192.0.2.2",
+                                           "Cloudflare DNS": "192.0.2.3"})
+    monkeypatch.setattr(module1, "save_to_db", lambda *row: rows.append(row))
+    try:
+        module1.main()
+    finally:
+        storage.close()
+    assert len(rows) == 3
+    assert len({row[-1] for row in rows}) == 1
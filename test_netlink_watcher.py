@@ -0,0 +1,164 @@
+# test_netlink_watcher.py - The interface table fed recorded rtnetlink messages, and live in a network namespace
+import os
+import sys
+import json
+import shutil
+import struct
+import sqlite3
+import subprocess
+
+import pytest
+
+import netlink_watcher
+
+#   Recorded in a namespace (`unshare -rn`) while running the commands below; link
+#   messages are cut down to their ifinfomsg, IFLA_IFNAME and IFLA_OPERSTATE
+RECORDED = [
+    ("ip link add v0 type veth peer name v1", [
+        '30000000100000000000000000000000000001000200000002100000ffffffff07000300763100000500100002000000',
+        '30000000100000000000000000000000000001000300000002100000ffffffff07000300763000000500100002000000',
+    ]),
+    ("ip addr add 10.42.0.5/24 dev v0", [
+        '4c00000014000000873cd46a000000000218800003000000080001000a2a0005080002000a2a00050700030076300000'
+        '080008008000000014000600ffffffffffffffff163b0400163b0400',
+    ]),
+    ("ip link set v1 up", [
+        '300000001000000000000000000000000000010002000000031000000100000007000300763100000500100003000000',
+    ]),
+    ("ip link set v0 up", [
+        '300000001000000000000000000000000000010003000000031001000100000007000300763000000500100003000000',
+        '300000001000000000000000000000000000010003000000431001000000000007000300763000000500100006000000',
+        '300000001000000000000000000000000000010002000000431001000000000007000300763100000500100006000000',
+    ]),
+    ("ip addr add 10.42.0.6/24 dev v0", [
+        '4c00000014000000883cd46a000000000218810003000000080001000a2a0006080002000a2a00060700030076300000'
+        '080008008100000014000600ffffffffffffffff263b0400263b0400',
+    ]),
+    ("ip addr del 10.42.0.5/24 dev v0", [  # the kernel drops the secondary along with the primary
+        '4c00000015000000883cd46a000000000218810003000000080001000a2a0006080002000a2a00060700030076300000'
+        '080008008100000014000600ffffffffffffffff263b0400263b0400',
+        '4c00000015000000883cd46a000000000218800003000000080001000a2a0005080002000a2a00050700030076300000'
+        '080008008000000014000600ffffffffffffffff163b0400163b0400',
+    ]),
+    ("ip link set v1 down", [
+        '300000001000000000000000000000000000010002000000021000000100000007000300763100000500100002000000',
+        '300000001000000000000000000000000000010003000000031000000000000007000300763000000500100003000000',
+    ]),
+    ("ip link del v0", [
+        '300000001000000000000000000000000000010003000000021000004100000007000300763000000500100002000000',
+        '30000000110000000000000000000000000001000300000002100000ffffffff07000300763000000500100002000000',
+        '30000000110000000000000000000000000001000200000002100000ffffffff07000300763100000500100002000000',
+    ]),
+]
+
+
+def replay(table, messages):
+    changes = []
+    for message in messages:
+        for msg_type, _, _, payload in netlink_watcher.parse_messages(bytes.fromhex(message)):
+            changes += table.apply(msg_type, payload)
+    return changes
+
+
+def test_recorded_messages_drive_the_table():
+    table = netlink_watcher.InterfaceTable()
+    changes = {command: replay(table, messages) for command, messages in RECORDED}
+
+    assert changes["ip link add v0 type veth peer name v1"] == []
+    assert changes["ip addr add 10.42.0.5/24 dev v0"] == [('address', 'v0', None, '10.42.0.5/24')]
+    assert changes["ip link set v1 up"] == []  # no carrier until the peer is up too
+    assert changes["ip link set v0 up"] == [('link', 'v0', 'down', 'up'), ('link', 'v1', 'down', 'up')]
+    assert changes["ip addr add 10.42.0.6/24 dev v0"] == [('address', 'v0', None, '10.42.0.6/24')]
+    assert changes["ip addr del 10.42.0.5/24 dev v0"] == [('address', 'v0', '10.42.0.6/24', None),
+                                                          ('address', 'v0', '10.42.0.5/24', None)]
+    assert changes["ip link set v1 down"] == [('link', 'v1', 'up', 'down'), ('link', 'v0', 'up', 'down')]
+    assert changes["ip link del v0"] == []
+    assert table.links == {} and table.ipv4_addresses() == []
+
+
+def test_readvertised_address_is_not_a_change():
+    table = netlink_watcher.InterfaceTable()
+    replay(table, RECORDED[0][1])
+    add = RECORDED[1][1]
+    assert replay(table, add) == [('address', 'v0', None, '10.42.0.5/24')]
+    assert replay(table, add) == []  # e.g. a DHCP renewal
+    assert table.ipv4_addresses() == [('v0', '10.42.0.5')]
+
+
+LIVE_SCRIPT = """
+import json, subprocess, sys, time
+import storage, netlink_watcher
+watcher = netlink_watcher.NetlinkWatcher().start()
+assert watcher.ready.wait(5)
+for command in sys.argv[1:]:
+    subprocess.run(command.split(), check=True)
+deadline = time.time() + 5
+while len(watcher.events) < 3 and time.time() < deadline:
+    time.sleep(0.05)
+storage.flush()
+print(json.dumps({'ips': watcher.private_ips(), 'events': list(watcher.events)}))
+"""
+
+
+class ScriptedSocket:
+    """Stands in for the netlink socket: answers each dump request with the next scripted reply."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)  # one builder per request, called with its seq
+        self.sent = []
+        self.pending = []
+
+    def send(self, data):
+        _, msg_type, _, seq, _ = netlink_watcher.NLMSGHDR.unpack_from(data)
+        self.sent.append(msg_type)
+        self.pending.append(self.replies.pop(0)(seq))
+
+    def recv(self, size):
+        if not self.pending:
+            raise OSError("script finished")
+        return self.pending.pop(0)
+
+
+def nlmsg(msg_type, seq, payload=b""):
+    return netlink_watcher.NLMSGHDR.pack(netlink_watcher.NLMSGHDR.size + len(payload), msg_type, 0, seq, 0) + payload
+
+
+def dump_error(seq):
+    return nlmsg(netlink_watcher.NLMSG_ERROR, seq, struct.pack("=i", -95) + nlmsg(netlink_watcher.RTM_GETLINK, seq))
+
+
+def dump_done(seq):
+    return nlmsg(netlink_watcher.NLMSG_DONE, seq, struct.pack("=i", 0))
+
+
+@pytest.mark.parametrize("replies", [[dump_error, dump_done], [dump_done, dump_error], [dump_error, dump_error]])
+def test_dump_error_does_not_leave_readers_waiting(replies):
+    watcher = netlink_watcher.NetlinkWatcher(record=False)
+    watcher._sock = ScriptedSocket(replies)
+    watcher._run()  # returns once the script runs out
+    assert watcher._sock.sent == [netlink_watcher.RTM_GETLINK, netlink_watcher.RTM_GETADDR]
+    assert watcher.ready.is_set()
+
+
+def test_live_namespace(tmp_path):
+    if not shutil.which("unshare") or not shutil.which("ip"):
+        pytest.skip("needs unshare and iproute2")
+    if subprocess.run(["unshare", "-rn", "true"], capture_output=True).returncode != 0:
+        pytest.skip("user namespaces not available")
+    db = tmp_path / "monitoring_data.db"
+    env = dict(os.environ, MONITORING_DB_PATH=str(db), PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    commands = ["ip link add v0 type veth peer name v1", "ip addr add 10.42.0.5/24 dev v0",
+                "ip link set v1 up", "ip link set v0 up"]
+    result = subprocess.run(["unshare", "-rn", sys.executable, "-c", LIVE_SCRIPT, *commands],
+                            capture_output=True, text=True, env=env, timeout=30)
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout.splitlines()[-1])
+
+    assert output['ips'] == ['10.42.0.5']
+    assert [event[1:] for event in output['events']] == [['address', 'v0', None, '10.42.0.5/24'],
+                                                         ['link', 'v0', 'down', 'up'],
+                                                         ['link', 'v1', 'down', 'up']]
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT kind, subject, old_value, new_value FROM network_events ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [tuple(event[1:]) for event in output['events']]
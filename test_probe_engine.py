@@ -0,0 +1,86 @@
+# test_probe_engine.py
+import socket
+import asyncio
+import threading
+
+import pytest
+
+import probe_engine
+
+
+@pytest.fixture
+def udp_echo():
+    """Local UDP echo stand-in on an ephemeral port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.2)
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            sock.sendto(data, addr)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield sock.getsockname()[1]
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_udp_probe_keeps_every_rtt(udp_echo):
+    result = asyncio.run(probe_engine.probe("127.0.0.1", count=5, interval=0.01, timeout=1.0, method="udp", port=udp_echo))
+    assert result.received == 5
+    assert len(result.rtts) == 5
+    assert result.packet_loss == 0
+    assert result.latency > 0
+    assert result.jitter is not None
+
+
+def test_udp_probe_without_listener_is_all_lost():
+    result = asyncio.run(probe_engine.probe("127.0.0.1", count=3, interval=0.01, timeout=0.2, method="udp", port=_free_port()))
+    assert result.received == 0
+    assert result.packet_loss == 100
+    assert result.as_tuple() is None
+
+
+def test_tcp_probe_counts_refused_as_reachable():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+    open_port = listener.getsockname()[1]
+    try:
+        results = probe_engine.run_probes({"open": "127.0.0.1"}, count=3, interval=0.01, timeout=1.0, method="tcp", port=open_port)
+    finally:
+        listener.close()
+    refused = asyncio.run(probe_engine.probe("127.0.0.1", count=2, interval=0.01, method="tcp", port=_free_port()))
+    assert results["open"].received == 3
+    assert refused.received == 2
+
+
+@pytest.mark.skipif(not probe_engine.icmp_available(), reason="unprivileged ICMP sockets not allowed")
+def test_icmp_probe_localhost():
+    result = asyncio.run(probe_engine.probe("127.0.0.1", count=3, interval=0.01, timeout=1.0, method="icmp"))
+    assert result.received == 3
+
+
+def test_jitter_is_the_spread_ping_host_stores():
+    result = probe_engine.ProbeResult("h", "udp", 5, [10.0, 14.0, 9.0, 12.0])
+    assert result.jitter == pytest.approx(5.0)
+    assert result.as_tuple() == (pytest.approx(11.25), pytest.approx(5.0), 20.0)
+    assert probe_engine.ProbeResult("h", "udp", 3, []).jitter is None
+
+
+def test_host_timeout_counts_as_lost(udp_echo):
+    results = probe_engine.run_probes({"slow": "127.0.0.1"}, host_timeout=0.05, count=5, interval=0.05, method="udp", port=udp_echo)
+    assert results["slow"].received == 0
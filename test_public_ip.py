@@ -0,0 +1,148 @@
+# test_public_ip.py - The resolver against local stand-ins for the IP echo services
+import time
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import storage
+import public_ip
+
+
+class EchoServer(ThreadingHTTPServer):
+    """Answers every GET with `address` after `delay` seconds, or with `status` if it isn't 200."""
+
+    daemon_threads = True
+
+    def __init__(self, address="203.0.113.7", delay=0.0, status=200):
+        super().__init__(("127.0.0.1", 0), EchoHandler)
+        self.address = address
+        self.delay = delay
+        self.status = status
+        self.hits = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        time.sleep(server.delay)
+        body = server.address.encode() + b"\n"
+        try:
+            self.send_response(server.status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # client gave up
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(**kwargs):
+        server = EchoServer(**kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "monitoring_data.db")
+    storage.set_db_path(path)
+    yield path
+    storage.close()
+
+
+def test_fastest_valid_answer_wins(servers, db):
+    slow = servers(address="198.51.100.1", delay=2.0)
+    failing = servers(status=500)
+    garbage = servers(address="<html>busy</html>")
+    good = servers(address="203.0.113.7")
+    resolver = public_ip.PublicIPResolver([slow.url, failing.url, garbage.url, good.url], timeout=1.0)
+    started = time.monotonic()
+    assert resolver.get() == "203.0.113.7"
+    assert time.monotonic() - started < 1.0
+
+
+def test_unreachable_uplink_returns_within_timeout(servers, db):
+    hung = servers(delay=5.0)
+    failing = servers(status=503)
+    resolver = public_ip.PublicIPResolver([hung.url, failing.url], timeout=0.3)
+    started = time.monotonic()
+    assert resolver.get() is None
+    assert time.monotonic() - started < 1.0
+    assert resolver.stats()['address'] is None
+
+
+def test_cached_within_ttl_and_refreshed_in_background_after(servers, db):
+    server = servers(address="203.0.113.7")
+    resolver = public_ip.PublicIPResolver([server.url], ttl=0.5, timeout=1.0)
+    assert resolver.get() == "203.0.113.7"
+    for _ in range(20):
+        assert resolver.get() == "203.0.113.7"
+    assert server.hits == 1
+
+    time.sleep(0.6)
+    server.address = "203.0.113.8"
+    server.delay = 0.3
+    started = time.monotonic()
+    assert resolver.get() == "203.0.113.7"  # stale answer right away, lookup behind it
+    assert time.monotonic() - started < 0.1
+    resolver.refresh()  # joins the lookup already running
+    assert server.hits == 2
+    assert resolver.get() == "203.0.113.8"
+
+
+def test_changes_are_recorded_and_pushed(servers, db):
+    server = servers(address="203.0.113.7")
+    resolver = public_ip.PublicIPResolver([server.url], timeout=1.0)
+    changes = []
+    resolver.subscribe(lambda old, new: changes.append((old, new)))
+
+    assert resolver.refresh() == "203.0.113.7"
+    assert resolver.refresh() == "203.0.113.7"
+    assert changes == []  # first address ever seen is recorded, not announced
+    server.address = "203.0.113.9"
+    assert resolver.refresh() == "203.0.113.9"
+    assert changes == [("203.0.113.7", "203.0.113.9")]
+
+    # A restarted bot compares against the last recorded address
+    restarted = public_ip.PublicIPResolver([server.url], timeout=1.0)
+    restarted.subscribe(lambda old, new: changes.append((old, new)))
+    restarted.refresh()
+    server.address = "203.0.113.10"
+    public_ip.PublicIPResolver([server.url], timeout=1.0).refresh()
+    assert changes == [("203.0.113.7", "203.0.113.9")]
+
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT old_value, new_value FROM network_events WHERE kind = 'public_ip' ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [(None, "203.0.113.7"), ("203.0.113.7", "203.0.113.9"), ("203.0.113.9", "203.0.113.10")]
+
+
+def test_refresh_returns_when_recording_fails(servers, db, monkeypatch):
+    good = servers(address="203.0.113.7")
+    resolver = public_ip.PublicIPResolver([good.url], timeout=1.0)
+
+    def broken(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(storage, "last_network_event", broken)
+    future = resolver.refresh_async()
+    assert future.result(5) == "203.0.113.7"  # looked up, just not recorded
+    assert resolver.refresh_async() is not future  # the next refresh starts over
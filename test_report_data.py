@@ -0,0 +1,338 @@
+# test_report_data.py
+import os
+import re
+import sqlite3
+import tracemalloc
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault("REPORT_DIR", tempfile.mkdtemp(prefix="reports-"))
+
+import report_generator
+import storage
+
+
+def network_frame(rows):
+    return pd.DataFrame(rows, columns=['timestamp', 'host', 'status']).assign(
+        timestamp=lambda df: pd.to_datetime(df['timestamp']))
+
+
+def test_classify_aligns_hosts_written_seconds_apart():
+    df = network_frame([
+        # Cycle 1: everything up, hosts logged a few seconds apart
+        ("2024-01-01 00:00:01", "Google DNS", "UP"),
+        ("2024-01-01 00:00:04", "Cloudflare DNS", "UP"),
+        ("2024-01-01 00:00:09", "Local Gateway", "UP"),
+        # Cycle 2: DNS down, gateway up
+        ("2024-01-01 00:03:02", "Google DNS", "DOWN"),
+        ("2024-01-01 00:03:05", "Cloudflare DNS", "DOWN"),
+        ("2024-01-01 00:03:07", "Local Gateway", "UP"),
+        # Cycle 3: all down
+        ("2024-01-01 00:06:00", "Google DNS", "DOWN"),
+        ("2024-01-01 00:06:01", "Cloudflare DNS", "DOWN"),
+        ("2024-01-01 00:06:02", "Local Gateway", "DOWN"),
+    ])
+    assert report_generator.classify_downtime(df) == (1, 1, 3)
+
+
+def test_classify_treats_missing_host_as_down():
+    df = network_frame([
+        ("2024-01-01 00:00:00", "Local Gateway", "UP"),
+    ])
+    assert report_generator.classify_downtime(df) == (0, 1, 1)
+    assert report_generator.classify_downtime(df.iloc[0:0]) == (0, 0, 0)
+
+
+def test_split_by_host_groups_once():
+    df = network_frame([
+        ("2024-01-01 00:00:00", "Google DNS", "UP"),
+        ("2024-01-01 00:00:00", "Local Gateway", "UP"),
+        ("2024-01-01 00:03:00", "Google DNS", "DOWN"),
+    ])
+    by_host = report_generator.split_by_host(df)
+    assert set(by_host) == {"Google DNS", "Local Gateway"}
+    assert list(by_host["Google DNS"]['status']) == ["UP", "DOWN"]
+
+
+@pytest.fixture
+def report_env(tmp_path, monkeypatch):
+    storage.set_db_path(str(tmp_path / "monitoring_data.db"))
+    writer = storage.get_writer()
+    while not writer.rollups_ready:  # reports over a day read the rollups
+        time.sleep(0.01)
+    report_dir = tmp_path / "reports"
+    report_dir.mkdir()
+    monkeypatch.setattr(report_generator, "REPORT_DIR", str(report_dir))
+    renders = []
+    monkeypatch.setattr(report_generator, "render_report",
+                        lambda df_net, df_sys, start, end, path, **kw: (renders.append(path), open(path, "wb").write(b"%PDF")))
+    yield renders
+    storage.close()
+
+
+def _add_sample(when):
+    storage.insert('system_resources', (when.strftime("%Y-%m-%d %H:%M:%S"), int(when.timestamp()), 50.0, 10.0, 20.0, 30.0))
+    storage.flush()
+
+
+def test_closed_range_is_served_from_cache(report_env):
+    _add_sample(datetime.now() - timedelta(days=1))
+    first = report_generator.generate_report('yesterday')
+    before = report_generator.get_cache_stats()
+    second = report_generator.generate_report('yesterday')
+    after = report_generator.get_cache_stats()
+
+    assert first == second
+    assert len(report_env) == 1
+    assert after['hits'] == before['hits'] + 1
+
+
+def test_closed_range_picks_up_a_late_batch_and_shares_bounds(report_env):
+    yesterday = (datetime.now() - timedelta(days=1)).replace(hour=12, minute=0, second=0, microsecond=0)
+    _add_sample(yesterday)
+    first = report_generator.generate_report('yesterday')
+    assert report_generator.generate_report('custom', yesterday.strftime('%Y-%m-%d')) == first
+
+    # The writer flushes the day's last batch after the first render
+    _add_sample(yesterday + timedelta(hours=11))
+    assert report_generator.generate_report('yesterday') != first
+    assert len(report_env) == 2
+
+
+def test_open_range_rebuilds_only_on_new_data(report_env, monkeypatch):
+    monkeypatch.setattr(report_generator, "OPEN_RANGE_BUCKET", 3600)  # don't cross a bucket mid-test
+    _add_sample(datetime.now() - timedelta(minutes=10))
+    first = report_generator.generate_report('last_hour')
+    assert report_generator.generate_report('last_hour') == first
+    assert len(report_env) == 1
+
+    _add_sample(datetime.now() - timedelta(minutes=1))
+    assert report_generator.generate_report('last_hour') != first
+    assert len(report_env) == 2
+
+
+def test_open_range_is_not_reused_once_its_period_moves_on(report_env):
+    _add_sample(datetime.now() - timedelta(minutes=10))
+    now = datetime(2026, 10, 18, 12, 0, 5)
+    start, end = report_generator.resolve_range('last_hour', None, now)
+    key = report_generator.report_cache_key(start, end, {}, now)
+    later = now + timedelta(seconds=30)
+    assert report_generator.report_cache_key(*report_generator.resolve_range('last_hour', None, later),
+                                              {}, later) == key
+    # No new rows for hours: the watermark is unchanged, the report is not
+    later = now + timedelta(hours=3)
+    assert report_generator.report_cache_key(*report_generator.resolve_range('last_hour', None, later),
+                                              {}, later) != key
+
+
+def test_purge_evicts_least_recently_used(report_env, tmp_path):
+    report_dir = tmp_path / "reports"
+    for i, name in enumerate(["old", "used", "new"]):
+        path = report_dir / f"network_report_{name}.pdf"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+    os.utime(report_dir / "network_report_old.pdf", (5000, 5000))  # read recently
+
+    assert report_generator.purge_old_reports(max_bytes=150) == 2
+    assert sorted(os.listdir(report_dir)) == ["network_report_old.pdf"]
+
+
+def report_frames(points=120):
+    times = pd.date_range("2024-01-01", periods=points, freq="60s")
+    df_net = pd.concat(pd.DataFrame({'timestamp': times, 'host': host, 'latency': 10.0, 'jitter': 1.0,
+                                     'packet_loss': 0.0, 'status': 'UP'})
+                       for host in report_generator.NETWORK_HOSTS)
+    df_sys = pd.DataFrame({'timestamp': times, 'cpu_usage': 20.0, 'ram_usage': 40.0,
+                           'storage_usage': 30.0, 'temperature': 50.0})
+    return df_net, df_sys, times[0].to_pydatetime(), times[-1].to_pydatetime()
+
+
+def pdf_page_count(path):
+    with open(path, "rb") as f:
+        return len(re.findall(rb"/Type\s*/Page\b", f.read()))
+
+
+PAGE_ORDER = ['summary', 'latency', 'jitter', 'packet_loss', 'availability',
+              'cpu_usage', 'ram_usage', 'storage_usage', 'temperature']
+
+
+def test_serial_render_reuses_page_figures(tmp_path):
+    df_net, df_sys, start, end = report_frames()
+    timings = report_generator.render_report(df_net, df_sys, start, end, str(tmp_path / "a.pdf"), workers=1)
+    figures = {layout: fig for layout, (fig, _) in report_generator._templates.items()}
+    report_generator.render_report(df_net, df_sys, start, end, str(tmp_path / "b.pdf"), workers=1)
+
+    assert [name for name, _ in timings] == PAGE_ORDER
+    assert pdf_page_count(tmp_path / "a.pdf") == len(PAGE_ORDER)
+    assert set(figures) == {'summary', 'wide', 'strip'}
+    assert all(report_generator._templates[layout][0] is fig for layout, fig in figures.items())
+
+
+def test_parallel_render_keeps_page_order(tmp_path):
+    pytest.importorskip("pypdf")
+    df_net, df_sys, start, end = report_frames()
+    path = tmp_path / "report.pdf"
+    timings = report_generator.render_report(df_net, df_sys, start, end, str(path), workers=3)
+
+    assert [name for name, _ in timings] == PAGE_ORDER
+    assert pdf_page_count(path) == len(PAGE_ORDER)
+    assert os.listdir(tmp_path) == ["report.pdf"]
+
+
+def test_parallel_render_reuses_workers_from_a_forkserver(tmp_path):
+    pytest.importorskip("pypdf")
+    df_net, df_sys, start, end = report_frames()
+    report_generator.render_report(df_net, df_sys, start, end, str(tmp_path / "a.pdf"), workers=2)
+    pool = report_generator._render_pools[2]
+    workers = set(pool._processes)
+    report_generator.render_report(df_net, df_sys, start, end, str(tmp_path / "b.pdf"), workers=2)
+    assert report_generator._render_pools[2] is pool and set(pool._processes) == workers
+    assert pool._mp_context.get_start_method() == "forkserver"
+
+
+def system_series(points, cpu):
+    times = pd.date_range("2024-01-01", periods=points, freq="10s")
+    return pd.DataFrame({'timestamp': times, 'cpu_usage': cpu, 'ram_usage': 40.0,
+                         'storage_usage': 30.0, 'temperature': 50.0})
+
+
+def test_lttb_keeps_end_points_and_shape():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500)
+    picked = report_generator.lttb_indices(x, y, 200)
+    assert len(picked) == 200
+    assert picked[0] == 0 and picked[-1] == 9_999
+    assert np.all(np.diff(picked) > 0)
+    assert y[picked].max() > 0.99 and y[picked].min() < -0.99
+
+
+def test_downsample_keeps_threshold_spikes_and_gaps():
+    cpu = np.full(20_000, 20.0)
+    cpu[[3_001, 12_345]] = [85.0, 81.0]  # one-sample spikes over the 80% threshold
+    cpu[15_000:15_100] = np.nan          # sampler outage
+    df = system_series(len(cpu), cpu)
+
+    reduced = report_generator.downsample(df, 'cpu_usage', max_points=100, threshold=80.0)
+    assert len(reduced) <= 110
+    assert set(reduced['cpu_usage'].nlargest(2)) == {85.0, 81.0}
+    assert reduced['cpu_usage'].isna().any()
+
+
+def test_downsampling_shrinks_pdf_and_render_time(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    df_sys = system_series(100_000, rng.uniform(5, 60, 100_000))
+    df_net = report_frames()[0].iloc[0:0]
+    start, end = df_sys['timestamp'].iloc[0].to_pydatetime(), df_sys['timestamp'].iloc[-1].to_pydatetime()
+
+    def render(name):
+        path, best = tmp_path / name, float("inf")
+        for _ in range(2):
+            started = time.perf_counter()
+            report_generator.render_report(df_net, df_sys, start, end, str(path), workers=1)
+            best = min(best, time.perf_counter() - started)
+        return os.path.getsize(path), best
+
+    monkeypatch.setattr(report_generator, "MAX_PLOT_POINTS", 10**9)
+    full_size, full_time = render("full.pdf")
+    monkeypatch.setattr(report_generator, "MAX_PLOT_POINTS", 1000)
+    small_size, small_time = render("small.pdf")
+    print(f"PDF {full_size // 1024} KB -> {small_size // 1024} KB, render {full_time:.2f}s -> {small_time:.2f}s")
+
+    assert small_size * 3 < full_size
+    assert small_time < full_time
+
+
+def monitoring_frames(days, seed=3):
+    """Raw-cadence rows: hosts every 3 minutes a few seconds apart, system every minute."""
+    rng = np.random.default_rng(seed)
+    cycles = pd.date_range("2024-01-01", periods=days * 480, freq="180s")
+    hosts = []
+    for offset, host in enumerate(report_generator.NETWORK_HOSTS):
+        up = rng.random(len(cycles)) > 0.1
+        hosts.append(pd.DataFrame({
+            'timestamp': cycles + pd.Timedelta(seconds=offset * 4), 'host': host,
+            'latency': np.where(up, rng.uniform(5, 50, len(cycles)), np.nan),
+            'jitter': np.where(up, rng.uniform(0, 5, len(cycles)), np.nan),
+            'packet_loss': np.where(up, 0.0, np.nan), 'status': np.where(up, 'UP', 'DOWN')}))
+    df_net = pd.concat(hosts).sort_values('timestamp', kind='stable', ignore_index=True)
+    minutes = pd.date_range("2024-01-01", periods=days * 1440, freq="60s")
+    df_sys = pd.DataFrame({'timestamp': minutes, 'cpu_usage': rng.uniform(5, 60, len(minutes)),
+                           'ram_usage': rng.uniform(30, 50, len(minutes)), 'storage_usage': 30.0,
+                           'temperature': rng.uniform(40, 55, len(minutes))})
+    return df_net, df_sys
+
+
+def test_streamed_summary_matches_whole_range():
+    df_net, df_sys = monitoring_frames(days=2)
+    df_sys.loc[1234, 'cpu_usage'] = 97.0
+    start, end = df_sys['timestamp'].iloc[0], df_sys['timestamp'].iloc[-1]
+
+    data = report_generator.ReportAccumulator(start, end, max_points=200)
+    for i in range(0, len(df_net), 777):  # chunk edges fall inside probe cycles
+        data.add_network(df_net.iloc[i:i + 777])
+    for i in range(0, len(df_sys), 777):
+        data.add_system(df_sys.iloc[i:i + 777])
+    data.finish()
+
+    expected = report_generator.summary_stats(df_net, df_sys)
+    assert data.summary() == pytest.approx(expected)
+    assert len(data.system_frame()) <= 3 * 4 * 200
+    assert data.system_frame()['cpu_usage'].max() == 97.0
+    assert set(data.network_frame()['host']) == set(report_generator.NETWORK_HOSTS)
+
+
+def _write_history(path, days):
+    storage.set_db_path(str(path))
+    storage.init_db()
+    storage.close()
+    df_net, df_sys = monitoring_frames(days)
+    to_text = lambda df: df['timestamp'].dt.strftime("%Y-%m-%d %H:%M:%S")
+    to_ts = lambda df: (df['timestamp'] - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    conn = sqlite3.connect(path)
+    conn.executemany(storage.INSERTS['network_logs'], zip(
+        to_text(df_net), to_ts(df_net), df_net['host'], df_net['latency'], df_net['jitter'],
+        df_net['packet_loss'], df_net['status']))
+    conn.executemany(storage.INSERTS['system_resources'], zip(
+        to_text(df_sys), to_ts(df_sys), df_sys['temperature'], df_sys['cpu_usage'],
+        df_sys['ram_usage'], df_sys['storage_usage']))
+    conn.commit()
+    conn.close()
+    return df_sys['timestamp'].iloc[0].to_pydatetime(), df_sys['timestamp'].iloc[-1].to_pydatetime()
+
+
+def _peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_report_memory_stays_flat_over_months(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_generator, "pick_resolution", lambda start, end: None)  # read raw rows
+    peaks = {}
+    for days in (30, 90):
+        start, end = _write_history(tmp_path / f"{days}.db", days)
+        storage.set_db_path(str(tmp_path / f"{days}.db"))
+        peaks[days] = _peak_memory(report_generator.collect_report_data, start, end)
+    materialized = _peak_memory(report_generator.fetch_network_data, start, end)
+    storage.close()
+    print({days: f"{peak / 2**20:.1f} MB" for days, peak in peaks.items()}, f"materialized {materialized / 2**20:.1f} MB")
+
+    assert peaks[90] < 1.25 * peaks[30]
+    assert peaks[90] < materialized
+
+
+@pytest.mark.parametrize("time_range, resolution", [
+    ('last_hour', None), ('today', None), ('yesterday', None), ('last_24_hours', None),
+    ('last_7_days', 3600), ('last_30_days', 3600),
+])
+def test_ranges_up_to_a_day_read_raw_rows(time_range, resolution):
+    start, end = report_generator.resolve_range(time_range, None, datetime(2026, 10, 18, 23, 59, 0))
+    assert report_generator.pick_resolution(start, end) == resolution
@@ -0,0 +1,75 @@
+# test_report_queue.py
+import threading
+
+from report_queue import ReportQueue
+
+
+class SlowRender:
+    """Stands in for generate_report; each render blocks until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, time_range, custom_date):
+        self.calls.append((time_range, custom_date))
+        if not self.release.wait(5):
+            raise TimeoutError("render never released")
+        if time_range == 'broken':
+            raise RuntimeError("render failed")
+        return f"/reports/{time_range}.pdf"
+
+
+def recorder():
+    states = []
+    return states, lambda job: states.append(job.state)
+
+
+def test_identical_requests_share_one_render():
+    render = SlowRender()
+    reports = ReportQueue(render=render)
+    first_states, first = recorder()
+    second_states, second = recorder()
+
+    job = reports.submit('today', notify=first)
+    assert reports.submit('today', notify=second) is job
+    render.release.set()
+    assert job.wait(5) == "/reports/today.pdf"
+
+    assert render.calls == [('today', None)]
+    assert first_states[-1] == 'done' and second_states[-1] == 'done'
+    assert first_states.count('done') == 1 and second_states.count('done') == 1
+    assert reports.stats()['coalesced'] == 1
+
+
+def test_jobs_queue_behind_a_single_worker():
+    render = SlowRender()
+    reports = ReportQueue(render=render, workers=1)
+    first = reports.submit('today')
+    second = reports.submit('yesterday')
+    third = reports.submit('last_hour')
+    for _ in range(100):
+        if first.state == 'rendering':
+            break
+        threading.Event().wait(0.01)
+    assert reports.depth() == 2
+    assert (second.state, third.state) == ('queued', 'queued')
+
+    render.release.set()
+    third.wait(5)
+    stats = reports.stats()
+    assert (stats['queued'], stats['in_flight'], stats['completed']) == (0, 0, 3)
+    assert stats['max_wait'] >= stats['avg_wait'] > 0
+
+
+def test_failed_job_reports_failure_and_frees_the_key():
+    render = SlowRender()
+    render.release.set()
+    reports = ReportQueue(render=render)
+    states, notify = recorder()
+    job = reports.submit('broken', notify=notify)
+    assert job.wait(5) is None
+    assert isinstance(job.error, RuntimeError)
+    assert states == ['queued', 'rendering', 'failed'] or states == ['rendering', 'failed']
+    assert reports.submit('broken') is not job
+    assert reports.stats()['failed'] >= 1
@@ -0,0 +1,109 @@
+# test_scheduler.py
+import time
+import socket
+import threading
+
+import pytest
+
+import scheduler
+
+
+def run_for(sched, seconds):
+    thread = sched.start()
+    time.sleep(seconds)
+    sched.stop()
+    thread.join(5)
+
+
+def test_fixed_rate_does_not_drift():
+    starts = []
+
+    def work():
+        starts.append(time.monotonic())
+        time.sleep(0.02)  # a cycle's own work must not push the next deadline back
+
+    sched = scheduler.Scheduler().add('work', work, 0.05, align=False)
+    run_for(sched, 0.52)
+
+    assert len(starts) >= 9
+    offsets = [s - starts[0] - i * 0.05 for i, s in enumerate(starts)]
+    assert max(offsets) < 0.02
+    stats = sched.stats()['work']
+    assert stats['missed'] == 0
+    assert stats['avg_runtime'] >= 0.02
+    assert stats['max_lag'] < 0.02
+
+
+def test_overrun_counts_missed_ticks_and_stays_on_grid():
+    starts = []
+
+    def work():
+        starts.append(time.monotonic())
+        if len(starts) == 1:
+            time.sleep(0.17)  # overruns 3 deadlines
+
+    sched = scheduler.Scheduler().add('slow', work, 0.05, align=False)
+    run_for(sched, 0.4)
+
+    assert sched.stats()['slow']['missed'] == 3
+    assert starts[1] - starts[0] == pytest.approx(0.2, abs=0.02)
+
+
+def test_failures_are_counted_and_the_job_keeps_running():
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    sched = scheduler.Scheduler().add('broken', broken, 0.03, align=False)
+    run_for(sched, 0.2)
+    assert sched.stats()['broken']['failures'] == len(calls) >= 3
+
+
+@pytest.fixture
+def notify_socket(tmp_path, monkeypatch):
+    path = str(tmp_path / "notify")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.settimeout(0.05)
+    monkeypatch.setenv("NOTIFY_SOCKET", path)
+    monkeypatch.setenv("WATCHDOG_USEC", "60000")  # pinged every 30 ms
+    messages = []
+    stop = threading.Event()
+
+    def receive():
+        while not stop.is_set():
+            try:
+                messages.append((time.monotonic(), sock.recv(64).decode()))
+            except socket.timeout:
+                pass
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+    yield messages
+    stop.set()
+    thread.join()
+    sock.close()
+
+
+def test_ready_and_watchdog_are_sent(notify_socket):
+    sched = scheduler.Scheduler().add('quick', lambda: None, 0.05, align=False)
+    run_for(sched, 0.2)
+    states = [state for _, state in notify_socket]
+    assert states[0] == "READY=1"
+    assert states.count("WATCHDOG=1") >= 4
+
+
+def test_watchdog_is_withheld_while_a_job_is_stalled(notify_socket):
+    release = threading.Event()
+    sched = scheduler.Scheduler().add('hung', lambda: release.wait(2), 1.0, align=False, stall_after=0.1)
+    thread = sched.start()
+    time.sleep(0.4)
+    stalled_at = time.monotonic() - 0.25
+    release.set()
+    sched.stop()
+    thread.join(5)
+
+    pings = [t for t, state in notify_socket if state == "WATCHDOG=1"]
+    assert pings and max(pings) < stalled_at
@@ -0,0 +1,248 @@
+# test_storage.py
+import sqlite3
+import time
+import datetime
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "monitoring_data.db")
+    storage.set_db_path(path)
+    yield path
+    storage.close()
+
+
+def test_batched_writes_share_one_commit(db):
+    writer = storage.get_writer()
+    writer.max_rows = 50
+    while not writer.rollups_ready:  # the startup backfill flushes whatever is queued when it runs
+        time.sleep(0.01)
+    for i in range(120):
+        storage.insert('network_logs', ("2024-01-01 00:00:00", 1704067200, "Google DNS", 10.0 + i, 1.0, 0.0, "UP"))
+    storage.flush()
+
+    stats = storage.write_stats()
+    assert stats['rows'] == 120
+    assert stats['commits'] == 3
+    assert stats['rows_per_commit'] == 40
+
+    conn = storage.connect_readonly()
+    assert conn.execute("SELECT COUNT(*) FROM network_logs").fetchone()[0] == 120
+    conn.close()
+
+
+def test_wal_mode_and_readonly_connection(db):
+    storage.insert('system_resources', ("2024-01-01 00:00:00", 1704067200, 50.0, 10.0, 20.0, 30.0))
+    storage.flush()
+
+    conn = storage.connect_readonly()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM system_resources")
+    conn.close()
+
+
+def test_time_policy_flushes_in_background(db):
+    writer = storage.get_writer()
+    writer.max_delay = 0.05
+    storage.insert('system_resources', ("2024-01-01 00:00:00", 1704067200, 50.0, 10.0, 20.0, 30.0))
+    writer._wakeup.set()
+
+    conn = storage.connect_readonly()
+    for _ in range(100):
+        if conn.execute("SELECT COUNT(*) FROM system_resources").fetchone()[0]:
+            break
+        time.sleep(0.02)
+    assert conn.execute("SELECT COUNT(*) FROM system_resources").fetchone()[0] == 1
+    conn.close()
+
+
+def test_migration_backfills_epoch_ts(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE network_logs (timestamp TEXT, host TEXT, latency REAL, jitter REAL, packet_loss REAL, status TEXT)")
+    conn.execute("CREATE TABLE system_resources (timestamp TEXT, cpu_temp REAL, cpu_usage REAL, ram_usage REAL, storage_usage REAL)")
+    conn.executemany("INSERT INTO network_logs VALUES (?, 'Google DNS', 10, 1, 0, 'UP')",
+                     [(f"2024-01-01 00:{m:02d}:00",) for m in range(60)])
+    conn.commit()
+    conn.close()
+
+    storage.set_db_path(path)
+    writer = storage.BatchWriter(path)
+    try:
+        assert storage.run_backfill(writer, chunk_rows=7, pause=0) == 60
+        rows = writer.conn.execute("SELECT timestamp, ts FROM network_logs").fetchall()
+    finally:
+        writer.close()
+        storage.close()
+
+    for text, ts in rows:
+        assert ts == int(datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp())
+
+
+def _plan(conn, query, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+def test_reader_queries_use_indexes(db):
+    storage.init_db()
+    conn = storage.connect_readonly()
+    plans = [
+        _plan(conn, storage.LATEST_STATUS_QUERY, ("Google DNS",)),
+        _plan(conn, storage.NETWORK_RANGE_QUERY, (0, 1)),
+        _plan(conn, storage.SYSTEM_RANGE_QUERY, (0, 1)),
+        _plan(conn, storage.ALERT_HISTORY_QUERY, (0, 10, 10, 20)),
+        _plan(conn, storage.ALERT_HISTORY_METRIC_QUERY, ("ram_usage", 0, 10, 10, 20)),
+    ]
+    conn.close()
+
+    for plan in plans:
+        assert plan
+        for detail in plan:
+            assert "USING" in detail and "INDEX" in detail, plan
+            assert "TEMP B-TREE" not in detail, plan
+
+
+def _wait_for_rollups(writer):
+    for _ in range(200):
+        if writer.rollups_ready:
+            return
+        time.sleep(0.01)
+    raise AssertionError("rollups never caught up")
+
+
+def test_rollups_fold_incrementally(db):
+    writer = storage.get_writer()
+    _wait_for_rollups(writer)
+    base = 1704067200  # 2024-01-01 00:00:00 UTC
+    storage.insert('network_logs', ("t", base + 5, "Google DNS", 10.0, 1.0, 0.0, "UP"))
+    storage.insert('network_logs', ("t", base + 20, "Google DNS", 30.0, 3.0, 0.0, "UP"))
+    storage.flush()
+    storage.insert('network_logs', ("t", base + 50, "Google DNS", None, None, None, "DOWN"))
+    storage.insert('network_logs', ("t", base + 3700, "Google DNS", 5.0, 0.5, 10.0, "UP"))
+    storage.flush()
+
+    conn = storage.connect_readonly()
+    minute = conn.execute(
+        "SELECT samples, up_count, down_count, latency_n, latency_sum, latency_min, latency_max FROM network_rollup "
+        "WHERE resolution = 60 AND bucket = ? AND host = 'Google DNS'", (base,)
+    ).fetchone()
+    hour = conn.execute(
+        "SELECT bucket, samples, up_count FROM network_rollup WHERE resolution = 3600 ORDER BY bucket"
+    ).fetchall()
+    day = conn.execute("SELECT samples, latency_min, latency_max FROM network_rollup WHERE resolution = 86400").fetchall()
+    conn.close()
+
+    assert minute == (3, 2, 1, 2, 40.0, 10.0, 30.0)
+    assert hour == [(base, 3, 2), (base + 3600, 1, 1)]
+    assert day == [(4, 5.0, 30.0)]
+
+
+def test_history_is_folded_before_live_rollups(tmp_path):
+    path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE system_resources (timestamp TEXT, cpu_temp REAL, cpu_usage REAL, ram_usage REAL, storage_usage REAL)")
+    conn.executemany("INSERT INTO system_resources VALUES (?, 50, ?, 20, 30)",
+                     [(f"2024-01-01 00:{m:02d}:00", float(m)) for m in range(60)])
+    conn.commit()
+    conn.close()
+
+    writer = storage.BatchWriter(path)
+    try:
+        storage.run_backfill(writer, chunk_rows=16, pause=0)
+        assert writer.rollups_ready
+        samples, avg_cpu = writer.conn.execute(
+            "SELECT samples, cpu_usage_sum / cpu_usage_n FROM system_rollup WHERE resolution = 3600"
+        ).fetchone()
+    finally:
+        writer.close()
+
+    assert samples == 60
+    assert avg_cpu == sum(range(60)) / 60
+
+
+def test_rollup_queries_use_primary_key(db):
+    storage.init_db()
+    conn = storage.connect_readonly()
+    for query in (storage.NETWORK_ROLLUP_QUERY, storage.SYSTEM_ROLLUP_QUERY):
+        for detail in _plan(conn, query, (3600, 0, 1)):
+            assert "USING PRIMARY KEY" in detail and "TEMP B-TREE" not in detail, detail
+    conn.close()
+
+
+def test_retention_prunes_in_batches(db, monkeypatch):
+    import retention
+
+    writer = storage.get_writer()
+    _wait_for_rollups(writer)
+    now = 1704067200 + 200 * 86400
+    old = [("t", now - 100 * 86400 + i, 50.0, 10.0, 20.0, 30.0) for i in range(1000)]
+    new = [("t", now - 86400 + i, 50.0, 10.0, 20.0, 30.0) for i in range(10)]
+    writer.add_many('system_resources', old + new)
+    storage.flush()
+
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    result = retention.run_retention(now=now)
+
+    assert result['deleted']['system_resources'] == 1000
+    conn = storage.connect_readonly()
+    assert conn.execute("SELECT COUNT(*) FROM system_resources").fetchone()[0] == 10
+    # 100-day-old minute rollups are past their 30 days, hour and day rollups are kept
+    assert conn.execute("SELECT COUNT(*) FROM system_rollup WHERE resolution = 60 AND bucket < ?", (now - 30 * 86400,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM system_rollup WHERE resolution = 86400").fetchone()[0] == 2
+    conn.close()
+    assert result['free_bytes'] == 0
+
+
+def test_retention_skipped_during_catch_up_is_retried(db, monkeypatch):
+    import retention
+
+    writer = storage.get_writer()
+    _wait_for_rollups(writer)
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    monkeypatch.setattr(retention, "_last_run", None)
+    writer.rollups_ready = False
+    assert retention.run_due(86400, now=0.0) is None  # skipped, the clock is not started
+
+    writer.rollups_ready = True
+    assert retention.run_due(86400, now=300.0) is not None  # the next check runs it
+    assert retention.run_due(86400, now=600.0) is None  # then not again until a day has passed
+    assert retention.run_due(86400, now=300.0 + 86400) is not None
+
+
+def test_retention_prunes_resolved_alerts_and_old_events(db, monkeypatch):
+    import retention
+
+    writer = storage.get_writer()
+    _wait_for_rollups(writer)
+    now = 1704067200 + 800 * 86400
+    old = now - 400 * 86400
+
+    def seed(conn):
+        conn.executemany(
+            "INSERT INTO alerts (ts, metric, subject, severity, value, threshold, resolved_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(old, 'cpu_temp', None, 'warning', 61.0, 60.0, old + 60),
+             (old, 'disk_usage', '/', 'warning', 91.0, 90.0, None),
+             (now - 60, 'cpu_temp', None, 'warning', 62.0, 60.0, now)]
+        )
+        conn.executemany(
+            "INSERT INTO network_events (ts, kind, subject, old_value, new_value) VALUES (?, ?, ?, ?, ?)",
+            [(old, 'public_ip', None, None, '203.0.113.7'),
+             (old + 1, 'link', 'eth0', 'up', 'down')]
+        )
+    writer.execute(seed)
+
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0)
+    result = retention.run_retention(now=now)
+
+    assert result['deleted']['alerts'] == 1
+    assert result['deleted']['network_events'] == 1
+    conn = storage.connect_readonly()
+    # The open alert and the recent one stay; the only public IP event is kept however old
+    assert conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0] == 2
+    assert conn.execute("SELECT kind FROM network_events").fetchall() == [('public_ip',)]
+    conn.close()
@@ -0,0 +1,140 @@
+# test_system_monitor.py
+import os
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def system_monitor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # keep the module's log file out of the repo
+    import system_monitor
+    return system_monitor
+
+
+def write(root, path, text):
+    full = root / path
+    full.parent.mkdir(parents=True, exist_ok=True)
+    full.write_text(text)
+
+
+@pytest.fixture
+def procfs(tmp_path):
+    """Fixture procfs/sysfs tree shaped like a Raspberry Pi's."""
+    root = tmp_path / "root"
+    write(root, "sys/class/thermal/thermal_zone0/type", "cpu-thermal\n")
+    write(root, "sys/class/thermal/thermal_zone0/temp", "48312\n")
+    write(root, "proc/stat", "cpu  100 0 100 800 0 0 0 0 0 0\ncpu0 100 0 100 800 0 0 0 0 0 0\n")
+    write(root, "proc/meminfo", "MemTotal:        1000000 kB\nMemFree:          200000 kB\nMemAvailable:     600000 kB\n")
+    write(root, "proc/diskstats",
+          " 179       0 mmcblk0 100 0 2000 0 50 0 4000 0 0 0 0\n"
+          " 179       1 mmcblk0p1 10 0 200 0 5 0 400 0 0 0 0\n"
+          "   7       0 loop0 10 0 999 0 0 0 0 0 0 0 0\n")
+    (root / "sys/block/mmcblk0").mkdir(parents=True)
+    write(root, "proc/net/dev",
+          "Inter-|   Receive                                                |  Transmit\n"
+          " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+          "    lo:    5000      10    0    0    0     0          0         0     5000      10    0    0    0     0       0          0\n"
+          "  eth0:   10000      20    0    0    0     0          0         0     2000       5    0    0    0     0       0          0\n")
+    return root
+
+
+def test_thermal_and_memory_from_fixture(system_monitor, procfs):
+    assert system_monitor.ThermalCollector(str(procfs)).sample()['cpu_temp'] == pytest.approx(48.312)
+    mem = system_monitor.MemoryCollector(str(procfs)).sample()
+    assert mem['ram_total'] == 1000000 * 1024
+    assert mem['ram_usage'] == pytest.approx(40.0)
+
+
+def test_cpu_usage_from_stat_deltas(system_monitor, procfs):
+    cpu = system_monitor.CpuCollector(str(procfs))
+    assert cpu.sample(now=0)['cpu_usage'] is None
+    # 100 more busy jiffies and 300 more idle ones -> 25% busy
+    write(procfs, "proc/stat", "cpu  200 0 100 1100 0 0 0 0 0 0\n")
+    assert cpu.sample(now=1)['cpu_usage'] == pytest.approx(25.0)
+
+
+def test_disk_and_network_rates(system_monitor, procfs):
+    disk = system_monitor.DiskIOCollector(str(procfs))
+    net = system_monitor.NetDevCollector(str(procfs))
+    assert disk.sample(now=10)['disk_read_bps'] is None
+    net.sample(now=10)
+
+    write(procfs, "proc/diskstats",
+          " 179       0 mmcblk0 100 0 2400 0 50 0 4800 0 0 0 0\n"
+          " 179       1 mmcblk0p1 10 0 600 0 5 0 800 0 0 0 0\n"
+          "   7       0 loop0 10 0 5000 0 0 0 0 0 0 0 0\n")
+    write(procfs, "proc/net/dev",
+          "header\nheader\n"
+          "    lo:   99999      10    0    0    0     0          0         0    99999      10    0    0    0     0       0          0\n"
+          "  eth0:   14000      20    0    0    0     0          0         0     3000       5    0    0    0     0       0          0\n")
+    rates = disk.sample(now=12)
+    # Only the whole disk counts: 400 sectors read, 800 written over 2 s
+    assert rates['disk_read_bps'] == 400 * 512 / 2
+    assert rates['disk_write_bps'] == 800 * 512 / 2
+    assert net.sample(now=12) == {'net_rx_bps': 2000, 'net_tx_bps': 500}
+
+
+def test_sampler_runs_collectors_on_their_own_interval(system_monitor, procfs):
+    thermal = system_monitor.ThermalCollector(str(procfs), interval=10)
+    cpu = system_monitor.CpuCollector(str(procfs), interval=1)
+    sampler = system_monitor.SystemSampler(collectors=[thermal, cpu])
+    for now in range(5):
+        sampler.sample(now=float(now))
+    assert thermal.calls == 1
+    assert cpu.calls == 5
+    assert sampler.latest()['cpu_temp'] == pytest.approx(48.312)
+
+
+def test_collectors_never_fork(system_monitor, procfs, monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("collector started a subprocess")
+    monkeypatch.setattr(subprocess, "Popen", forbidden)
+    monkeypatch.setattr(os, "popen", forbidden)
+    sampler = system_monitor.SystemSampler(collectors=system_monitor.default_collectors(str(procfs)))
+    sampler.sample(now=0.0)
+    sampler.sample(now=20.0)
+    assert all(c.calls == 2 for c in sampler.collectors)
+
+
+def test_snapshot_averages_and_age(system_monitor, procfs):
+    import time
+    cpu = system_monitor.CpuCollector(str(procfs))
+    sampler = system_monitor.SystemSampler(collectors=[cpu])
+    now = time.monotonic()
+    busy, idle = 100, 800
+    for i, seconds in enumerate((-200, -100, -30, -20, -10)):
+        # 10, 20, ... busy jiffies out of 100 per step
+        busy, idle = busy + 10 * i, idle + 100 - 10 * i
+        write(procfs, "proc/stat", f"cpu  {busy} 0 100 {idle} 0 0 0 0 0 0\n")
+        sampler.sample(now=now + seconds)
+    snap = sampler.snapshot()
+    assert snap['cpu_usage'] == pytest.approx(40.0)
+    assert snap['averages']['cpu_usage']['1m'] == pytest.approx(30.0)  # 20, 30, 40
+    assert snap['averages']['cpu_usage']['5m'] == pytest.approx(25.0)  # 10 ... 40
+    assert snap['age']['cpu_usage'] == pytest.approx(10.0, abs=1.0)
+
+
+def test_status_before_the_averages_fill(system_monitor, procfs, monkeypatch):
+    sampler = system_monitor.SystemSampler(collectors=system_monitor.default_collectors(str(procfs)))
+    sampler.sample(now=0.0)  # one sample, long ago: no CPU delta and nothing inside the windows
+    monkeypatch.setattr(system_monitor, "get_system_snapshot", sampler.snapshot)
+    status = system_monitor.get_system_status()
+    assert " CPU Usage: n/a (1m avg n/a, 5m avg n/a)\n" in status
+    assert " RAM: " in status and "(40.0%)" in status
+
+
+def test_log_system_metrics_before_the_averages_fill(system_monitor, procfs, monkeypatch):
+    sampler = system_monitor.SystemSampler(collectors=system_monitor.default_collectors(str(procfs)))
+    sampler.sample(now=0.0)  # a single sample: no CPU average yet
+    rows = []
+    monkeypatch.setattr(system_monitor, "get_system_snapshot", sampler.snapshot)
+    monkeypatch.setattr(system_monitor, "save_to_db", lambda *row: rows.append(row))
+    system_monitor.log_system_metrics()
+    assert len(rows) == 1
+    cpu_temp, cpu_usage, ram_percent, _ = rows[0]
+    assert cpu_temp == pytest.approx(48.312) and cpu_usage is None and ram_percent == pytest.approx(40.0)
+
+    monkeypatch.setattr(system_monitor, "get_system_snapshot", lambda: None)
+    system_monitor.log_system_metrics()
+    assert len(rows) == 1
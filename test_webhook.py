@@ -0,0 +1,142 @@
+# test_webhook.py - Webhook mode end to end: recorded updates in, Bot API calls out
+import json
+import time
+import threading
+import urllib.request
+import urllib.error
+
+import pytest
+
+ALLOWED = 123456789
+STRANGER = 555
+
+#   Updates as Telegram posts them
+START_FROM_ALLOWED = {
+    "update_id": 700001,
+    "message": {
+        "message_id": 11, "date": 1718000000, "text": "/start",
+        "from": {"id": ALLOWED, "is_bot": False, "first_name": "Pi"},
+        "chat": {"id": ALLOWED, "first_name": "Pi", "type": "private"},
+        "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+    },
+}
+START_FROM_STRANGER = {
+    "update_id": 700002,
+    "message": {
+        "message_id": 12, "date": 1718000001, "text": "/start",
+        "from": {"id": STRANGER, "is_bot": False, "first_name": "Eve"},
+        "chat": {"id": STRANGER, "first_name": "Eve", "type": "private"},
+        "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+    },
+}
+
+
+@pytest.fixture
+def bot_module(tmp_path, monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "123456:TEST")
+    monkeypatch.chdir(tmp_path)
+    import bot
+    return bot
+
+
+@pytest.fixture
+def endpoint(bot_module, api):
+    from webhook import WebhookServer
+    server = WebhookServer(bot_module.bot, host="127.0.0.1", port=0, path="/telegram", secret="s3cret", workers=2)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, update, secret="s3cret"):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}/telegram",
+                                     data=json.dumps(update).encode(), headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_handled(server, count):
+    for _ in range(200):
+        if server.stats()['handled'] >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"only {server.stats()['handled']} of {count} updates handled")
+
+
+def test_recorded_updates_reach_handlers_with_access_control(endpoint, api):
+    started = time.monotonic()
+    assert post(endpoint, START_FROM_ALLOWED) == 200
+    assert post(endpoint, START_FROM_STRANGER) == 200
+    wait_handled(endpoint, 2)
+    elapsed = time.monotonic() - started
+
+    replies = {c['chat_id']: c['text'] for c in api.calls if c['method'] == 'sendMessage'}
+    assert "Welcome" in replies[ALLOWED]
+    assert replies[STRANGER] == "Access Denied."
+
+    stats = endpoint.stats()
+    latencies = dict(endpoint.latencies)
+    print(f"per-update latency: {', '.join(f'{k}: {v * 1000:.1f} ms' for k, v in latencies.items())}")
+    assert set(latencies) == {700001, 700002}
+    assert 0 < stats['max_latency'] <= elapsed
+
+
+def test_wrong_secret_and_path_are_refused(endpoint, api):
+    assert post(endpoint, START_FROM_ALLOWED, secret="guess") == 403
+    assert post(endpoint, START_FROM_ALLOWED, secret=None) == 403
+    request = urllib.request.Request(f"http://127.0.0.1:{endpoint.server_port}/other", data=b"{}")
+    with pytest.raises(urllib.error.HTTPError) as refused:
+        urllib.request.urlopen(request, timeout=5)
+    assert refused.value.code == 404
+    assert endpoint.stats()['received'] == 0
+    assert api.calls == []
+
+
+def test_full_backlog_asks_telegram_to_retry(bot_module, api):
+    from webhook import WebhookServer
+    server = WebhookServer(bot_module.bot, host="127.0.0.1", port=0, path="/telegram", secret=None,
+                           workers=1, max_pending=1)
+    api.delay = 0.3  # keeps the single worker busy with the first update
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        assert post(server, START_FROM_ALLOWED, secret=server.secret) == 200
+        assert post(server, dict(START_FROM_ALLOWED, update_id=700003), secret=server.secret) == 503
+        wait_handled(server, 1)
+        assert server.stats()['rejected'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_unconfigured_secret_is_generated_and_registered(bot_module, api):
+    from webhook import WebhookServer, run_webhook
+    server = WebhookServer(bot_module.bot, host="127.0.0.1", port=0, path="/telegram", secret=None)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        assert len(server.secret) >= 32
+        assert post(server, START_FROM_ALLOWED, secret=None) == 403
+        assert post(server, START_FROM_ALLOWED, secret="") == 403
+        assert post(server, START_FROM_ALLOWED, secret="guess") == 403
+        assert server.stats()['received'] == 0
+        assert api.calls == []
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_run_webhook_registers_the_secret_it_checks(bot_module, monkeypatch):
+    import webhook
+    registered = {}
+    served = []
+    monkeypatch.setattr(bot_module.bot, "remove_webhook", lambda: True)
+    monkeypatch.setattr(bot_module.bot, "set_webhook", lambda **kwargs: registered.update(kwargs))
+    monkeypatch.setattr(webhook.WebhookServer, "serve_forever", lambda self: served.append(self.secret))
+    webhook.run_webhook(bot_module.bot, url="https://example.org/telegram", host="127.0.0.1", port=0, secret=None)
+    assert served and registered['secret_token'] == served[0]
@@ -0,0 +1,143 @@
+# webhook.py - Receives Telegram updates over HTTP(S) instead of long polling
+import os
+import ssl
+import hmac
+import json
+import time
+import logging
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telebot.types import Update
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public URL Telegram posts to, e.g. https://example.org:8443/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # A random one is generated per start when unset
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT")  # Serve HTTPS directly when both are set; otherwise plain HTTP behind a proxy
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "100"))
+LATENCY_HISTORY = 200
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        if self.path != server.webhook_path:
+            return self._reply(404)
+        # Without the secret anyone reaching the port could forge updates from an allowed chat
+        token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), server.secret.encode()):
+            return self._reply(403)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self._reply(400)
+        # Answer right away; a non-2xx reply makes Telegram deliver the update again later
+        self._reply(200 if server.dispatch(body) else 503)
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    HTTP(S) endpoint for Telegram updates. Each update is handed to the bot's handlers on
+    a pool of `workers` threads; beyond max_pending queued updates the endpoint answers
+    503 so Telegram retries instead of the Pi queueing without bound. Every update must
+    carry the secret token; with none configured a random one is generated, and
+    run_webhook() registers it with Telegram.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, bot, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                 workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_MAX_PENDING, certfile=WEBHOOK_CERT, keyfile=WEBHOOK_KEY):
+        super().__init__((host, port), WebhookHandler)
+        self.bot = bot
+        # Handlers run inline on our pool rather than on telebot's own thread pool,
+        # so the pool bounds the work and latency covers the handler itself
+        bot.threaded = False
+        self.webhook_path = path
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="webhook")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.received = 0
+        self.handled = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_HISTORY)  # (update_id, seconds from receipt to handled)
+        if certfile and keyfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def dispatch(self, body):
+        """Queues one update. Returns False if the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logging.warning("Webhook backlog full, asking Telegram to retry")
+            return False
+        with self._lock:
+            self.received += 1
+        self.pool.submit(self._handle, body, time.monotonic())
+        return True
+
+    def _handle(self, body, received_at):
+        try:
+            self.bot.process_new_updates([Update.de_json(body)])
+        except Exception:
+            logging.exception(f"Webhook update {body.get('update_id')} failed")
+        finally:
+            self._slots.release()
+            latency = time.monotonic() - received_at
+            with self._lock:
+                self.handled += 1
+                self.latencies.append((body.get('update_id'), latency))
+            logging.debug(f"Update {body.get('update_id')} handled in {latency * 1000:.1f} ms")
+
+    def stats(self):
+        with self._lock:
+            latencies = [seconds for _, seconds in self.latencies]
+            return {
+                'received': self.received,
+                'handled': self.handled,
+                'rejected': self.rejected,
+                'pending': self.received - self.handled,
+                'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'max_latency': max(latencies, default=0.0),
+            }
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def run_webhook(bot, url=WEBHOOK_URL, **kwargs):
+    """Registers the webhook with Telegram and serves updates until interrupted."""
+    if not url:
+        raise ValueError("WEBHOOK_URL must be set for webhook mode")
+    server = WebhookServer(bot, **kwargs)
+    certificate = open(WEBHOOK_CERT, 'rb') if WEBHOOK_CERT else None  # self-signed certs must be uploaded
+    try:
+        bot.remove_webhook()
+        bot.set_webhook(url=url, certificate=certificate, secret_token=server.secret)
+    finally:
+        if certificate:
+            certificate.close()
+    logging.info(f"Webhook listening on {server.server_address[0]}:{server.server_address[1]}{server.webhook_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()